@@ -1,28 +1,60 @@
-from fastapi import FastAPI, File, UploadFile, HTTPException, status
-from fastapi.responses import JSONResponse
+from fastapi import FastAPI, File, UploadFile, HTTPException, Query, Request, Response, WebSocket, status
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
+import orjson
 import uvicorn
-from PIL import Image
+import asyncio
 import io
+import hashlib
 import logging
 import os
+import time
 from contextlib import asynccontextmanager
+from functools import partial
+from typing import List, NamedTuple, Optional, Tuple
 
-from models import PredictionResponse, ErrorResponse, HealthResponse, APIInfo, DiseaseClass
+from models import (
+    PredictionResponse, BatchPredictionResponse, PathPredictionRequest, PathPredictionResponse,
+    PathPredictionResult, ErrorResponse, HealthResponse, APIInfo, DiseaseClass,
+    JobRequest, JobResponse, JobResultsResponse
+)
 from ml_service import ml_service
-from monitoring import log_request, log_prediction, log_health_check, structured_logger, metrics
+from monitoring import (
+    structured_logger, metrics, get_process_memory, latency_histograms, request_stage,
+    get_latency_quantiles
+)
 from production_config import get_config
+from image_processing import ImageRejectedError, InvalidImageError, inspect_image
+from inference_pipeline import PipelineClosedError, inference_pipeline
+from path_input import PathNotAllowedError, resolve_allowed_path
+from tensor_io import (
+    ARROW_CONTENT_TYPES, NPY_CONTENT_TYPES, ArrowUnavailableError, InvalidTensorError, parse_arrow, parse_npy
+)
+from middleware import IdempotencyMiddleware, RateLimitMiddleware, RequestTimingMiddleware, UploadSizeLimitMiddleware
+from idempotency import idempotency_store
+from jobs import job_runner, job_store
+from rate_limit import api_key_tiers, rate_limiter
+from responses import FastJSONResponse
+from frame_stream import frame_streams, process_frames
+from health import health_monitor, start_health_listener, stop_health_listener, watch_shutdown_signals
+from log_pipeline import get_log_stats, parse_event_rates, setup_logging
+from prometheus import CONTENT_TYPE as PROMETHEUS_CONTENT_TYPE, render_metrics as render_prometheus
 
 # Importar MLFlow
-from mlflow_utils import setup_mlflow_for_api, cleanup_mlflow_for_api, mlflow_track_prediction, mlflow_track_health_check
+from mlflow_config import mlflow_manager
+from mlflow_utils import performance_monitor, setup_mlflow_for_api, cleanup_mlflow_for_api
 
 # Carregar configurações
 config = get_config()
 
-# Configurar logging
-logging.basicConfig(
-    level=getattr(logging, config.LOG_LEVEL.upper()),
-    format=config.LOG_FORMAT
+# Configurar logging (escrita em thread de fundo, com amostragem por evento)
+setup_logging(
+    config.LOG_LEVEL,
+    config.LOG_FORMAT,
+    queued=config.LOG_QUEUED,
+    queue_size=config.LOG_QUEUE_SIZE,
+    sample_rates=parse_event_rates(config.LOG_SAMPLE_RATES),
+    rate_limits=parse_event_rates(config.LOG_RATE_LIMITS)
 )
 logger = logging.getLogger(__name__)
 
@@ -33,6 +65,13 @@ async def lifespan(app: FastAPI):
     structured_logger.log_startup()
     logger.info("🚀 Starting Eye Disease Classifier API...")
 
+    # Health check em snapshot, disponível já durante o carregamento do modelo
+    health_monitor.start()
+    watch_shutdown_signals(health_monitor)
+    app.state.health_heartbeat = asyncio.create_task(health_monitor.heartbeat())
+    if config.HEALTH_PORT:
+        app.state.health_server = start_health_listener(health_monitor, config.HOST, config.HEALTH_PORT)
+
     # Configurar MLFlow
     mlflow_setup_success = setup_mlflow_for_api()
     if mlflow_setup_success:
@@ -45,13 +84,29 @@ async def lifespan(app: FastAPI):
     start_time = time.time()
 
     try:
-        if not ml_service.load_model():
+        # No modo pre-fork o modelo já foi carregado pelo processo mestre
+        if ml_service.is_model_loaded():
+            logger.info("♻️ Modelo pré-carregado pelo processo mestre")
+        elif not ml_service.load_model():
             structured_logger.log_model_load(False, error="Failed to load model")
             logger.error("❌ Failed to load model on startup")
             raise RuntimeError("Failed to load ML model")
 
         load_time = time.time() - start_time
         structured_logger.log_model_load(True, load_time)
+        health_monitor.refresh()
+
+        # Iniciar pipeline de decode/inferência em batch
+        await inference_pipeline.start()
+
+        # Servidor gRPC no mesmo event loop, compartilhando o pipeline
+        if config.GRPC_PORT:
+            from grpc_service import start_grpc_server
+            app.state.grpc_server = await start_grpc_server(config.GRPC_PORT)
+
+        # Jobs em lote retomam daqui os itens pendentes
+        if job_runner is not None:
+            await job_runner.start()
         logger.info("✅ API started successfully")
 
     except Exception as e:
@@ -64,10 +119,34 @@ async def lifespan(app: FastAPI):
     # Shutdown
     logger.info("🛑 Shutting down API...")
 
-    # Cleanup MLFlow
+    # O prazo conta desde o sinal: o uvicorn já gastou parte dele com as conexões
+    health_monitor.set_draining()
+
+    # Jobs param primeiro: os itens reservados voltam para a fila persistente
+    if job_runner is not None:
+        await job_runner.stop()
+
+    # Drenar o pipeline: novos itens são recusados (503/UNAVAILABLE) e os já
+    # admitidos, inclusive de gRPC e WebSocket, terminam dentro do prazo
+    drain_stats = await inference_pipeline.drain(health_monitor.shutdown_remaining(config.GRACEFUL_SHUTDOWN_TIMEOUT))
+
+    # Encerrar servidor gRPC antes do pipeline que ele usa
+    if getattr(app.state, "grpc_server", None) is not None:
+        from grpc_service import stop_grpc_server
+        await stop_grpc_server(app.state.grpc_server)
+
+    # Encerrar pipeline de inferência (itens abandonados falham aqui)
+    await inference_pipeline.stop()
+
+    # Cleanup MLFlow só depois da drenagem, com a telemetria das últimas predições
     cleanup_mlflow_for_api()
 
-    structured_logger.log_shutdown()
+    # Health check por último: os probes respondem até o fim do shutdown
+    app.state.health_heartbeat.cancel()
+    stop_health_listener(getattr(app.state, "health_server", None))
+    health_monitor.stop()
+
+    structured_logger.log_shutdown(drain_stats)
     logger.info("✅ API shutdown completed")
 
 # Criar aplicação FastAPI
@@ -82,11 +161,79 @@ app.add_middleware(
     **config.get_cors_config()
 )
 
+# Limitar o tamanho do corpo antes do parsing multipart
+app.add_middleware(
+    UploadSizeLimitMiddleware,
+    max_body_size=config.MAX_UPLOAD_SIZE + config.MULTIPART_OVERHEAD,
+    path_limits={"/predict/tensor": config.MAX_TENSOR_UPLOAD_SIZE, "/jobs/images": config.JOB_MAX_UPLOAD_SIZE}
+)
+
+# Reenvios com Idempotency-Key respondidos antes da leitura do corpo
+if config.IDEMPOTENCY_ENABLED:
+    app.add_middleware(
+        IdempotencyMiddleware,
+        store=idempotency_store,
+        paths=("/predict", "/predict/tensor", "/predict/paths", "/jobs", "/jobs/images"),
+        api_key_header=config.API_KEY_HEADER
+    )
+
+# Rate limiting antes de qualquer leitura do corpo (429 entra nas métricas de timing)
+if config.RATE_LIMIT_ENABLED:
+    app.add_middleware(
+        RateLimitMiddleware,
+        limiter=rate_limiter,
+        paths=("/predict", "/predict/tensor", "/predict/paths", "/jobs", "/jobs/images"),
+        api_keys=api_key_tiers,
+        api_key_header=config.API_KEY_HEADER,
+        trust_proxy=config.RATE_LIMIT_TRUST_PROXY
+    )
+
+# Timing por estágio, Server-Timing e histogramas (middleware mais externo)
+app.add_middleware(
+    RequestTimingMiddleware,
+    server_timing=config.SERVER_TIMING_HEADER
+)
+
 # Formatos de imagem suportados
 SUPPORTED_FORMATS = config.SUPPORTED_FORMATS
 
-def validate_image(file: UploadFile) -> Image.Image:
-    """Valida e processa o arquivo de imagem"""
+class UploadedImage(NamedTuple):
+    """Upload recebido: buffer com os bytes e hash SHA-256 para cache"""
+    buffer: io.BytesIO
+    size: int
+    sha256: str
+
+def read_upload(file: UploadFile) -> UploadedImage:
+    """
+    Lê o upload em chunks, aplicando MAX_UPLOAD_SIZE e calculando o hash
+
+    O hash é atualizado a cada chunk e os bytes vão direto para o buffer que
+    será entregue ao decoder, sem cópias intermediárias.
+    """
+    buffer = io.BytesIO()
+    digest = hashlib.sha256()
+    size = 0
+
+    while True:
+        chunk = file.file.read(config.UPLOAD_CHUNK_SIZE)
+        if not chunk:
+            break
+
+        size += len(chunk)
+        if size > config.MAX_UPLOAD_SIZE:
+            raise HTTPException(
+                status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+                detail=f"File too large. Maximum size: {config.MAX_UPLOAD_SIZE // (1024 * 1024)}MB"
+            )
+
+        digest.update(chunk)
+        buffer.write(chunk)
+
+    buffer.seek(0)
+    return UploadedImage(buffer=buffer, size=size, sha256=digest.hexdigest())
+
+def validate_image(file: UploadFile) -> UploadedImage:
+    """Valida e lê o arquivo de imagem (a decodificação ocorre no pipeline)"""
     try:
         # Verificar tipo de arquivo
         if not file.content_type or not file.content_type.startswith("image/"):
@@ -103,22 +250,41 @@ def validate_image(file: UploadFile) -> Image.Image:
                 detail=f"Unsupported image format. Supported formats: {', '.join(SUPPORTED_FORMATS)}"
             )
         
-        # Ler e validar imagem
-        image_data = file.file.read()
-        if len(image_data) == 0:
+        # Rejeitar pelo tamanho declarado antes de ler qualquer byte
+        if file.size is not None and file.size > config.MAX_UPLOAD_SIZE:
+            raise HTTPException(
+                status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+                detail=f"File too large. Maximum size: {config.MAX_UPLOAD_SIZE // (1024 * 1024)}MB"
+            )
+        
+        # Copiar o arquivo já recebido (upload_read, no middleware) para o buffer do decoder
+        with request_stage("upload_copy"):
+            upload = read_upload(file)
+        if upload.size == 0:
             raise HTTPException(
                 status_code=status.HTTP_400_BAD_REQUEST,
                 detail="Empty file"
             )
+        logger.debug(f"Upload recebido: {upload.size} bytes, sha256={upload.sha256}")
         
-        # Converter para PIL Image
-        image = Image.open(io.BytesIO(image_data))
-        
-        # Converter para RGB se necessário
-        if image.mode != "RGB":
-            image = image.convert("RGB")
+        # Inspecionar só o cabeçalho antes de decodificar qualquer pixel
+        try:
+            with request_stage("decode"):
+                inspect_image(upload.buffer, config.MAX_IMAGE_PIXELS, config.OVERSIZE_IMAGE_POLICY)
+        except ImageRejectedError as e:
+            metrics.increment_image_rejects(e.reason)
+            logger.warning(f"Imagem recusada ({e.reason}): {str(e)}")
+            if e.reason in ("pixel_budget", "decompression_bomb"):
+                raise HTTPException(
+                    status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+                    detail=str(e)
+                )
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="Invalid image file" if e.reason == "unidentified" else str(e)
+            )
         
-        return image
+        return upload
         
     except HTTPException:
         raise
@@ -129,8 +295,15 @@ def validate_image(file: UploadFile) -> Image.Image:
             detail="Invalid image file"
         )
 
+def build_prediction_response(predicted_class: str, confidence: float, all_predictions: dict) -> PredictionResponse:
+    """Monta a resposta de uma predição com valores arredondados (sem revalidação)"""
+    return PredictionResponse.model_construct(
+        predicted_class=DiseaseClass(predicted_class),
+        confidence=round(confidence, 2),
+        all_predictions={k: round(v, 2) for k, v in all_predictions.items()}
+    )
+
 @app.get("/", response_model=APIInfo)
-@log_request
 async def root():
     """Informações básicas da API"""
     return APIInfo(
@@ -142,24 +315,38 @@ async def root():
     )
 
 @app.get("/health", response_model=HealthResponse)
-@mlflow_track_health_check
 async def health_check():
-    """Health check endpoint"""
-    log_health_check()
-    return HealthResponse(
-        status="healthy",
-        model_loaded=ml_service.is_model_loaded(),
-        version="1.0.0"
-    )
+    """Health check endpoint (snapshot atualizado em background, sem tracking nem log)"""
+    return Response(health_monitor.body, status_code=health_monitor.status_code, media_type="application/json")
 
 @app.get("/metrics")
 async def get_metrics():
     """Endpoint para métricas da aplicação"""
-    return metrics.get_metrics()
+    return FastJSONResponse({
+        **metrics.get_metrics(),
+        "pipeline": inference_pipeline.get_stats(),
+        "frame_streams": frame_streams.get_stats(),
+        "request_timings": latency_histograms.get_stats(),
+        "latency_quantiles": get_latency_quantiles(),
+        "logging": get_log_stats(),
+        "mlflow_telemetry": {"enabled": mlflow_manager.config.ENABLE_TRACKING, **mlflow_manager.telemetry.get_stats()},
+        "model_performance": performance_monitor.get_stats(),
+        "idempotency": {"enabled": config.IDEMPOTENCY_ENABLED, **idempotency_store.get_stats()},
+        "jobs": {
+            "enabled": job_store is not None,
+            **(await job_store.get_stats() if job_store else {}),
+            **(job_runner.get_stats() if job_runner else {})
+        },
+        "rate_limit": {"enabled": config.RATE_LIMIT_ENABLED, **rate_limiter.get_stats()},
+        "process_memory": get_process_memory()
+    })
+
+@app.get("/metrics/prometheus", response_class=PlainTextResponse)
+async def get_prometheus_metrics():
+    """Métricas no formato texto do Prometheus (contadores, histogramas e gauges)"""
+    return PlainTextResponse(render_prometheus(), media_type=PROMETHEUS_CONTENT_TYPE)
 
 @app.post("/predict", response_model=PredictionResponse)
-@log_prediction
-@mlflow_track_prediction
 async def predict_disease(file: UploadFile = File(..., description="Imagem do olho para classificação")):
     """
     Classifica doenças oculares a partir de uma imagem
@@ -176,20 +363,29 @@ async def predict_disease(file: UploadFile = File(..., description="Imagem do ol
                 detail="ML model not available"
             )
         
-        # Validar e processar imagem
-        image = validate_image(file)
+        # Validar e ler imagem
+        upload = validate_image(file)
         
-        # Fazer predição
-        predicted_class, confidence, all_predictions = ml_service.predict(image)
+        # Decodificar, preprocessar e classificar via pipeline em batch
+        try:
+            predicted_class, confidence, all_predictions = await inference_pipeline.submit(upload.buffer)
+            metrics.increment_predictions("/predict")
+        except InvalidImageError as e:
+            logger.error(f"Error validating image: {str(e)}")
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="Invalid image file"
+            )
         
-        return PredictionResponse(
-            predicted_class=DiseaseClass(predicted_class),
-            confidence=round(confidence, 2),
-            all_predictions={k: round(v, 2) for k, v in all_predictions.items()}
-        )
+        return FastJSONResponse(build_prediction_response(predicted_class, confidence, all_predictions))
         
     except HTTPException:
         raise
+    except PipelineClosedError:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Server is shutting down"
+        )
     except Exception as e:
         logger.error(f"Error in prediction: {str(e)}")
         raise HTTPException(
@@ -197,6 +393,323 @@ async def predict_disease(file: UploadFile = File(..., description="Imagem do ol
             detail="Internal server error during prediction"
         )
 
+@app.post("/predict/tensor", response_model=BatchPredictionResponse)
+async def predict_tensor(request: Request):
+    """
+    Classifica imagens já decodificadas enviadas como tensores uint8
+    
+    - **application/x-npy**: array `.npy` com shape (256, 256, 3) ou (N, 256, 256, 3)
+    - **application/vnd.apache.arrow.stream**: stream Arrow IPC com a coluna `image`
+      (`fixed_size_list<uint8>[196608]` ou `fixed_size_binary[196608]`), uma imagem por linha
+    
+    Os pixels são lidos como view sobre o corpo do request e copiados uma única
+    vez, direto para o buffer de entrada do modelo.
+    """
+    try:
+        # Verificar se o modelo está carregado
+        if not ml_service.is_model_loaded():
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail="ML model not available"
+            )
+        
+        # Verificar formato antes de ler o corpo
+        content_type = request.headers.get("content-type", "").split(";")[0].strip().lower()
+        if content_type not in NPY_CONTENT_TYPES and content_type not in ARROW_CONTENT_TYPES:
+            raise HTTPException(
+                status_code=status.HTTP_415_UNSUPPORTED_MEDIA_TYPE,
+                detail=f"Unsupported content type. Supported: {', '.join(sorted(NPY_CONTENT_TYPES | ARROW_CONTENT_TYPES))}"
+            )
+        
+        body = await request.body()
+        batch = parse_arrow(body) if content_type in ARROW_CONTENT_TYPES else parse_npy(body)
+        
+        if len(batch) > config.MAX_TENSOR_BATCH_SIZE:
+            raise HTTPException(
+                status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+                detail=f"Too many images. Maximum batch size: {config.MAX_TENSOR_BATCH_SIZE}"
+            )
+        
+        # Todas as imagens entram no mesmo batcher das predições por upload
+        results = await asyncio.gather(*(inference_pipeline.submit_array(pixels) for pixels in batch))
+        metrics.increment_predictions("/predict/tensor", len(results))
+        
+        return FastJSONResponse(BatchPredictionResponse.model_construct(
+            count=len(results),
+            predictions=[build_prediction_response(*result) for result in results]
+        ))
+        
+    except HTTPException:
+        raise
+    except InvalidTensorError as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=str(e)
+        )
+    except ArrowUnavailableError as e:
+        raise HTTPException(
+            status_code=status.HTTP_415_UNSUPPORTED_MEDIA_TYPE,
+            detail=str(e)
+        )
+    except PipelineClosedError:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Server is shutting down"
+        )
+    except Exception as e:
+        logger.error(f"Error in tensor prediction: {str(e)}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Internal server error during prediction"
+        )
+
+async def _predict_path(path: str, resolved: str) -> PathPredictionResult:
+    """Classifica um caminho já validado, convertendo falhas em erro por item"""
+    inspect = partial(inspect_image, max_pixels=config.MAX_IMAGE_PIXELS, policy=config.OVERSIZE_IMAGE_POLICY)
+    try:
+        result = await inference_pipeline.submit_path(resolved, inspect=inspect)
+        metrics.increment_predictions("/predict/paths")
+        return PathPredictionResult.model_construct(path=path, prediction=build_prediction_response(*result))
+    except ImageRejectedError as e:
+        metrics.increment_image_rejects(e.reason)
+        if e.reason == "unidentified":
+            return PathPredictionResult.model_construct(path=path, error="Invalid image file")
+        return PathPredictionResult.model_construct(path=path, error=f"Image rejected ({e.reason})")
+    except InvalidImageError:
+        return PathPredictionResult.model_construct(path=path, error="Invalid image file")
+    except PipelineClosedError:
+        return PathPredictionResult.model_construct(path=path, error="Server is shutting down")
+    except FileNotFoundError:
+        return PathPredictionResult.model_construct(path=path, error="File not found")
+    except OSError as e:
+        return PathPredictionResult.model_construct(path=path, error=f"Could not read file: {e.strerror}")
+
+def _resolve_paths(paths: List[str]) -> List[str]:
+    """Resolve um lote de caminhos contra PREDICT_PATH_ROOT (PathNotAllowedError no primeiro recusado)"""
+    return [resolve_allowed_path(path, config.PREDICT_PATH_ROOT, SUPPORTED_FORMATS) for path in paths]
+
+@app.post("/predict/paths", response_model=PathPredictionResponse)
+async def predict_paths(request: PathPredictionRequest):
+    """
+    Classifica imagens já presentes em um volume montado, sem upload
+    
+    Disponível apenas quando `PREDICT_PATH_ROOT` está configurado. Os caminhos
+    são resolvidos a partir dessa raiz (symlinks inclusive) e qualquer caminho
+    fora dela recusa a requisição inteira. Os arquivos são mapeados em memória
+    (mmap) para decodificação e seguem pelo mesmo pipeline em batch do `/predict`.
+    """
+    if not config.PREDICT_PATH_ROOT:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Path prediction is disabled"
+        )
+    
+    if not ml_service.is_model_loaded():
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="ML model not available"
+        )
+    
+    if len(request.paths) > config.MAX_PATH_BATCH_SIZE:
+        raise HTTPException(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            detail=f"Too many paths. Maximum batch size: {config.MAX_PATH_BATCH_SIZE}"
+        )
+    
+    # Validar todos os caminhos contra a allowlist antes de abrir qualquer arquivo;
+    # realpath consulta o sistema de arquivos, então o lote inteiro roda fora do event loop
+    try:
+        resolved = await asyncio.get_running_loop().run_in_executor(None, _resolve_paths, request.paths)
+    except PathNotAllowedError as e:
+        logger.warning(f"Predição por caminho recusada: {str(e)}")
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail=str(e)
+        )
+    
+    start_time = time.perf_counter()
+    results = await asyncio.gather(*(
+        _predict_path(path, resolved_path) for path, resolved_path in zip(request.paths, resolved)
+    ))
+    elapsed = time.perf_counter() - start_time
+    
+    succeeded = sum(1 for result in results if result.prediction is not None)
+    images_per_second = succeeded / elapsed if elapsed > 0 else 0.0
+    logger.info(f"Predição por caminho: {succeeded}/{len(results)} imagens em {elapsed:.2f}s ({images_per_second:.1f} img/s)")
+    
+    return FastJSONResponse(PathPredictionResponse.model_construct(
+        count=len(results),
+        succeeded=succeeded,
+        failed=len(results) - succeeded,
+        elapsed_seconds=round(elapsed, 3),
+        images_per_second=round(images_per_second, 2),
+        results=results
+    ))
+
+def _require_jobs():
+    """404 se a API de jobs não estiver configurada"""
+    if job_store is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Job API is disabled"
+        )
+
+async def _get_job(job_id: str) -> dict:
+    """Job existente ou 404"""
+    _require_jobs()
+    job = await job_store.get(job_id)
+    if job is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Job not found"
+        )
+    return job
+
+@app.post("/jobs", response_model=JobResponse, status_code=status.HTTP_202_ACCEPTED)
+async def create_path_job(request: JobRequest):
+    """
+    Cria um job em lote com imagens de um volume montado
+    
+    Os caminhos seguem as mesmas regras de `/predict/paths`, verificadas
+    quando cada item é processado (um caminho recusado vira erro do item). O
+    job é processado em segundo plano, com a capacidade ociosa do modelo;
+    acompanhe por `GET /jobs/{job_id}` ou `/jobs/{job_id}/events`.
+    """
+    _require_jobs()
+    if not config.PREDICT_PATH_ROOT:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Path prediction is disabled"
+        )
+    
+    if len(request.paths) > config.JOB_MAX_PATHS:
+        raise HTTPException(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            detail=f"Too many paths. Maximum per job: {config.JOB_MAX_PATHS}"
+        )
+    
+    # Sem validar aqui: até JOB_MAX_PATHS realpath no event loop atrasariam as
+    # predições ao vivo; o worker valida cada caminho fora do loop
+    job = await job_store.create([(path, path, None) for path in request.paths])
+    job_runner.notify()
+    logger.info(f"Job {job['job_id']} criado com {len(request.paths)} caminhos")
+    return FastJSONResponse(job, status_code=status.HTTP_202_ACCEPTED)
+
+def _read_job_images(files: List[UploadFile]) -> List[Tuple[str, Optional[str], memoryview]]:
+    """Valida os uploads de um job; o buffer de cada um vai para a fila sem nova cópia"""
+    items = []
+    for file in files:
+        upload = validate_image(file)
+        items.append((file.filename or f"image_{len(items)}", None, upload.buffer.getbuffer()))
+    return items
+
+@app.post("/jobs/images", response_model=JobResponse, status_code=status.HTTP_202_ACCEPTED)
+async def create_image_job(files: List[UploadFile] = File(..., description="Imagens do olho para classificação")):
+    """
+    Cria um job em lote com imagens enviadas
+    
+    Cada arquivo passa pelas mesmas verificações de `/predict` antes de o job
+    ser aceito; os bytes ficam na fila persistente até serem processados.
+    """
+    _require_jobs()
+    if len(files) > config.JOB_MAX_IMAGES:
+        raise HTTPException(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            detail=f"Too many images. Maximum per job: {config.JOB_MAX_IMAGES}"
+        )
+    
+    # Leitura, hash e inspeção dos arquivos bloqueiam: ficam fora do event loop
+    items = await asyncio.get_running_loop().run_in_executor(None, _read_job_images, files)
+    
+    job = await job_store.create(items)
+    job_runner.notify()
+    logger.info(f"Job {job['job_id']} criado com {len(items)} imagens")
+    return FastJSONResponse(job, status_code=status.HTTP_202_ACCEPTED)
+
+@app.get("/jobs/{job_id}", response_model=JobResponse)
+async def get_job(job_id: str):
+    """Estado e progresso de um job"""
+    return FastJSONResponse(await _get_job(job_id))
+
+@app.get("/jobs/{job_id}/results", response_model=JobResultsResponse)
+async def get_job_results(job_id: str, offset: int = Query(0, ge=0), limit: int = Query(1000, ge=1, le=10000)):
+    """
+    Resultados já concluídos de um job, em ordem de entrada
+    
+    Paginado por `offset`/`limit`; pode ser chamado com o job ainda em andamento.
+    """
+    job = await _get_job(job_id)
+    results = await job_store.results(job_id, offset, limit)
+    return FastJSONResponse({
+        "job_id": job_id,
+        "status": job["status"],
+        "offset": offset,
+        "count": len(results),
+        "results": results
+    })
+
+@app.get("/jobs/{job_id}/events")
+async def stream_job_events(job_id: str):
+    """
+    Progresso do job como Server-Sent Events
+    
+    Um evento `progress` a cada mudança (verificado a cada segundo) e o
+    estado final no evento `completed`, que encerra o stream. No shutdown o
+    stream termina sem `completed` (o cliente reconecta em outra instância),
+    para não segurar a espera do uvicorn pelas conexões.
+    """
+    job = await _get_job(job_id)
+    
+    async def events():
+        nonlocal job
+        last = None
+        while True:
+            if job != last:
+                event = "completed" if job["status"] == "completed" else "progress"
+                yield f"event: {event}\ndata: {orjson.dumps(job).decode()}\n\n"
+                last = job
+                if event == "completed":
+                    return
+            await asyncio.sleep(1.0)
+            if health_monitor.draining:
+                return
+            job = await job_store.get(job_id)
+    
+    return StreamingResponse(events(), media_type="text/event-stream", headers={"Cache-Control": "no-cache"})
+
+@app.websocket("/ws/predict")
+async def predict_frames(websocket: WebSocket):
+    """
+    Classifica continuamente frames de preview enviados por WebSocket
+    
+    Cada mensagem binária é um frame (JPEG, PNG); o frame_id é a ordem de
+    chegada na sessão, começando em 1. Frames que chegam enquanto o anterior
+    ainda está no modelo substituem o pendente: só o mais recente é
+    classificado e os demais entram em `dropped`. Os resultados voltam como
+    JSON com `frame_id`.
+    """
+    await websocket.accept()
+    
+    if not ml_service.is_model_loaded():
+        await websocket.close(code=1013, reason="ML model not available")
+        return
+    
+    session = frame_streams.open()
+    processor = asyncio.create_task(process_frames(websocket, session, inference_pipeline))
+    try:
+        while True:
+            message = await websocket.receive()
+            if message["type"] == "websocket.disconnect":
+                break
+            if message.get("bytes") is None:
+                await websocket.send_json({"error": "Frames must be sent as binary messages"})
+                continue
+            session.offer(message["bytes"])
+    finally:
+        processor.cancel()
+        await asyncio.gather(processor, return_exceptions=True)
+        frame_streams.close(session)
+
 @app.exception_handler(HTTPException)
 async def http_exception_handler(request, exc):
     """Handler personalizado para exceções HTTP"""
@@ -205,7 +718,7 @@ async def http_exception_handler(request, exc):
         content=ErrorResponse(
             error=exc.detail,
             detail=f"Status code: {exc.status_code}"
-        ).dict()
+        ).model_dump()
     )
 
 if __name__ == "__main__":
@@ -225,7 +225,7 @@ async def http_exception_handler(request, exc):
         content=ErrorResponse(
             error=exc.detail,
             detail=f"Status code: {exc.status_code}"
-        ).dict()
+        ).model_dump()
     )
 
 if __name__ == "__main__":
@@ -0,0 +1,502 @@
+#!/usr/bin/env python3
+"""
+Benchmarks de performance dos caminhos críticos da API
+
+Uso:
+    python benchmark.py decode [imagens...] [--repeat N]
+    python benchmark.py preprocess [--batch-size N] [--repeat N]
+    python benchmark.py serialize [--repeat N] [--batch-size N]
+    python benchmark.py grpc [imagem] [--url URL] [--grpc-target HOST:PORT] [--requests N] [--concurrency N]
+    python benchmark.py tracker [--predictions N]
+"""
+
+import argparse
+import io
+import math
+import multiprocessing
+import os
+import resource
+import statistics
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from types import SimpleNamespace
+from typing import Callable, Dict, List, Tuple
+
+def _synthetic_images() -> List[Tuple[str, bytes]]:
+    """Gera imagens grandes no estilo de câmeras de fundo de olho (3000x2000)"""
+    from PIL import Image, ImageDraw
+
+    image = Image.radial_gradient("L").resize((3000, 2000)).convert("RGB")
+    draw = ImageDraw.Draw(image)
+    for i in range(0, 3000, 40):
+        draw.line([(i, 0), (3000 - i, 2000)], fill=(180, 40, 20), width=3)
+
+    samples = []
+    for fmt in ("JPEG", "PNG"):
+        buffer = io.BytesIO()
+        image.save(buffer, format=fmt, quality=95)
+        samples.append((f"synthetic_3000x2000.{fmt.lower()}", buffer.getvalue()))
+    return samples
+
+def _load_images(paths: List[str]) -> List[Tuple[str, bytes]]:
+    """Carrega imagens de arquivos ou diretórios"""
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            files.extend(
+                os.path.join(path, name) for name in sorted(os.listdir(path))
+                if name.lower().rsplit(".", 1)[-1] in {"jpg", "jpeg", "png"}
+            )
+        else:
+            files.append(path)
+
+    samples = []
+    for file_path in files:
+        with open(file_path, "rb") as f:
+            samples.append((os.path.basename(file_path), f.read()))
+    return samples
+
+def _read_status_kb(field: str) -> int:
+    """Lê um campo (VmRSS, VmHWM) de /proc/self/status em KB"""
+    with open("/proc/self/status") as f:
+        for line in f:
+            if line.startswith(field + ":"):
+                return int(line.split()[1])
+    return 0
+
+def _peak_child(fn: Callable, data: bytes, conn):
+    """Executa fn em processo filho e reporta o pico de RSS adicional em KB"""
+    # Aquecer imports e plugins do PIL com uma imagem mínima
+    from PIL import Image
+
+    warmup = io.BytesIO()
+    Image.new("RGB", (8, 8)).save(warmup, format="PNG")
+    fn(warmup.getvalue())
+
+    try:
+        # Zerar o high-water mark (Linux >= 4.0) para medir só esta chamada
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+        baseline = _read_status_kb("VmRSS")
+        fn(data)
+        conn.send(_read_status_kb("VmHWM") - baseline)
+    except OSError:
+        baseline = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        fn(data)
+        conn.send(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - baseline)
+    finally:
+        conn.close()
+
+def _measure_peak_kb(fn: Callable, data: bytes) -> int:
+    """Mede o pico de memória de uma decodificação em um processo limpo"""
+    # spawn em vez de fork: num fork o heap já aquecido pelo pai mascara o pico
+    ctx = multiprocessing.get_context("spawn")
+    parent_conn, child_conn = ctx.Pipe(duplex=False)
+    process = ctx.Process(target=_peak_child, args=(fn, data, child_conn))
+    process.start()
+    peak = parent_conn.recv()
+    process.join()
+    return peak
+
+def _time_ms(fn: Callable, data: bytes, repeat: int) -> float:
+    """Mediana do tempo de execução em ms"""
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn(data)
+        samples.append((time.perf_counter() - start) * 1000)
+    return statistics.median(samples)
+
+def _decode_baseline(data: bytes):
+    """Caminho antigo: decodificação nativa + convert + resize"""
+    from PIL import Image
+
+    image = Image.open(io.BytesIO(data))
+    if image.mode != "RGB":
+        image = image.convert("RGB")
+    return image.resize((256, 256))
+
+def _decode_draft(data: bytes):
+    """Caminho novo: draft/reduce + resize"""
+    from image_processing import decode_image
+
+    return decode_image(io.BytesIO(data)).resize((256, 256))
+
+def bench_decode(args):
+    """Compara tempo e pico de memória por request na decodificação"""
+    from PIL import Image
+    from image_processing import decode_image
+
+    samples = _load_images(args.images) if args.images else _synthetic_images()
+    if not samples:
+        print("❌ Nenhuma imagem encontrada")
+        return 1
+
+    print(f"{'imagem':<32} {'nativa':>11} {'decod.':>11} "
+          f"{'base ms':>8} {'draft ms':>8} {'base MB':>8} {'draft MB':>8}")
+    for name, data in samples:
+        native = Image.open(io.BytesIO(data)).size
+        decoded = decode_image(io.BytesIO(data)).size
+
+        base_ms = _time_ms(_decode_baseline, data, args.repeat)
+        draft_ms = _time_ms(_decode_draft, data, args.repeat)
+        base_mb = _measure_peak_kb(_decode_baseline, data) / 1024
+        draft_mb = _measure_peak_kb(_decode_draft, data) / 1024
+
+        print(f"{name[:32]:<32} {native[0]:>5}x{native[1]:<5} {decoded[0]:>5}x{decoded[1]:<5} "
+              f"{base_ms:>8.1f} {draft_ms:>8.1f} {base_mb:>8.1f} {draft_mb:>8.1f}")
+    return 0
+
+def _preprocess_baseline(image, batch_size: int):
+    """Caminho antigo: img_to_array (np.asarray float32) + expand_dims + astype + concatenate"""
+    import numpy as np
+
+    arrays = []
+    for _ in range(batch_size):
+        img_array = np.asarray(image.resize((256, 256)), dtype=np.float32)
+        arrays.append(np.expand_dims(img_array, axis=0).astype(np.float32))
+    return np.concatenate(arrays)
+
+def _preprocess_arena(image, batch_size: int, arena):
+    """Caminho novo: cada imagem escrita no seu slot do arena"""
+    import numpy as np
+
+    items = []
+    for _ in range(batch_size):
+        slot, tensor = arena.acquire()
+        np.copyto(tensor, np.asarray(image.resize((256, 256))))
+        items.append(SimpleNamespace(slot=slot, tensor=tensor))
+    batch = arena.assemble(items)
+    for item in items:
+        arena.release(item.slot)
+    return batch
+
+def bench_preprocess(args):
+    """Compara alocações por request no preprocessamento (tracemalloc)"""
+    import tracemalloc
+    from PIL import Image
+    from inference_pipeline import TensorArena
+
+    image = Image.new("RGB", (512, 512), (120, 60, 30))
+    arena = TensorArena(2 * args.batch_size, args.batch_size)
+
+    paths = {
+        "baseline": lambda: _preprocess_baseline(image, args.batch_size),
+        "arena": lambda: _preprocess_arena(image, args.batch_size, arena)
+    }
+
+    print(f"batch_size={args.batch_size}, {args.repeat} repetições")
+    print(f"{'caminho':<10} {'ms/req':>8} {'pico KB/req':>12} {'retido KB':>10} {'blocos/req':>11}")
+    for name, fn in paths.items():
+        fn()  # aquecimento
+
+        tracemalloc.start()
+        before, _ = tracemalloc.get_traced_memory()
+        snapshot_before = tracemalloc.take_snapshot()
+        start = time.perf_counter()
+        peaks = []
+        for _ in range(args.repeat):
+            tracemalloc.reset_peak()
+            current, _ = tracemalloc.get_traced_memory()
+            fn()
+            peaks.append(tracemalloc.get_traced_memory()[1] - current)
+        elapsed = time.perf_counter() - start
+        after, _ = tracemalloc.get_traced_memory()
+        stats = tracemalloc.take_snapshot().compare_to(snapshot_before, "filename")
+        tracemalloc.stop()
+
+        requests = args.repeat * args.batch_size
+        blocks = sum(max(stat.count_diff, 0) for stat in stats)
+        print(f"{name:<10} {elapsed / requests * 1000:>8.2f} "
+              f"{statistics.mean(peaks) / args.batch_size / 1024:>12.1f} "
+              f"{(after - before) / 1024:>10.1f} {blocks / requests:>11.2f}")
+    return 0
+
+def _sample_prediction() -> Tuple[str, float, Dict[str, float]]:
+    """Saída típica de MLService.predict_batch para uma imagem"""
+    all_predictions = {"cataract": 1.2345678, "diabetic_retinopathy": 2.1034567, "glaucoma": 0.9987654,
+                       "normal": 95.6632101}
+    return "normal", all_predictions["normal"], all_predictions
+
+def bench_serialize(args):
+    """Custo por resposta: validação + jsonable_encoder + json.dumps vs model_construct + orjson"""
+    import asyncio
+    from fastapi.responses import JSONResponse
+    from fastapi.routing import serialize_response
+    from fastapi.utils import create_response_field
+    from models import BatchPredictionResponse, DiseaseClass, PredictionResponse
+    from responses import FastJSONResponse
+
+    predicted_class, confidence, all_predictions = _sample_prediction()
+    metrics_payload = {
+        "uptime_seconds": 3600.0, "total_requests": 150, "total_predictions": 45, "total_errors": 2,
+        "average_response_time_ms": 250.5, "requests_per_second": 0.042, "error_rate": 1.33,
+        "image_rejects": {"pixel_budget": 1},
+        "pipeline": {"queue_depth": 0, "batches": 40, "avg_batch_size": 1.12, "max_batch_size": 16,
+                     "stages": {name: {"count": 45, "avg_ms": 22.5, "max_ms": 61.0, "busy_seconds": 1.01}
+                                for name in ("preprocess", "queue_wait", "inference")}}
+    }
+
+    def prediction_before():
+        return PredictionResponse(
+            predicted_class=DiseaseClass(predicted_class),
+            confidence=round(confidence, 2),
+            all_predictions={k: round(v, 2) for k, v in all_predictions.items()}
+        )
+
+    def prediction_after():
+        return PredictionResponse.model_construct(
+            predicted_class=DiseaseClass(predicted_class),
+            confidence=round(confidence, 2),
+            all_predictions={k: round(v, 2) for k, v in all_predictions.items()}
+        )
+
+    prediction_field = create_response_field(name="response", type_=PredictionResponse)
+    batch_field = create_response_field(name="response", type_=BatchPredictionResponse)
+
+    async def fastapi_path(field, content):
+        """O que o FastAPI faz com um modelo retornado: revalida, encoda e serializa"""
+        value = await serialize_response(field=field, response_content=content, is_coroutine=True)
+        return JSONResponse(value).body
+
+    cases = {
+        "predict": (
+            lambda: fastapi_path(prediction_field, prediction_before()),
+            lambda: FastJSONResponse(prediction_after()).body
+        ),
+        f"batch x{args.batch_size}": (
+            lambda: fastapi_path(batch_field, BatchPredictionResponse(
+                count=args.batch_size, predictions=[prediction_before() for _ in range(args.batch_size)]
+            )),
+            lambda: FastJSONResponse(BatchPredictionResponse.model_construct(
+                count=args.batch_size, predictions=[prediction_after() for _ in range(args.batch_size)]
+            )).body
+        ),
+        "metrics": (
+            lambda: fastapi_path(None, metrics_payload),
+            lambda: FastJSONResponse(metrics_payload).body
+        )
+    }
+
+    async def measure(fn: Callable, is_async: bool) -> float:
+        for _ in range(min(args.repeat, 100)):
+            await fn() if is_async else fn()
+        start = time.perf_counter()
+        for _ in range(args.repeat):
+            await fn() if is_async else fn()
+        return (time.perf_counter() - start) / args.repeat * 1e6
+
+    async def run():
+        print(f"{args.repeat} repetições")
+        print(f"{'resposta':<12} {'antes µs':>10} {'depois µs':>10} {'ganho':>7}")
+        for name, (before, after) in cases.items():
+            before_us = await measure(before, True)
+            after_us = await measure(after, False)
+            print(f"{name:<12} {before_us:>10.1f} {after_us:>10.1f} {before_us / after_us:>6.1f}x")
+
+    asyncio.run(run())
+    return 0
+
+def _sample_jpeg() -> bytes:
+    """JPEG típico de upload (1024x768)"""
+    from PIL import Image
+
+    buffer = io.BytesIO()
+    Image.radial_gradient("L").resize((1024, 768)).convert("RGB").save(buffer, format="JPEG", quality=90)
+    return buffer.getvalue()
+
+def _run_closed_loop(call: Callable[[], None], requests: int, concurrency: int) -> Tuple[float, List[float]]:
+    """Executa ``requests`` chamadas com ``concurrency`` clientes; retorna (segundos, latências ms)"""
+    latencies = []
+    lock = threading.Lock()
+    per_client = [requests // concurrency + (1 if i < requests % concurrency else 0) for i in range(concurrency)]
+
+    def client(count: int):
+        for _ in range(count):
+            start = time.perf_counter()
+            call()
+            elapsed = (time.perf_counter() - start) * 1000
+            with lock:
+                latencies.append(elapsed)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        list(executor.map(client, per_client))
+    return time.perf_counter() - start, latencies
+
+def _run_stream(stub, make_request: Callable[[str], object], requests: int,
+                concurrency: int) -> Tuple[float, List[float]]:
+    """Um PredictStream por cliente; latência de cada item pelo request_id"""
+    latencies = []
+    lock = threading.Lock()
+    per_client = [requests // concurrency + (1 if i < requests % concurrency else 0) for i in range(concurrency)]
+
+    def client(index: int):
+        sent_at: Dict[str, float] = {}
+
+        def generate():
+            for i in range(per_client[index]):
+                request_id = f"{index}-{i}"
+                sent_at[request_id] = time.perf_counter()
+                yield make_request(request_id)
+
+        for response in stub.PredictStream(generate()):
+            if response.error:
+                raise RuntimeError(response.error)
+            elapsed = (time.perf_counter() - sent_at.pop(response.request_id)) * 1000
+            with lock:
+                latencies.append(elapsed)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        list(executor.map(client, range(concurrency)))
+    return time.perf_counter() - start, latencies
+
+def _percentile(samples: List[float], q: float) -> float:
+    """Percentil por ordenação (nearest-rank)"""
+    ordered = sorted(samples)
+    return ordered[max(0, math.ceil(q / 100 * len(ordered)) - 1)]
+
+def bench_grpc(args):
+    """Compara req/s e latência de /predict (HTTP) com Predict/PredictStream (gRPC)"""
+    import grpc
+    import numpy as np
+    import requests
+    import inference_pb2
+    import inference_pb2_grpc
+
+    if args.image:
+        with open(args.image, "rb") as f:
+            image = f.read()
+    else:
+        image = _sample_jpeg()
+    pixels = np.zeros((256, 256, 3), dtype=np.uint8).tobytes()
+
+    session_local = threading.local()
+
+    def http_predict():
+        if not hasattr(session_local, "session"):
+            session_local.session = requests.Session()
+        response = session_local.session.post(
+            f"{args.url}/predict", files={"file": ("image.jpg", image, "image/jpeg")}, timeout=60
+        )
+        response.raise_for_status()
+
+    channel = grpc.insecure_channel(args.grpc_target, options=[
+        ("grpc.max_send_message_length", 16 * 1024 * 1024)
+    ])
+    stub = inference_pb2_grpc.EyeDiseaseClassifierStub(channel)
+
+    def image_request(request_id: str = ""):
+        return inference_pb2.PredictRequest(request_id=request_id, image=image)
+
+    def tensor_request(request_id: str = ""):
+        return inference_pb2.PredictRequest(
+            request_id=request_id, tensor=inference_pb2.RawTensor(data=pixels, shape=[256, 256, 3])
+        )
+
+    modes = {
+        "http /predict": lambda: _run_closed_loop(http_predict, args.requests, args.concurrency),
+        "grpc Predict": lambda: _run_closed_loop(
+            lambda: stub.Predict(image_request(), timeout=60), args.requests, args.concurrency
+        ),
+        "grpc Predict tensor": lambda: _run_closed_loop(
+            lambda: stub.Predict(tensor_request(), timeout=60), args.requests, args.concurrency
+        ),
+        "grpc PredictStream": lambda: _run_stream(
+            stub, image_request, args.requests, args.concurrency
+        )
+    }
+
+    print(f"{args.requests} requests, concorrência {args.concurrency}, imagem de {len(image) / 1024:.0f} KB")
+    print(f"{'modo':<22} {'req/s':>8} {'p50 ms':>8} {'p99 ms':>8}")
+    for name, run in modes.items():
+        # Aquecimento: conexões abertas e pipeline ativo antes de medir
+        _run_closed_loop(
+            http_predict if name.startswith("http") else lambda: stub.Predict(image_request(), timeout=60),
+            args.concurrency, args.concurrency
+        )
+        elapsed, latencies = run()
+        print(f"{name:<22} {len(latencies) / elapsed:>8.1f} "
+              f"{_percentile(latencies, 50):>8.1f} {_percentile(latencies, 99):>8.1f}")
+
+    channel.close()
+    return 0
+
+def bench_tracker(args):
+    """Memória e custo do resumo do MLFlowTracker ao longo de N predições simuladas"""
+    import logging
+    import random
+    from mlflow_utils import MLFlowTracker
+
+    # Sem o log INFO por predição: mede só o acúmulo
+    logging.disable(logging.INFO)
+    classes = ["cataract", "diabetic_retinopathy", "glaucoma", "normal"]
+    rng = random.Random(0)
+    samples = []
+    for _ in range(1000):
+        probabilities = [rng.random() for _ in classes]
+        total = sum(probabilities)
+        all_predictions = {name: p / total * 100 for name, p in zip(classes, probabilities)}
+        predicted_class = max(all_predictions, key=all_predictions.get)
+        samples.append((predicted_class, all_predictions[predicted_class], rng.uniform(0.01, 0.2), all_predictions))
+
+    tracker = MLFlowTracker()
+    checkpoints = sorted({10 ** e for e in range(3, 9) if 10 ** e < args.predictions} | {args.predictions})
+    baseline_kb = _read_status_kb("VmRSS")
+    done = 0
+    print(f"{'predições':>12} {'µs/predição':>12} {'RSS +MB':>9} {'resumo µs':>10}")
+    for checkpoint in checkpoints:
+        start = time.perf_counter()
+        for i in range(done, checkpoint):
+            predicted_class, confidence, inference_time, all_predictions = samples[i % 1000]
+            tracker.track_prediction(predicted_class, confidence, inference_time, all_predictions)
+        elapsed = time.perf_counter() - start
+
+        summary_start = time.perf_counter()
+        tracker.get_session_metrics()
+        summary_us = (time.perf_counter() - summary_start) * 1e6
+        rss_mb = (_read_status_kb("VmRSS") - baseline_kb) / 1024
+        print(f"{checkpoint:>12} {elapsed / (checkpoint - done) * 1e6:>12.2f} {rss_mb:>9.1f} {summary_us:>10.1f}")
+        done = checkpoint
+    return 0
+
+def main():
+    """Função principal"""
+    parser = argparse.ArgumentParser(description="Benchmarks da Eye Disease Classifier API")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    decode_parser = subparsers.add_parser("decode", help="Decodificação nativa vs draft/reduce")
+    decode_parser.add_argument("images", nargs="*", help="Arquivos ou diretórios de imagens")
+    decode_parser.add_argument("--repeat", type=int, default=5, help="Repetições por imagem")
+    decode_parser.set_defaults(func=bench_decode)
+
+    preprocess_parser = subparsers.add_parser("preprocess", help="Alocações do preprocessamento: baseline vs arena")
+    preprocess_parser.add_argument("--batch-size", type=int, default=8, help="Imagens por batch")
+    preprocess_parser.add_argument("--repeat", type=int, default=50, help="Batches medidos")
+    preprocess_parser.set_defaults(func=bench_preprocess)
+
+    serialize_parser = subparsers.add_parser("serialize", help="Custo de serialização por resposta: antes vs depois")
+    serialize_parser.add_argument("--repeat", type=int, default=20000, help="Respostas por medição")
+    serialize_parser.add_argument("--batch-size", type=int, default=16, help="Predições na resposta em batch")
+    serialize_parser.set_defaults(func=bench_serialize)
+
+    grpc_parser = subparsers.add_parser("grpc", help="req/s e p99: /predict vs gRPC (servidor em execução)")
+    grpc_parser.add_argument("image", nargs="?", help="Imagem enviada (padrão: JPEG sintético 1024x768)")
+    grpc_parser.add_argument("--url", default="http://localhost:8080", help="URL base da API REST")
+    grpc_parser.add_argument("--grpc-target", default="localhost:50051", help="Endereço do servidor gRPC")
+    grpc_parser.add_argument("--requests", type=int, default=500, help="Requests por modo")
+    grpc_parser.add_argument("--concurrency", type=int, default=8, help="Clientes simultâneos")
+    grpc_parser.set_defaults(func=bench_grpc)
+
+    tracker_parser = subparsers.add_parser("tracker", help="Memória e resumo do MLFlowTracker por número de predições")
+    tracker_parser.add_argument("--predictions", type=int, default=10_000_000, help="Predições simuladas")
+    tracker_parser.set_defaults(func=bench_tracker)
+
+    args = parser.parse_args()
+    sys.exit(args.func(args))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,173 @@
+"""
+Classificação contínua de frames via WebSocket
+
+Cada sessão mantém no máximo um frame pendente: um frame novo substitui o
+pendente (contado como descartado), então o modelo sempre recebe o frame mais
+recente em vez de acumular atraso. Há no máximo uma predição em andamento por
+sessão, e todas as sessões compartilham os batches do ``inference_pipeline``.
+Se o cliente demora a ler os resultados, o envio bloqueia e os frames que
+chegam nesse meio tempo também são descartados.
+"""
+
+import asyncio
+import io
+import itertools
+import logging
+import time
+from typing import Any, Dict, Optional, Tuple
+
+from fastapi import WebSocket
+
+from image_processing import ImageRejectedError, InvalidImageError, inspect_image
+from inference_pipeline import PipelineClosedError
+from monitoring import metrics
+from production_config import get_config
+
+logger = logging.getLogger(__name__)
+config = get_config()
+
+class FrameSession:
+    """Estado de uma sessão: frame pendente e contadores de backpressure"""
+
+    def __init__(self, session_id: int):
+        self.session_id = session_id
+        self.started_at = time.time()
+        self.received = 0
+        self.processed = 0
+        self.dropped = 0
+        self.errors = 0
+        self.total_latency = 0.0
+        self.busy = False
+        self._next_frame_id = itertools.count(1)
+        self._pending: Optional[Tuple[int, bytes, float]] = None
+        self._ready = asyncio.Event()
+
+    def offer(self, data: bytes) -> int:
+        """Registra um frame recebido, substituindo o pendente; retorna o frame_id"""
+        frame_id = next(self._next_frame_id)
+        self.received += 1
+        if self._pending is not None:
+            self.dropped += 1
+        self._pending = (frame_id, data, time.perf_counter())
+        self._ready.set()
+        return frame_id
+
+    async def next_frame(self) -> Tuple[int, bytes, float]:
+        """Aguarda e retira o frame mais recente"""
+        await self._ready.wait()
+        self._ready.clear()
+        frame, self._pending = self._pending, None
+        return frame
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Contadores da sessão"""
+        return {
+            "session_id": self.session_id,
+            "duration_seconds": round(time.time() - self.started_at, 2),
+            "frames_received": self.received,
+            "frames_processed": self.processed,
+            "frames_dropped": self.dropped,
+            "errors": self.errors,
+            "pending": self._pending is not None,
+            "busy": self.busy,
+            "avg_latency_ms": round(self.total_latency / self.processed * 1000, 2) if self.processed > 0 else 0
+        }
+
+class FrameStreamManager:
+    """Sessões ativas e totais acumulados das sessões encerradas"""
+
+    def __init__(self):
+        self.sessions: Dict[int, FrameSession] = {}
+        self.sessions_total = 0
+        self.closed_totals = {"frames_received": 0, "frames_processed": 0, "frames_dropped": 0, "errors": 0}
+        self._next_session_id = itertools.count(1)
+
+    def open(self) -> FrameSession:
+        """Cria e registra uma sessão"""
+        session = FrameSession(next(self._next_session_id))
+        self.sessions[session.session_id] = session
+        self.sessions_total += 1
+        return session
+
+    def close(self, session: FrameSession):
+        """Remove a sessão, mantendo seus contadores nos totais"""
+        self.sessions.pop(session.session_id, None)
+        stats = session.get_stats()
+        for key in self.closed_totals:
+            self.closed_totals[key] += stats[key]
+        logger.info(
+            f"🔌 Sessão de frames {session.session_id} encerrada: {session.received} recebidos, "
+            f"{session.processed} processados, {session.dropped} descartados"
+        )
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Totais (sessões ativas + encerradas) e contadores por sessão ativa"""
+        active = [session.get_stats() for session in self.sessions.values()]
+        totals = {key: value + sum(s[key] for s in active) for key, value in self.closed_totals.items()}
+        return {
+            "active_sessions": len(active),
+            "sessions_total": self.sessions_total,
+            **totals,
+            "sessions": active
+        }
+
+async def process_frames(websocket: WebSocket, session: FrameSession, pipeline):
+    """Classifica sempre o frame mais recente da sessão e envia o resultado"""
+    while True:
+        frame_id, data, received_at = await session.next_frame()
+        session.busy = True
+        try:
+            result = await _classify_frame(data, pipeline)
+        except Exception as e:
+            session.errors += 1
+            metrics.increment_errors()
+            logger.warning(f"Frame {frame_id} da sessão {session.session_id} falhou: {str(e)}")
+            await websocket.send_json({"frame_id": frame_id, "error": _error_message(e), "dropped": session.dropped})
+            continue
+        finally:
+            session.busy = False
+
+        latency = time.perf_counter() - received_at
+        session.processed += 1
+        session.total_latency += latency
+        predicted_class, confidence, all_predictions = result
+        await websocket.send_json({
+            "frame_id": frame_id,
+            "predicted_class": predicted_class,
+            "confidence": round(confidence, 2),
+            "all_predictions": {k: round(v, 2) for k, v in all_predictions.items()},
+            "latency_ms": round(latency * 1000, 2),
+            "dropped": session.dropped
+        })
+
+async def _classify_frame(data: bytes, pipeline) -> Tuple[str, float, Dict[str, float]]:
+    """Mesmas verificações de /predict antes de submeter ao pipeline"""
+    if not data:
+        raise ValueError("Empty frame")
+    if len(data) > config.MAX_UPLOAD_SIZE:
+        raise ValueError(f"Frame too large. Maximum size: {config.MAX_UPLOAD_SIZE // (1024 * 1024)}MB")
+
+    source = io.BytesIO(data)
+    try:
+        inspect_image(source, config.MAX_IMAGE_PIXELS, config.OVERSIZE_IMAGE_POLICY)
+    except ImageRejectedError as e:
+        metrics.increment_image_rejects(e.reason)
+        raise
+
+    metrics.increment_predictions("/ws/predict")
+    return await pipeline.submit(source)
+
+def _error_message(error: Exception) -> str:
+    """Mensagem de erro no mesmo formato das respostas HTTP"""
+    if isinstance(error, ImageRejectedError):
+        return "Invalid image file" if error.reason == "unidentified" else str(error)
+    if isinstance(error, InvalidImageError):
+        return "Invalid image file"
+    if isinstance(error, PipelineClosedError):
+        return "Server is shutting down"
+    if isinstance(error, ValueError):
+        return str(error)
+    return "Internal server error during prediction"
+
+# Instância global das sessões de frames
+frame_streams = FrameStreamManager()
@@ -0,0 +1,200 @@
+"""
+Serviço gRPC de inferência (chamadas entre serviços)
+
+Roda no mesmo event loop da API REST e usa o mesmo ``inference_pipeline``:
+predições gRPC e HTTP entram nos mesmos batches do modelo. Aceita imagens
+codificadas (JPEG/PNG) ou tensores uint8 (256, 256, 3) já decodificados.
+
+Requer ``grpcio``; o servidor só é iniciado quando ``GRPC_PORT`` está definido.
+Os stubs ``inference_pb2*.py`` são gerados a partir de ``inference.proto``.
+"""
+
+import asyncio
+import io
+import logging
+from typing import AsyncIterator, Optional
+
+import grpc
+import numpy as np
+
+import inference_pb2
+import inference_pb2_grpc
+from image_processing import ImageRejectedError, InvalidImageError, inspect_image
+from inference_pipeline import PipelineClosedError, inference_pipeline
+from ml_service import ml_service
+from monitoring import metrics
+from production_config import get_config
+from tensor_io import InvalidTensorError, validate_tensor
+
+logger = logging.getLogger(__name__)
+config = get_config()
+
+class PredictionRequestError(Exception):
+    """Erro de um item, com o status gRPC correspondente"""
+
+    def __init__(self, code: grpc.StatusCode, message: str):
+        super().__init__(message)
+        self.code = code
+
+class EyeDiseaseClassifierServicer(inference_pb2_grpc.EyeDiseaseClassifierServicer):
+    """Implementação de Predict e PredictStream sobre o pipeline de inferência"""
+
+    def __init__(self, pipeline, max_stream_in_flight: int):
+        self.pipeline = pipeline
+        self.max_stream_in_flight = max_stream_in_flight
+
+    async def Predict(self, request: inference_pb2.PredictRequest,
+                      context: grpc.aio.ServicerContext) -> inference_pb2.PredictResponse:
+        """Classifica uma imagem"""
+        try:
+            return await self._predict(request)
+        except PredictionRequestError as e:
+            await context.abort(e.code, str(e))
+
+    async def PredictStream(self, request_iterator: AsyncIterator[inference_pb2.PredictRequest],
+                            context: grpc.aio.ServicerContext) -> AsyncIterator[inference_pb2.PredictResponse]:
+        """
+        Classifica um stream de imagens
+
+        Os itens são submetidos ao pipeline sem esperar os anteriores (até
+        ``max_stream_in_flight`` em andamento), então entram juntos nos batches;
+        as respostas saem na ordem de conclusão. Erros de um item voltam no
+        campo ``error`` sem encerrar o stream.
+        """
+        responses: asyncio.Queue = asyncio.Queue()
+        in_flight = asyncio.Semaphore(self.max_stream_in_flight)
+        tasks = set()
+
+        async def run(request: inference_pb2.PredictRequest):
+            try:
+                response = await self._predict(request)
+            except PredictionRequestError as e:
+                response = inference_pb2.PredictResponse(request_id=request.request_id, error=str(e))
+            finally:
+                in_flight.release()
+            await responses.put(response)
+
+        async def read_requests():
+            try:
+                async for request in request_iterator:
+                    # Backpressure: não ler o próximo item enquanto o limite estiver cheio
+                    await in_flight.acquire()
+                    task = asyncio.create_task(run(request))
+                    tasks.add(task)
+                    task.add_done_callback(tasks.discard)
+                await asyncio.gather(*tasks)
+            finally:
+                await responses.put(None)
+
+        reader = asyncio.create_task(read_requests())
+        try:
+            while True:
+                response = await responses.get()
+                if response is None:
+                    break
+                yield response
+            await reader
+        finally:
+            reader.cancel()
+            for task in list(tasks):
+                task.cancel()
+
+    async def _predict(self, request: inference_pb2.PredictRequest) -> inference_pb2.PredictResponse:
+        """Valida a entrada e aguarda a predição no pipeline"""
+        metrics.increment_predictions("grpc")
+
+        if not ml_service.is_model_loaded():
+            metrics.increment_errors()
+            raise PredictionRequestError(grpc.StatusCode.UNAVAILABLE, "ML model not available")
+
+        try:
+            input_type = request.WhichOneof("input")
+            if input_type == "image":
+                source = self._validate_image(request.image)
+                predicted_class, confidence, all_predictions = await self.pipeline.submit(source)
+            elif input_type == "tensor":
+                pixels = self._validate_tensor(request.tensor)
+                predicted_class, confidence, all_predictions = await self.pipeline.submit_array(pixels)
+            else:
+                raise PredictionRequestError(grpc.StatusCode.INVALID_ARGUMENT, "Request must set image or tensor")
+        except PredictionRequestError:
+            metrics.increment_errors()
+            raise
+        except InvalidImageError as e:
+            metrics.increment_errors()
+            logger.error(f"Error validating image: {str(e)}")
+            raise PredictionRequestError(grpc.StatusCode.INVALID_ARGUMENT, "Invalid image file")
+        except PipelineClosedError:
+            metrics.increment_errors()
+            raise PredictionRequestError(grpc.StatusCode.UNAVAILABLE, "Server is shutting down")
+        except Exception as e:
+            metrics.increment_errors()
+            logger.error(f"Error in gRPC prediction: {str(e)}")
+            raise PredictionRequestError(grpc.StatusCode.INTERNAL, "Internal server error during prediction")
+
+        return inference_pb2.PredictResponse(
+            request_id=request.request_id,
+            predicted_class=predicted_class,
+            confidence=round(confidence, 2),
+            all_predictions={k: round(v, 2) for k, v in all_predictions.items()}
+        )
+
+    def _validate_image(self, data: bytes) -> io.BytesIO:
+        """Mesmas verificações de /predict: tamanho e cabeçalho antes do decode"""
+        if not data:
+            raise PredictionRequestError(grpc.StatusCode.INVALID_ARGUMENT, "Empty image")
+        if len(data) > config.MAX_UPLOAD_SIZE:
+            raise PredictionRequestError(
+                grpc.StatusCode.RESOURCE_EXHAUSTED,
+                f"File too large. Maximum size: {config.MAX_UPLOAD_SIZE // (1024 * 1024)}MB"
+            )
+
+        source = io.BytesIO(data)
+        try:
+            inspect_image(source, config.MAX_IMAGE_PIXELS, config.OVERSIZE_IMAGE_POLICY)
+        except ImageRejectedError as e:
+            metrics.increment_image_rejects(e.reason)
+            logger.warning(f"Imagem recusada ({e.reason}): {str(e)}")
+            if e.reason in ("pixel_budget", "decompression_bomb"):
+                raise PredictionRequestError(grpc.StatusCode.RESOURCE_EXHAUSTED, str(e))
+            raise PredictionRequestError(
+                grpc.StatusCode.INVALID_ARGUMENT,
+                "Invalid image file" if e.reason == "unidentified" else str(e)
+            )
+        return source
+
+    def _validate_tensor(self, tensor: inference_pb2.RawTensor) -> np.ndarray:
+        """Interpreta os bytes como view uint8 (256, 256, 3), sem cópia"""
+        try:
+            shape = tuple(tensor.shape)
+            if not shape or int(np.prod(shape)) != len(tensor.data):
+                raise InvalidTensorError(f"Tensor data has {len(tensor.data)} bytes, shape is {shape}")
+            batch = validate_tensor(np.frombuffer(tensor.data, dtype=np.uint8).reshape(shape))
+        except InvalidTensorError as e:
+            raise PredictionRequestError(grpc.StatusCode.INVALID_ARGUMENT, str(e))
+
+        if len(batch) != 1:
+            raise PredictionRequestError(
+                grpc.StatusCode.INVALID_ARGUMENT, "One image per request; use PredictStream for batches"
+            )
+        return batch[0]
+
+async def start_grpc_server(port: int) -> grpc.aio.Server:
+    """Inicia o servidor gRPC no event loop atual"""
+    server = grpc.aio.server(options=[
+        ("grpc.max_receive_message_length", config.GRPC_MAX_MESSAGE_SIZE),
+        ("grpc.max_send_message_length", config.GRPC_MAX_MESSAGE_SIZE)
+    ])
+    inference_pb2_grpc.add_EyeDiseaseClassifierServicer_to_server(
+        EyeDiseaseClassifierServicer(inference_pipeline, config.GRPC_STREAM_MAX_IN_FLIGHT), server
+    )
+    server.add_insecure_port(f"{config.HOST}:{port}")
+    await server.start()
+    logger.info(f"✅ Servidor gRPC iniciado na porta {port}")
+    return server
+
+async def stop_grpc_server(server: Optional[grpc.aio.Server], grace: float = 5.0):
+    """Encerra o servidor gRPC aguardando as chamadas em andamento"""
+    if server is not None:
+        await server.stop(grace)
+        logger.info("🛑 Servidor gRPC encerrado")
@@ -0,0 +1,194 @@
+"""
+Health check servido a partir de um snapshot
+
+Uma thread de fundo recalcula o estado a cada ``HEALTH_REFRESH_INTERVAL`` e
+guarda o corpo JSON já serializado; o ``/health`` só devolve esses bytes, sem
+MLflow, log ou acesso ao pipeline de inferência. Uma tarefa no event loop
+principal marca batidas periódicas, e o atraso entre elas vira
+``event_loop_lag_ms`` (status ``degraded`` acima do limite).
+
+Com ``HEALTH_PORT``, o mesmo snapshot também é servido por um listener HTTP
+mínimo em thread própria, que responde mesmo com o event loop saturado. Os
+workers do ``prefork.py`` abrem a porta com ``SO_REUSEPORT``.
+
+O shutdown começa no SIGTERM/SIGINT (``watch_shutdown_signals``), não no
+lifespan: o uvicorn ainda aguarda as conexões abertas antes de chamá-lo. A
+partir daí o status é ``draining`` (HTTP 503) e ``shutdown_remaining`` dá o
+que sobrou do prazo de shutdown para as etapas seguintes.
+"""
+
+import asyncio
+import logging
+import signal
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Optional
+
+import orjson
+
+from ml_service import ml_service
+from monitoring import LazyJSON
+from production_config import get_config
+
+logger = logging.getLogger(__name__)
+config = get_config()
+
+class HealthMonitor:
+    """Snapshot do health check, atualizado em background"""
+
+    def __init__(self, version: str, refresh_interval: float, max_loop_lag_ms: float):
+        self.version = version
+        self.refresh_interval = refresh_interval
+        self.max_loop_lag_ms = max_loop_lag_ms
+        self.status = "starting"
+        self.draining = False
+        self.shutdown_started: Optional[float] = None
+        self.body = b""
+        self._last_beat: Optional[float] = None
+        self._beat_lag = 0.0
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self):
+        """Calcula o primeiro snapshot e inicia a thread de atualização"""
+        self.refresh()
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="health-snapshot", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Interrompe a thread de atualização"""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=self.refresh_interval * 2)
+            self._thread = None
+
+    async def heartbeat(self):
+        """Tarefa do event loop principal: registra o atraso de cada batida"""
+        while True:
+            start = time.monotonic()
+            self._last_beat = start
+            await asyncio.sleep(self.refresh_interval)
+            self._beat_lag = time.monotonic() - start - self.refresh_interval
+
+    def loop_lag(self) -> float:
+        """Atraso do event loop em segundos (inclui a batida ainda não concluída)"""
+        if self._last_beat is None:
+            return 0.0
+        pending = time.monotonic() - self._last_beat - self.refresh_interval
+        return max(self._beat_lag, pending, 0.0)
+
+    def refresh(self):
+        """Recalcula o snapshot (só lê flags e marcas de tempo)"""
+        lag_ms = self.loop_lag() * 1000
+        if self.draining:
+            status = "draining"
+        else:
+            status = "degraded" if lag_ms > self.max_loop_lag_ms else "healthy"
+        self.body = orjson.dumps({
+            "status": status,
+            "model_loaded": ml_service.is_model_loaded(),
+            "version": self.version,
+            "event_loop_lag_ms": round(lag_ms, 1)
+        })
+        if status != self.status:
+            # Log só na mudança de estado, não por probe
+            logger.info("HEALTH: %s", LazyJSON(orjson.loads(self.body)), extra={"event": "health_check"})
+            self.status = status
+
+    @property
+    def status_code(self) -> int:
+        """503 durante o shutdown, para o balanceador tirar a instância"""
+        return 503 if self.draining else 200
+
+    def mark_shutdown(self):
+        """Registra o início do shutdown (seguro em handler de sinal: sem lock nem log)"""
+        if self.shutdown_started is None:
+            self.shutdown_started = time.monotonic()
+        self.draining = True
+
+    def set_draining(self):
+        """Marca o shutdown em andamento (status ``draining`` para o balanceador)"""
+        self.mark_shutdown()
+        self.refresh()
+
+    def shutdown_remaining(self, timeout: float) -> float:
+        """Segundos restantes de ``timeout`` contados do início do shutdown"""
+        if self.shutdown_started is None:
+            return timeout
+        return max(0.0, self.shutdown_started + timeout - time.monotonic())
+
+    def _run(self):
+        while not self._stop.wait(self.refresh_interval):
+            try:
+                self.refresh()
+            except Exception as e:
+                logger.warning(f"⚠️ Falha ao atualizar health snapshot: {str(e)}")
+
+class _HealthHandler(BaseHTTPRequestHandler):
+    """Responde GET /health com o snapshot; demais caminhos 404"""
+
+    def do_GET(self):
+        if self.path.split("?", 1)[0] != "/health":
+            self.send_error(404)
+            return
+        monitor = self.server.monitor
+        body = monitor.body
+        self.send_response(monitor.status_code)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        # Sem log por probe
+        pass
+
+class _HealthServer(ThreadingHTTPServer):
+    """Servidor HTTP do snapshot (porta compartilhável entre workers)"""
+
+    allow_reuse_address = True
+    allow_reuse_port = True
+    daemon_threads = True
+
+    def __init__(self, address, monitor: HealthMonitor):
+        self.monitor = monitor
+        super().__init__(address, _HealthHandler)
+
+def start_health_listener(monitor: HealthMonitor, host: str, port: int) -> ThreadingHTTPServer:
+    """Inicia o listener HTTP de health em thread própria"""
+    server = _HealthServer((host, port), monitor)
+    threading.Thread(target=server.serve_forever, name="health-listener", daemon=True).start()
+    logger.info(f"✅ Listener de health na porta {port}")
+    return server
+
+def stop_health_listener(server: Optional[ThreadingHTTPServer]):
+    """Encerra o listener de health"""
+    if server is not None:
+        server.shutdown()
+        server.server_close()
+
+def watch_shutdown_signals(monitor: HealthMonitor):
+    """
+    Marca o shutdown já no sinal, antes da espera do uvicorn pelas conexões
+
+    Encadeia com o handler atual: com ``loop.add_signal_handler`` (uvicorn) o
+    handler Python é um no-op e o sinal continua chegando ao event loop.
+    """
+    if threading.current_thread() is not threading.main_thread():
+        return
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        previous = signal.getsignal(sig)
+        if not callable(previous):
+            # SIG_DFL/SIG_IGN: sem servidor tratando o sinal, nada a encadear
+            continue
+
+        def handler(signum, frame, previous=previous):
+            monitor.mark_shutdown()
+            previous(signum, frame)
+
+        signal.signal(sig, handler)
+
+# Instância global do health check
+health_monitor = HealthMonitor(config.VERSION, config.HEALTH_REFRESH_INTERVAL, config.HEALTH_MAX_LOOP_LAG_MS)
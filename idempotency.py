@@ -0,0 +1,310 @@
+"""
+Respostas guardadas por ``Idempotency-Key``
+
+Um POST de predição com ``Idempotency-Key`` tem a resposta (status, headers e
+corpo) guardada por ``IDEMPOTENCY_TTL`` segundos; o reenvio da mesma chave
+recebe a resposta guardada, com ``Idempotent-Replayed: true``, sem ler o
+upload nem passar pelo modelo. Um reenvio que chega enquanto o original ainda
+está em andamento aguarda o resultado dele em vez de rodar de novo.
+
+Memória: dicionário em ordem de inserção (o início expira primeiro, já que o
+TTL é fixo) limitado a ``IDEMPOTENCY_MAX_MEMORY_BYTES``; acima disso as
+entradas mais antigas saem. Com ``IDEMPOTENCY_DB_PATH``, as respostas também
+vão para um SQLite local, consultado quando a chave não está na memória: o
+resultado sobrevive a reinícios e é visto por todos os workers do
+``prefork.py``. O acesso ao SQLite roda em uma thread própria por processo.
+
+Cada resposta guarda também a impressão digital do request (tipo de conteúdo,
+tamanho e SHA-256 do corpo, sem o boundary do multipart, que muda a cada
+envio). A mesma chave com outro corpo recebe 422 em vez da resposta de outra
+imagem. Respostas 5xx, 413 e 429, e as de requests cujo corpo não foi lido
+até o fim, não são guardadas (o cliente deve poder corrigir e tentar de novo).
+As chaves valem por caminho e por API key.
+"""
+
+import asyncio
+import hashlib
+import logging
+import os
+import sqlite3
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, NamedTuple, Optional, Tuple
+
+import orjson
+
+from monitoring import shared_metrics_path
+from production_config import get_config
+from shared_counters import SharedCounters
+
+logger = logging.getLogger(__name__)
+
+# Overhead aproximado de uma entrada além do corpo e dos headers
+_ENTRY_OVERHEAD = 200
+
+# Status que o cliente pode resolver tentando de novo com a mesma chave
+_RETRYABLE_STATUS = frozenset({413, 429})
+
+class RequestFingerprint:
+    """
+    Tamanho e SHA-256 incremental do corpo de um request
+
+    Em multipart, as ocorrências do boundary são removidas antes do hash (um
+    reenvio legítimo costuma usar outro boundary); ``_pending`` guarda o fim
+    do chunk que ainda pode ser o início de um boundary. ``size`` conta os
+    bytes que entraram no hash.
+    """
+
+    def __init__(self, content_type: bytes):
+        media_type, _, params = content_type.partition(b";")
+        self.boundary = b""
+        if media_type.strip().lower().startswith(b"multipart/"):
+            for param in params.split(b";"):
+                name, _, value = param.strip().partition(b"=")
+                if name.lower() == b"boundary":
+                    self.boundary = value.strip(b'"')
+        self.size = 0
+        self.complete = False
+        self._hash = hashlib.sha256(media_type.strip().lower() + b"\0")
+        self._pending = b""
+
+    def update(self, chunk: bytes, more_body: bool):
+        """Acrescenta um chunk do corpo (``more_body=False`` no último)"""
+        if not self.boundary:
+            self._hash_part(chunk)
+        else:
+            data = self._pending + chunk
+            start = 0
+            while True:
+                found = data.find(self.boundary, start)
+                if found < 0:
+                    break
+                self._hash_part(data[start:found])
+                start = found + len(self.boundary)
+            safe_end = len(data) if not more_body else max(start, len(data) - len(self.boundary) + 1)
+            self._hash_part(data[start:safe_end])
+            self._pending = data[safe_end:]
+        if not more_body:
+            self.complete = True
+
+    def _hash_part(self, data: bytes):
+        self.size += len(data)
+        self._hash.update(data)
+
+    def digest(self) -> str:
+        """``"<bytes>:<sha256>"`` do corpo lido até aqui"""
+        return f"{self.size}:{self._hash.hexdigest()}"
+
+class StoredResponse(NamedTuple):
+    """Resposta guardada de um request idempotente"""
+    expires_at: float
+    status: int
+    headers: List[Tuple[bytes, bytes]]
+    body: bytes
+    request_digest: str
+
+    def size(self) -> int:
+        """Bytes contados no orçamento de memória"""
+        return len(self.body) + sum(len(name) + len(value) for name, value in self.headers) + _ENTRY_OVERHEAD
+
+class _SQLiteTier:
+    """Respostas em SQLite local (conexão e thread próprias de cada processo)"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._connection: Optional[sqlite3.Connection] = None
+        self._writes = 0
+
+    async def get(self, key: str) -> Optional[StoredResponse]:
+        return await self._run(self._get, key)
+
+    async def put(self, key: str, response: StoredResponse):
+        await self._run(self._put, key, response)
+
+    async def _run(self, func, *args):
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="idempotency-db")
+        return await asyncio.get_running_loop().run_in_executor(self._executor, func, *args)
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._connection is None:
+            self._connection = sqlite3.connect(self.path, timeout=5)
+            self._connection.execute("PRAGMA journal_mode=WAL")
+            self._connection.execute("PRAGMA synchronous=NORMAL")
+            self._connection.execute(
+                "CREATE TABLE IF NOT EXISTS responses "
+                "(key TEXT PRIMARY KEY, expires_at REAL, status INTEGER, headers BLOB, body BLOB, request_digest TEXT)"
+            )
+        return self._connection
+
+    def _get(self, key: str) -> Optional[StoredResponse]:
+        row = self._connect().execute(
+            "SELECT expires_at, status, headers, body, request_digest FROM responses WHERE key = ? AND expires_at > ?",
+            (key, time.time())
+        ).fetchone()
+        if row is None:
+            return None
+        headers = [(name.encode("latin-1"), value.encode("latin-1")) for name, value in orjson.loads(row[2])]
+        return StoredResponse(row[0], row[1], headers, row[3], row[4])
+
+    def _put(self, key: str, response: StoredResponse):
+        connection = self._connect()
+        headers = orjson.dumps([(name.decode("latin-1"), value.decode("latin-1")) for name, value in response.headers])
+        with connection:
+            connection.execute(
+                "INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?)",
+                (key, response.expires_at, response.status, headers, response.body, response.request_digest)
+            )
+            # Limpeza das expiradas a cada 1000 escritas
+            self._writes += 1
+            if self._writes % 1000 == 0:
+                connection.execute("DELETE FROM responses WHERE expires_at <= ?", (time.time(),))
+
+    def after_fork(self):
+        """Conexão e thread do pai não são usadas no filho"""
+        self._executor = None
+        self._connection = None
+
+class IdempotencyStore:
+    """Respostas por chave na memória (com orçamento) e, opcionalmente, em SQLite"""
+
+    def __init__(self, ttl: float, max_memory_bytes: int, db_path: Optional[str] = None,
+                 stats_path: Optional[str] = None):
+        self.ttl = ttl
+        self.max_memory_bytes = max_memory_bytes
+        self.memory_bytes = 0
+        self._entries: "OrderedDict[str, StoredResponse]" = OrderedDict()
+        self._pending: Dict[str, asyncio.Future] = {}
+        self.disk = _SQLiteTier(db_path) if db_path else None
+        self.counters = SharedCounters(
+            ("hits_memory", "hits_disk", "misses", "concurrent_waits", "stored", "not_stored", "evicted",
+             "mismatches"),
+            stats_path
+        )
+
+    async def lookup(self, key: str) -> Tuple[Optional[StoredResponse], Optional[asyncio.Future]]:
+        """
+        Resposta guardada da chave, ou a reserva da execução
+
+        Returns:
+            (resposta, None) se já existe resultado; (None, future) se o
+            chamador deve executar o request e chamar ``complete`` com o future
+        """
+        while True:
+            response = self._get_memory(key)
+            if response is not None:
+                self.counters.add("hits_memory")
+                return response, None
+
+            pending = self._pending.get(key)
+            if pending is not None:
+                # Outra execução da mesma chave em andamento: aguardar e reler
+                self.counters.add("concurrent_waits")
+                await asyncio.shield(pending)
+                continue
+
+            # Reservar antes de consultar o disco, para que duplicatas aguardem
+            future = asyncio.get_running_loop().create_future()
+            self._pending[key] = future
+            if self.disk is not None:
+                try:
+                    response = await self.disk.get(key)
+                except sqlite3.Error as e:
+                    logger.warning(f"⚠️ Falha ao ler resposta idempotente do SQLite: {str(e)}")
+                    response = None
+                except BaseException:
+                    self._release(key, future)
+                    raise
+                if response is not None:
+                    self._put_memory(key, response)
+                    self._release(key, future)
+                    self.counters.add("hits_disk")
+                    return response, None
+            self.counters.add("misses")
+            return None, future
+
+    async def complete(self, key: str, future: asyncio.Future, status: Optional[int],
+                       headers: List[Tuple[bytes, bytes]], body: bytes, request_digest: Optional[str]):
+        """
+        Guarda a resposta (se cacheável) e libera quem aguarda a chave
+
+        ``request_digest`` é ``None`` quando o corpo do request não foi lido
+        até o fim: sem impressão digital completa, a resposta não é guardada.
+        """
+        if status is None or status >= 500 or status in _RETRYABLE_STATUS or request_digest is None:
+            self.counters.add("not_stored")
+            self._release(key, future)
+            return
+
+        response = StoredResponse(time.time() + self.ttl, status, headers, body, request_digest)
+        self._put_memory(key, response)
+        self.counters.add("stored")
+        # Quem aguarda já encontra a resposta na memória
+        self._release(key, future)
+        if self.disk is not None:
+            try:
+                await self.disk.put(key, response)
+            except sqlite3.Error as e:
+                logger.warning(f"⚠️ Falha ao gravar resposta idempotente no SQLite: {str(e)}")
+
+    def _release(self, key: str, future: asyncio.Future):
+        """Encerra a reserva da chave e acorda as duplicatas em espera"""
+        if self._pending.get(key) is future:
+            del self._pending[key]
+        if not future.done():
+            future.set_result(None)
+
+    def _get_memory(self, key: str) -> Optional[StoredResponse]:
+        now = time.time()
+        self._evict(lambda entry: entry.expires_at <= now)
+        return self._entries.get(key)
+
+    def _put_memory(self, key: str, response: StoredResponse):
+        previous = self._entries.pop(key, None)
+        if previous is not None:
+            self.memory_bytes -= previous.size()
+        if response.size() > self.max_memory_bytes:
+            return
+        self._entries[key] = response
+        self.memory_bytes += response.size()
+        self._evict(lambda entry: self.memory_bytes > self.max_memory_bytes)
+
+    def _evict(self, should_evict):
+        """Remove entradas pelo início (as mais antigas) enquanto ``should_evict``"""
+        while self._entries:
+            key, entry = next(iter(self._entries.items()))
+            if not should_evict(entry):
+                break
+            del self._entries[key]
+            self.memory_bytes -= entry.size()
+            if entry.expires_at > time.time():
+                self.counters.add("evicted")
+
+    def after_fork(self):
+        """Execuções pendentes pertencem ao event loop do pai"""
+        self._pending = {}
+        if self.disk is not None:
+            self.disk.after_fork()
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Entradas e bytes em memória no worker e contadores somados entre workers"""
+        return {
+            "entries": len(self._entries),
+            "memory_bytes": self.memory_bytes,
+            "max_memory_bytes": self.max_memory_bytes,
+            "in_flight": len(self._pending),
+            "disk_tier": self.disk is not None,
+            **self.counters.totals()
+        }
+
+# Instância global do store de idempotência
+config = get_config()
+idempotency_store = IdempotencyStore(
+    ttl=config.IDEMPOTENCY_TTL,
+    max_memory_bytes=config.IDEMPOTENCY_MAX_MEMORY_BYTES,
+    db_path=config.IDEMPOTENCY_DB_PATH,
+    stats_path=shared_metrics_path("idempotency")
+)
+os.register_at_fork(after_in_child=idempotency_store.after_fork)
@@ -0,0 +1,177 @@
+"""
+Decodificação de imagens otimizada para a resolução de entrada do modelo
+"""
+
+import logging
+import mmap
+import os
+from contextlib import contextmanager
+from typing import BinaryIO, Iterator, NamedTuple, Tuple
+
+from PIL import Image
+
+logger = logging.getLogger(__name__)
+
+# Resolução de entrada do modelo (largura, altura)
+TARGET_SIZE: Tuple[int, int] = (256, 256)
+
+# Modos aceitos por Image.reduce (paleta, bilevel e 16 bits precisam de convert antes)
+_REDUCE_MODES = {"L", "LA", "RGB", "RGBA", "CMYK", "YCbCr", "I", "F"}
+
+# Bits por pixel dos modos aceitos (demais modos são rejeitados antes do decode)
+MODE_BITS = {
+    "1": 1, "L": 8, "P": 8, "LA": 16, "PA": 16, "RGB": 24, "RGBA": 32, "RGBX": 32,
+    "CMYK": 32, "YCbCr": 24, "I;16": 16, "I;16L": 16, "I;16B": 16
+}
+
+# Motivos de recusa na inspeção do cabeçalho (ImageRejectedError.reason)
+REJECT_REASONS = ("unidentified", "decompression_bomb", "invalid_dimensions", "unsupported_mode", "pixel_budget")
+
+# Políticas para imagens acima do orçamento de pixels
+POLICY_REJECT = "reject"
+POLICY_DOWNSAMPLE = "downsample"
+
+class InvalidImageError(ValueError):
+    """Os bytes recebidos não formam uma imagem decodificável"""
+
+class ImageRejectedError(InvalidImageError):
+    """A imagem foi recusada pela inspeção do cabeçalho"""
+
+    def __init__(self, reason: str, message: str):
+        super().__init__(message)
+        self.reason = reason
+
+class ImageHeader(NamedTuple):
+    """Informações lidas apenas do cabeçalho da imagem"""
+    format: str
+    width: int
+    height: int
+    mode: str
+    bits_per_pixel: int
+    decoded_pixels: int  # Pixels efetivamente decodificados (após escala DCT do JPEG)
+
+def inspect_image(source: BinaryIO, max_pixels: int, policy: str = POLICY_DOWNSAMPLE,
+                  target_size: Tuple[int, int] = TARGET_SIZE) -> ImageHeader:
+    """
+    Lê apenas o cabeçalho e aplica o orçamento de pixels antes do decode
+
+    ``Image.open`` é lazy: só o cabeçalho é parseado e nenhum pixel é
+    decodificado. Com a política ``downsample``, JPEGs são avaliados pelo
+    tamanho após o escalonamento DCT que ``decode_image`` vai aplicar; com
+    ``reject``, vale sempre a resolução nativa.
+
+    Args:
+        source: Buffer com os bytes da imagem (a posição é restaurada)
+        max_pixels: Orçamento de pixels por imagem
+        policy: ``reject`` ou ``downsample``
+        target_size: Tamanho mínimo usado no decode
+
+    Returns:
+        ImageHeader com dimensões, modo e profundidade de bits
+
+    Raises:
+        ImageRejectedError: Com ``reason`` igual a ``unidentified``,
+            ``decompression_bomb``, ``invalid_dimensions``, ``unsupported_mode``
+            ou ``pixel_budget``
+    """
+    position = source.tell()
+    try:
+        image = Image.open(source)
+        header_format, (width, height), mode = image.format, image.size, image.mode
+    except Image.DecompressionBombError as e:
+        raise ImageRejectedError("decompression_bomb", str(e)) from e
+    except Exception as e:
+        raise ImageRejectedError("unidentified", str(e)) from e
+    finally:
+        source.seek(position)
+
+    if width <= 0 or height <= 0:
+        raise ImageRejectedError("invalid_dimensions", f"Invalid image dimensions: {width}x{height}")
+
+    if mode not in MODE_BITS:
+        raise ImageRejectedError("unsupported_mode", f"Unsupported image mode: {mode}")
+
+    decoded_pixels = width * height
+    if policy == POLICY_DOWNSAMPLE and header_format == "JPEG":
+        scale = _jpeg_draft_scale(width, height, target_size)
+        decoded_pixels = -(-width // scale) * -(-height // scale)
+
+    if decoded_pixels > max_pixels:
+        raise ImageRejectedError(
+            "pixel_budget",
+            f"Image too large: {width}x{height} exceeds the budget of {max_pixels} pixels"
+        )
+
+    return ImageHeader(header_format, width, height, mode, MODE_BITS[mode], decoded_pixels)
+
+@contextmanager
+def open_mapped(path: str) -> Iterator[mmap.mmap]:
+    """
+    Mapeia um arquivo em memória (somente leitura) para decodificação
+
+    O decoder lê direto das páginas do arquivo, sem copiar o conteúdo inteiro
+    para um buffer Python.
+    """
+    with open(path, "rb") as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            raise InvalidImageError(f"Empty file: {path}")
+        mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    try:
+        yield mapped
+    finally:
+        mapped.close()
+
+def _jpeg_draft_scale(width: int, height: int, target_size: Tuple[int, int]) -> int:
+    """Escala DCT (1, 2, 4 ou 8) que Image.draft escolhe para o tamanho alvo"""
+    scale = 1
+    while scale < 8 and width // (scale * 2) >= target_size[0] and height // (scale * 2) >= target_size[1]:
+        scale *= 2
+    return scale
+
+def decode_image(source: BinaryIO, target_size: Tuple[int, int] = TARGET_SIZE) -> Image.Image:
+    """
+    Decodifica a imagem na menor escala que ainda cobre o tamanho alvo
+
+    Para JPEG, usa o escalonamento DCT do decoder (``Image.draft``), que
+    decodifica direto em 1/2, 1/4 ou 1/8 da resolução nativa. Para os demais
+    formatos, usa o caminho rápido ``Image.reduce`` com o maior fator inteiro
+    que mantém ambos os lados >= ao alvo. O redimensionamento final para
+    ``target_size`` continua sendo feito em ``MLService.preprocess_image``.
+
+    Args:
+        source: Arquivo ou buffer com os bytes da imagem
+        target_size: Tamanho mínimo (largura, altura) a ser preservado
+
+    Returns:
+        Imagem PIL em RGB, já carregada
+
+    Raises:
+        InvalidImageError: Se os bytes não puderem ser decodificados
+    """
+    try:
+        return _decode(source, target_size)
+    except Exception as e:
+        raise InvalidImageError(str(e)) from e
+
+def _decode(source: BinaryIO, target_size: Tuple[int, int]) -> Image.Image:
+    """Implementação de decode_image"""
+    image = Image.open(source)
+
+    # JPEG: o decoder escolhe a menor escala DCT >= target_size e já entrega RGB
+    if image.format == "JPEG":
+        image.draft("RGB", target_size)
+
+    image.load()
+
+    # Redução inteira para o que o draft não cobriu (PNG, JPEG com escala limitada)
+    factor = min(image.width // target_size[0], image.height // target_size[1])
+    if factor >= 2:
+        if image.mode not in _REDUCE_MODES:
+            image = image.convert("RGB")
+        image = image.reduce(factor)
+
+    # Converter para RGB se necessário
+    if image.mode != "RGB":
+        image = image.convert("RGB")
+
+    return image
@@ -0,0 +1,36 @@
+# -*- coding: utf-8 -*-
+# Generated by the protocol buffer compiler.  DO NOT EDIT!
+# source: inference.proto
+# Protobuf Python Version: 4.25.1
+"""Generated protocol buffer code."""
+from google.protobuf import descriptor as _descriptor
+from google.protobuf import descriptor_pool as _descriptor_pool
+from google.protobuf import symbol_database as _symbol_database
+from google.protobuf.internal import builder as _builder
+# @@protoc_insertion_point(imports)
+
+_sym_db = _symbol_database.Default()
+
+
+
+
+DESCRIPTOR = _descriptor_pool.Default().AddSerializedFile(b'\n\x0finference.proto\x12\reyedisease.v1\"(\n\tRawTensor\x12\x0c\n\x04\x64\x61ta\x18\x01 \x01(\x0c\x12\r\n\x05shape\x18\x02 \x03(\r\"j\n\x0ePredictRequest\x12\x12\n\nrequest_id\x18\x01 \x01(\t\x12\x0f\n\x05image\x18\x02 \x01(\x0cH\x00\x12*\n\x06tensor\x18\x03 \x01(\x0b\x32\x18.eyedisease.v1.RawTensorH\x00\x42\x07\n\x05input\"\xe5\x01\n\x0fPredictResponse\x12\x12\n\nrequest_id\x18\x01 \x01(\t\x12\x17\n\x0fpredicted_class\x18\x02 \x01(\t\x12\x12\n\nconfidence\x18\x03 \x01(\x02\x12K\n\x0f\x61ll_predictions\x18\x04 \x03(\x0b\x32\x32.eyedisease.v1.PredictResponse.AllPredictionsEntry\x12\r\n\x05\x65rror\x18\x05 \x01(\t\x1a\x35\n\x13\x41llPredictionsEntry\x12\x0b\n\x03key\x18\x01 \x01(\t\x12\r\n\x05value\x18\x02 \x01(\x02:\x02\x38\x01\x32\xb4\x01\n\x14\x45yeDiseaseClassifier\x12H\n\x07Predict\x12\x1d.eyedisease.v1.PredictRequest\x1a\x1e.eyedisease.v1.PredictResponse\x12R\n\rPredictStream\x12\x1d.eyedisease.v1.PredictRequest\x1a\x1e.eyedisease.v1.PredictResponse(\x01\x30\x01\x62\x06proto3')
+
+_globals = globals()
+_builder.BuildMessageAndEnumDescriptors(DESCRIPTOR, _globals)
+_builder.BuildTopDescriptorsAndMessages(DESCRIPTOR, 'inference_pb2', _globals)
+if _descriptor._USE_C_DESCRIPTORS == False:
+  DESCRIPTOR._options = None
+  _globals['_PREDICTRESPONSE_ALLPREDICTIONSENTRY']._options = None
+  _globals['_PREDICTRESPONSE_ALLPREDICTIONSENTRY']._serialized_options = b'8\001'
+  _globals['_RAWTENSOR']._serialized_start=34
+  _globals['_RAWTENSOR']._serialized_end=74
+  _globals['_PREDICTREQUEST']._serialized_start=76
+  _globals['_PREDICTREQUEST']._serialized_end=182
+  _globals['_PREDICTRESPONSE']._serialized_start=185
+  _globals['_PREDICTRESPONSE']._serialized_end=414
+  _globals['_PREDICTRESPONSE_ALLPREDICTIONSENTRY']._serialized_start=361
+  _globals['_PREDICTRESPONSE_ALLPREDICTIONSENTRY']._serialized_end=414
+  _globals['_EYEDISEASECLASSIFIER']._serialized_start=417
+  _globals['_EYEDISEASECLASSIFIER']._serialized_end=597
+# @@protoc_insertion_point(module_scope)
@@ -0,0 +1,102 @@
+# Generated by the gRPC Python protocol compiler plugin. DO NOT EDIT!
+"""Client and server classes corresponding to protobuf-defined services."""
+import grpc
+
+import inference_pb2 as inference__pb2
+
+
+class EyeDiseaseClassifierStub(object):
+    """Missing associated documentation comment in .proto file."""
+
+    def __init__(self, channel):
+        """Constructor.
+
+        Args:
+            channel: A grpc.Channel.
+        """
+        self.Predict = channel.unary_unary(
+                '/eyedisease.v1.EyeDiseaseClassifier/Predict',
+                request_serializer=inference__pb2.PredictRequest.SerializeToString,
+                response_deserializer=inference__pb2.PredictResponse.FromString,
+                )
+        self.PredictStream = channel.stream_stream(
+                '/eyedisease.v1.EyeDiseaseClassifier/PredictStream',
+                request_serializer=inference__pb2.PredictRequest.SerializeToString,
+                response_deserializer=inference__pb2.PredictResponse.FromString,
+                )
+
+
+class EyeDiseaseClassifierServicer(object):
+    """Missing associated documentation comment in .proto file."""
+
+    def Predict(self, request, context):
+        """Classifica uma imagem
+        """
+        context.set_code(grpc.StatusCode.UNIMPLEMENTED)
+        context.set_details('Method not implemented!')
+        raise NotImplementedError('Method not implemented!')
+
+    def PredictStream(self, request_iterator, context):
+        """Stream bidirecional: as respostas saem na ordem em que as predições
+        terminam; use request_id para correlacioná-las
+        """
+        context.set_code(grpc.StatusCode.UNIMPLEMENTED)
+        context.set_details('Method not implemented!')
+        raise NotImplementedError('Method not implemented!')
+
+
+def add_EyeDiseaseClassifierServicer_to_server(servicer, server):
+    rpc_method_handlers = {
+            'Predict': grpc.unary_unary_rpc_method_handler(
+                    servicer.Predict,
+                    request_deserializer=inference__pb2.PredictRequest.FromString,
+                    response_serializer=inference__pb2.PredictResponse.SerializeToString,
+            ),
+            'PredictStream': grpc.stream_stream_rpc_method_handler(
+                    servicer.PredictStream,
+                    request_deserializer=inference__pb2.PredictRequest.FromString,
+                    response_serializer=inference__pb2.PredictResponse.SerializeToString,
+            ),
+    }
+    generic_handler = grpc.method_handlers_generic_handler(
+            'eyedisease.v1.EyeDiseaseClassifier', rpc_method_handlers)
+    server.add_generic_rpc_handlers((generic_handler,))
+
+
+ # This class is part of an EXPERIMENTAL API.
+class EyeDiseaseClassifier(object):
+    """Missing associated documentation comment in .proto file."""
+
+    @staticmethod
+    def Predict(request,
+            target,
+            options=(),
+            channel_credentials=None,
+            call_credentials=None,
+            insecure=False,
+            compression=None,
+            wait_for_ready=None,
+            timeout=None,
+            metadata=None):
+        return grpc.experimental.unary_unary(request, target, '/eyedisease.v1.EyeDiseaseClassifier/Predict',
+            inference__pb2.PredictRequest.SerializeToString,
+            inference__pb2.PredictResponse.FromString,
+            options, channel_credentials,
+            insecure, call_credentials, compression, wait_for_ready, timeout, metadata)
+
+    @staticmethod
+    def PredictStream(request_iterator,
+            target,
+            options=(),
+            channel_credentials=None,
+            call_credentials=None,
+            insecure=False,
+            compression=None,
+            wait_for_ready=None,
+            timeout=None,
+            metadata=None):
+        return grpc.experimental.stream_stream(request_iterator, target, '/eyedisease.v1.EyeDiseaseClassifier/PredictStream',
+            inference__pb2.PredictRequest.SerializeToString,
+            inference__pb2.PredictResponse.FromString,
+            options, channel_credentials,
+            insecure, call_credentials, compression, wait_for_ready, timeout, metadata)
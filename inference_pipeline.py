@@ -0,0 +1,442 @@
+"""
+Pipeline de inferência em estágios: decode/preprocess em paralelo com o modelo
+
+Estágio 1: thread pool de preprocessamento (decode PIL + resize, que liberam a GIL)
+Estágio 2: batcher que agrupa tensores prontos e roda o modelo em uma thread dedicada
+
+Enquanto um batch está no modelo, as próximas imagens já estão sendo
+decodificadas e enfileiradas para o batch seguinte.
+
+No shutdown, ``drain`` para de aceitar itens e espera os que já foram
+admitidos (preprocessamento, fila e batch atual) antes de ``stop``; o que não
+terminar no prazo recebe ``PipelineClosedError``.
+"""
+
+import asyncio
+import logging
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, BinaryIO, Callable, Dict, List, Optional, Set, Tuple
+
+import numpy as np
+
+from image_processing import decode_image, open_mapped
+from ml_service import ml_service
+from monitoring import RequestTiming, get_request_timing, latency_histograms
+from production_config import get_config
+
+logger = logging.getLogger(__name__)
+
+class PipelineClosedError(RuntimeError):
+    """O pipeline está drenando ou encerrado e não aceita novos itens"""
+
+class StageStats:
+    """Tempo acumulado e utilização de um estágio do pipeline"""
+
+    def __init__(self, workers: Optional[int] = None):
+        self.workers = workers
+        self.count = 0
+        self.busy_time = 0.0
+        self.max_time = 0.0
+        self.start_time = time.time()
+        self._lock = threading.Lock()
+
+    def record(self, elapsed: float):
+        """Registra uma execução do estágio"""
+        with self._lock:
+            self.count += 1
+            self.busy_time += elapsed
+            self.max_time = max(self.max_time, elapsed)
+
+    def get_stats(self) -> Dict[str, float]:
+        """Retorna tempo médio/máximo e utilização (tempo ocupado / capacidade)"""
+        uptime = time.time() - self.start_time
+        stats = {
+            "count": self.count,
+            "avg_ms": round(self.busy_time / self.count * 1000, 2) if self.count > 0 else 0,
+            "max_ms": round(self.max_time * 1000, 2),
+            "busy_seconds": round(self.busy_time, 2)
+        }
+        if self.workers:
+            stats["workers"] = self.workers
+            stats["utilization"] = round(self.busy_time / (uptime * self.workers), 4) if uptime > 0 else 0
+        return stats
+
+class TensorArena:
+    """
+    Buffer de entrada float32 preallocado, com um slot por request em andamento
+
+    O preprocessamento escreve cada imagem direto no seu slot; quando os slots
+    de um batch são consecutivos o modelo recebe uma view do buffer, senão os
+    slots são copiados para um buffer de staging também preallocado. Se todos
+    os slots estiverem ocupados, um array avulso é alocado e contado em
+    ``fallbacks``.
+    """
+
+    def __init__(self, slots: int, max_batch_size: int, shape: Tuple[int, ...] = (256, 256, 3)):
+        self.shape = shape
+        self.buffer = np.empty((slots, *shape), dtype=np.float32)
+        self.staging = np.empty((max_batch_size, *shape), dtype=np.float32)
+        self.fallbacks = 0
+        self._free = deque(range(slots))
+        self._lock = threading.Lock()
+
+    def acquire(self) -> Tuple[Optional[int], np.ndarray]:
+        """Reserva um slot; retorna (índice, view) ou (None, array avulso)"""
+        with self._lock:
+            if self._free:
+                slot = self._free.popleft()
+                return slot, self.buffer[slot]
+            self.fallbacks += 1
+        return None, np.empty(self.shape, dtype=np.float32)
+
+    def release(self, slot: Optional[int]):
+        """Devolve um slot ao arena"""
+        if slot is not None:
+            with self._lock:
+                self._free.append(slot)
+
+    def assemble(self, items: List["_PendingItem"]) -> np.ndarray:
+        """Monta o batch de entrada do modelo sem alocar memória"""
+        slots = [item.slot for item in items]
+        first = slots[0]
+        if first is not None and slots == list(range(first, first + len(slots))):
+            return self.buffer[first:first + len(slots)]
+
+        batch = self.staging[:len(items)]
+        for i, item in enumerate(items):
+            np.copyto(batch[i], item.tensor)
+        return batch
+
+    def get_stats(self) -> Dict[str, int]:
+        """Ocupação do arena"""
+        return {
+            "slots": len(self.buffer),
+            "in_use": len(self.buffer) - len(self._free),
+            "fallbacks": self.fallbacks
+        }
+
+class _PendingItem:
+    """Tensor preprocessado aguardando um batch"""
+
+    __slots__ = ("slot", "tensor", "future", "timing", "enqueued_at")
+
+    def __init__(self, slot: Optional[int], tensor: np.ndarray, future: asyncio.Future, timing: RequestTiming):
+        self.slot = slot
+        self.tensor = tensor
+        self.future = future
+        self.timing = timing
+        self.enqueued_at = time.perf_counter()
+
+class InferencePipeline:
+    """Pipeline com preprocessamento em thread pool e inferência em batch"""
+
+    def __init__(self, service, preprocess_workers: int, max_batch_size: int, batch_timeout_ms: float,
+                 arena_slots: int):
+        self.service = service
+        self.preprocess_workers = preprocess_workers
+        self.max_batch_size = max_batch_size
+        self.batch_timeout = batch_timeout_ms / 1000
+        self.arena = TensorArena(arena_slots, max_batch_size)
+
+        self.preprocess_executor: Optional[ThreadPoolExecutor] = None
+        self.inference_executor: Optional[ThreadPoolExecutor] = None
+        self.queue: Optional[asyncio.Queue] = None
+        self._batch_task: Optional[asyncio.Task] = None
+        self.accepting = False
+        # Futures de itens admitidos e ainda sem resultado
+        self._in_flight: Set[asyncio.Future] = set()
+        self._idle: Optional[asyncio.Event] = None
+
+        self.preprocess_stats = StageStats(preprocess_workers)
+        self.queue_wait_stats = StageStats()
+        self.inference_stats = StageStats(1)
+        self.batch_count = 0
+        self.batched_items = 0
+
+    async def start(self):
+        """Cria os executores e inicia o batcher no event loop atual"""
+        self.preprocess_executor = ThreadPoolExecutor(
+            max_workers=self.preprocess_workers, thread_name_prefix="preprocess"
+        )
+        self.inference_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="inference")
+        self.queue = asyncio.Queue()
+        self._idle = asyncio.Event()
+        self._idle.set()
+        self._batch_task = asyncio.create_task(self._batch_loop())
+        self.accepting = True
+        logger.info(
+            f"✅ Pipeline de inferência iniciado (preprocess_workers={self.preprocess_workers}, "
+            f"max_batch_size={self.max_batch_size}, batch_timeout_ms={self.batch_timeout * 1000:.1f})"
+        )
+
+    @property
+    def in_flight(self) -> int:
+        """Predições admitidas e ainda sem resultado"""
+        return len(self._in_flight)
+
+    async def drain(self, timeout: float) -> Dict[str, Any]:
+        """
+        Para de aceitar itens e aguarda os já admitidos por até ``timeout`` segundos
+
+        Returns:
+            Dict com ``drained`` (concluídos), ``abandoned`` (ainda pendentes,
+            falham no ``stop``) e ``duration_seconds``
+        """
+        self.accepting = False
+        pending = len(self._in_flight)
+        start = time.perf_counter()
+        if pending:
+            logger.info(f"⏳ Drenando pipeline de inferência ({pending} predições em andamento)")
+            try:
+                await asyncio.wait_for(self._idle.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+
+        abandoned = len(self._in_flight)
+        stats = {
+            "drained": pending - abandoned,
+            "abandoned": abandoned,
+            "duration_seconds": round(time.perf_counter() - start, 3)
+        }
+        if abandoned:
+            logger.warning(f"⚠️ Drenagem excedeu {timeout}s: {abandoned} predições abandonadas")
+        return stats
+
+    async def stop(self):
+        """Interrompe o batcher, falha os itens pendentes e libera os executores"""
+        self.accepting = False
+        if self._batch_task:
+            self._batch_task.cancel()
+            try:
+                await self._batch_task
+            except asyncio.CancelledError:
+                pass
+            self._batch_task = None
+
+        # Itens na fila ou no preprocessamento não terão mais resultado
+        closed = PipelineClosedError("Inference pipeline stopped")
+        while self.queue is not None and not self.queue.empty():
+            self.arena.release(self.queue.get_nowait().slot)
+        for future in list(self._in_flight):
+            _set_exception(future, closed)
+
+        if self.preprocess_executor:
+            self.preprocess_executor.shutdown(wait=False, cancel_futures=True)
+        if self.inference_executor:
+            self.inference_executor.shutdown(wait=False, cancel_futures=True)
+
+        logger.info("🛑 Pipeline de inferência encerrado")
+
+    async def submit(self, source: BinaryIO) -> Tuple[str, float, Dict[str, float]]:
+        """
+        Decodifica, preprocessa e classifica uma imagem
+
+        Args:
+            source: Buffer com os bytes da imagem
+
+        Returns:
+            Tuple contendo (classe_predita, confiança, todas_predições)
+        """
+        def fill(tensor: np.ndarray, timing: RequestTiming):
+            with timing.stage("decode"):
+                image = decode_image(source)
+            with timing.stage("preprocess"):
+                self.service.preprocess_image(image, out=tensor)
+
+        return await self._submit(fill)
+
+    async def submit_path(self, path: str,
+                          inspect: Optional[Callable[[BinaryIO], Any]] = None) -> Tuple[str, float, Dict[str, float]]:
+        """
+        Classifica um arquivo local, decodificado via mmap no thread pool
+
+        Args:
+            path: Caminho já validado do arquivo
+            inspect: Verificação opcional do cabeçalho antes do decode
+
+        Returns:
+            Tuple contendo (classe_predita, confiança, todas_predições)
+        """
+        def fill(tensor: np.ndarray, timing: RequestTiming):
+            with open_mapped(path) as source:
+                with timing.stage("decode"):
+                    if inspect:
+                        inspect(source)
+                    image = decode_image(source)
+                with timing.stage("preprocess"):
+                    self.service.preprocess_image(image, out=tensor)
+
+        return await self._submit(fill)
+
+    async def submit_array(self, pixels: np.ndarray) -> Tuple[str, float, Dict[str, float]]:
+        """
+        Classifica uma imagem já decodificada e redimensionada
+
+        Args:
+            pixels: Array uint8 (256, 256, 3), tipicamente uma view do corpo do request
+
+        Returns:
+            Tuple contendo (classe_predita, confiança, todas_predições)
+        """
+        def fill(tensor: np.ndarray, timing: RequestTiming):
+            with timing.stage("preprocess"):
+                np.copyto(tensor, pixels)
+
+        return await self._submit(fill)
+
+    async def _submit(self, fill: Callable[[np.ndarray, RequestTiming], Any]) -> Tuple[str, float, Dict[str, float]]:
+        """
+        Agenda o preenchimento de um slot no pool e aguarda o resultado do batch
+
+        O timing do request (ou um avulso, fora de HTTP) segue junto com o item,
+        já que o contexto não é propagado para as threads dos executores.
+        """
+        if not self.accepting:
+            raise PipelineClosedError("Inference pipeline is shutting down")
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        timing = get_request_timing() or RequestTiming()
+        self._in_flight.add(future)
+        self._idle.clear()
+        try:
+            self.preprocess_executor.submit(self._preprocess, fill, timing, future, loop)
+            return await future
+        finally:
+            self._in_flight.discard(future)
+            if not self._in_flight:
+                self._idle.set()
+
+    def _preprocess(self, fill: Callable[[np.ndarray, RequestTiming], Any], timing: RequestTiming,
+                    future: asyncio.Future, loop: asyncio.AbstractEventLoop):
+        """
+        Estágio 1 (thread pool): decode + resize direto no slot do arena
+
+        O item é enfileirado pela própria thread, assim o slot sempre chega ao
+        batcher (que o libera) mesmo se o request for cancelado no meio.
+        """
+        start = time.perf_counter()
+        slot, tensor = self.arena.acquire()
+        try:
+            fill(tensor, timing)
+        except Exception as e:
+            self.arena.release(slot)
+            loop.call_soon_threadsafe(_set_exception, future, e)
+            return
+        finally:
+            self.preprocess_stats.record(time.perf_counter() - start)
+
+        loop.call_soon_threadsafe(self.queue.put_nowait, _PendingItem(slot, tensor, future, timing))
+
+    async def _collect_batch(self) -> List[_PendingItem]:
+        """Aguarda o primeiro item e completa o batch até o tamanho ou timeout"""
+        loop = asyncio.get_running_loop()
+        batch = [await self.queue.get()]
+        deadline = loop.time() + self.batch_timeout
+
+        while len(batch) < self.max_batch_size:
+            if not self.queue.empty():
+                batch.append(self.queue.get_nowait())
+                continue
+
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self.queue.get(), remaining))
+            except asyncio.TimeoutError:
+                break
+
+        return batch
+
+    async def _batch_loop(self):
+        """Estágio 2: agrupa tensores prontos e roda o modelo"""
+        loop = asyncio.get_running_loop()
+
+        while True:
+            batch = await self._collect_batch()
+
+            # Descartar requests cancelados enquanto aguardavam na fila
+            now = time.perf_counter()
+            ready = []
+            for item in batch:
+                if item.future.cancelled():
+                    self.arena.release(item.slot)
+                    continue
+                self.queue_wait_stats.record(now - item.enqueued_at)
+                item.timing.record("queue_wait", now - item.enqueued_at)
+                ready.append(item)
+            if not ready:
+                continue
+
+            start = time.perf_counter()
+            try:
+                tensors = self.arena.assemble(ready)
+                results, inference_time, postprocess_time = await loop.run_in_executor(
+                    self.inference_executor, self._run_batch, tensors
+                )
+            except Exception as e:
+                for item in ready:
+                    _set_exception(item.future, e)
+                continue
+            finally:
+                self.inference_stats.record(time.perf_counter() - start)
+                for item in ready:
+                    self.arena.release(item.slot)
+
+            self.batch_count += 1
+            self.batched_items += len(ready)
+            latency_histograms.observe_batch(len(ready))
+
+            # Requests com várias imagens no mesmo batch contam o batch uma vez só
+            for timing in {id(item.timing): item.timing for item in ready}.values():
+                timing.record("inference", inference_time)
+                timing.record("postprocess", postprocess_time)
+
+            for item, result in zip(ready, results):
+                if not item.future.done():
+                    item.future.set_result(result)
+
+    def _run_batch(self, tensors: np.ndarray) -> Tuple[List[Tuple[str, float, Dict[str, float]]], float, float]:
+        """Inferência + pós-processamento na thread de inferência, com o tempo de cada um"""
+        start = time.perf_counter()
+        predictions = self.service.infer_batch(tensors)
+        inference_time = time.perf_counter() - start
+
+        start = time.perf_counter()
+        results = self.service.postprocess_batch(predictions, inference_time)
+        return results, inference_time, time.perf_counter() - start
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Tempo e utilização por estágio, para dimensionar os pools"""
+        return {
+            "queue_depth": self.queue.qsize() if self.queue else 0,
+            "in_flight": self.in_flight,
+            "accepting": self.accepting,
+            "batches": self.batch_count,
+            "avg_batch_size": round(self.batched_items / self.batch_count, 2) if self.batch_count > 0 else 0,
+            "max_batch_size": self.max_batch_size,
+            "arena": self.arena.get_stats(),
+            "stages": {
+                "preprocess": self.preprocess_stats.get_stats(),
+                "queue_wait": self.queue_wait_stats.get_stats(),
+                "inference": self.inference_stats.get_stats()
+            }
+        }
+
+def _set_exception(future: asyncio.Future, exc: Exception):
+    """Propaga a exceção para o request, se ele ainda estiver aguardando"""
+    if not future.done():
+        future.set_exception(exc)
+
+# Instância global do pipeline
+config = get_config()
+inference_pipeline = InferencePipeline(
+    ml_service,
+    preprocess_workers=config.PREPROCESS_WORKERS,
+    max_batch_size=config.MAX_BATCH_SIZE,
+    batch_timeout_ms=config.BATCH_TIMEOUT_MS,
+    arena_slots=config.ARENA_SLOTS
+)
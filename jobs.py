@@ -0,0 +1,417 @@
+"""
+Jobs assíncronos de classificação em lote, com fila persistente em SQLite
+
+``POST /jobs`` (caminhos) ou ``POST /jobs/images`` (uploads) grava o job e
+seus itens em ``JOBS_DB_PATH`` e devolve o id na hora. Um ``JobRunner`` por
+worker pega itens pendentes em rodadas de ``JOB_BATCH_SIZE`` e os envia ao
+mesmo pipeline das predições síncronas, mas só quando o tráfego ao vivo deixa
+o pipeline ocioso (no máximo ``JOB_IDLE_THRESHOLD`` predições em andamento):
+uma predição ao vivo espera, no pior caso, uma rodada de job à sua frente.
+
+Cada rodada reserva os itens com um lease (``JOB_CLAIM_LEASE``) em uma
+transação, então vários workers do ``prefork.py`` dividem a fila sem repetir
+itens. Resultados são gravados por rodada; um job interrompido (shutdown,
+crash) continua dos itens ainda pendentes: no encerramento as reservas são
+devolvidas e, após um crash, o lease expira. Cada reserva conta uma tentativa
+do item; um item que falha fora das verificações da imagem (erro inesperado,
+falha do pipeline ou crash do worker) volta à fila até ``JOB_MAX_ATTEMPTS``
+tentativas e então é concluído com erro, sem travar a fila.
+
+O acesso ao SQLite roda em uma thread própria por processo.
+"""
+
+import asyncio
+import io
+import logging
+import os
+import sqlite3
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from functools import partial
+from typing import Any, Dict, List, NamedTuple, Optional, Tuple
+
+import orjson
+
+from image_processing import ImageRejectedError, InvalidImageError, inspect_image
+from inference_pipeline import PipelineClosedError, inference_pipeline
+from monitoring import metrics
+from path_input import PathNotAllowedError, resolve_allowed_path
+from production_config import get_config
+
+logger = logging.getLogger(__name__)
+config = get_config()
+
+_SCHEMA = (
+    """CREATE TABLE IF NOT EXISTS jobs (
+        id TEXT PRIMARY KEY,
+        status TEXT NOT NULL,
+        total INTEGER NOT NULL,
+        succeeded INTEGER NOT NULL DEFAULT 0,
+        failed INTEGER NOT NULL DEFAULT 0,
+        created_at TEXT NOT NULL,
+        started_at TEXT,
+        finished_at TEXT
+    )""",
+    """CREATE TABLE IF NOT EXISTS items (
+        id INTEGER PRIMARY KEY,
+        job_id TEXT NOT NULL,
+        position INTEGER NOT NULL,
+        source TEXT NOT NULL,
+        path TEXT,
+        image BLOB,
+        status TEXT NOT NULL DEFAULT 'pending',
+        claimed_by INTEGER,
+        claimed_until REAL,
+        attempts INTEGER NOT NULL DEFAULT 0,
+        result BLOB
+    )""",
+    "CREATE INDEX IF NOT EXISTS items_status ON items (status, id)",
+    "CREATE INDEX IF NOT EXISTS items_job ON items (job_id, position)",
+)
+
+class JobItem(NamedTuple):
+    """Item reservado para processamento"""
+    id: int
+    job_id: str
+    source: str
+    path: Optional[str]
+    image: Optional[bytes]
+    attempts: int  # Inclui a reserva atual
+
+class JobStore:
+    """Jobs e itens em SQLite (conexão e thread próprias de cada processo)"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._connection: Optional[sqlite3.Connection] = None
+        os.register_at_fork(after_in_child=self._after_fork)
+
+    async def _run(self, func, *args):
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="jobs-db")
+        return await asyncio.get_running_loop().run_in_executor(self._executor, func, *args)
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._connection is None:
+            self._connection = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            self._connection.execute("PRAGMA journal_mode=WAL")
+            self._connection.execute("PRAGMA synchronous=NORMAL")
+            for statement in _SCHEMA:
+                self._connection.execute(statement)
+            # Arquivos criados antes da contagem de tentativas
+            columns = {row[1] for row in self._connection.execute("PRAGMA table_info(items)")}
+            if "attempts" not in columns:
+                self._connection.execute("ALTER TABLE items ADD COLUMN attempts INTEGER NOT NULL DEFAULT 0")
+        return self._connection
+
+    def _after_fork(self):
+        """Conexão e thread do pai não são usadas no filho"""
+        self._executor = None
+        self._connection = None
+
+    async def create(self, items: List[Tuple[str, Optional[str], Optional[bytes]]]) -> Dict[str, Any]:
+        """Grava um job com itens (origem exibida, caminho resolvido, bytes da imagem)"""
+        return await self._run(self._create, items)
+
+    def _create(self, items: List[Tuple[str, Optional[str], Optional[bytes]]]) -> Dict[str, Any]:
+        job_id = uuid.uuid4().hex
+        connection = self._connect()
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            connection.execute(
+                "INSERT INTO jobs (id, status, total, created_at) VALUES (?, 'queued', ?, ?)",
+                (job_id, len(items), datetime.utcnow().isoformat())
+            )
+            connection.executemany(
+                "INSERT INTO items (job_id, position, source, path, image) VALUES (?, ?, ?, ?, ?)",
+                ((job_id, position, source, path, image) for position, (source, path, image) in enumerate(items))
+            )
+            connection.execute("COMMIT")
+        except BaseException:
+            connection.execute("ROLLBACK")
+            raise
+        return self._get(job_id)
+
+    async def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """Estado e progresso de um job"""
+        return await self._run(self._get, job_id)
+
+    def _get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        row = self._connect().execute(
+            "SELECT id, status, total, succeeded, failed, created_at, started_at, finished_at FROM jobs WHERE id = ?",
+            (job_id,)
+        ).fetchone()
+        if row is None:
+            return None
+        job = dict(zip(("job_id", "status", "total", "succeeded", "failed", "created_at", "started_at",
+                        "finished_at"), row))
+        job["completed"] = job["succeeded"] + job["failed"]
+        return job
+
+    async def results(self, job_id: str, offset: int, limit: int) -> List[Dict[str, Any]]:
+        """Resultados dos itens concluídos, na ordem de entrada"""
+        return await self._run(self._results, job_id, offset, limit)
+
+    def _results(self, job_id: str, offset: int, limit: int) -> List[Dict[str, Any]]:
+        rows = self._connect().execute(
+            "SELECT position, source, result FROM items WHERE job_id = ? AND status = 'done' "
+            "ORDER BY position LIMIT ? OFFSET ?",
+            (job_id, limit, offset)
+        ).fetchall()
+        return [{"index": position, "source": source, **orjson.loads(result)} for position, source, result in rows]
+
+    async def claim(self, limit: int, lease: float) -> List[JobItem]:
+        """Reserva até ``limit`` itens pendentes (ou com lease expirado), jobs mais antigos primeiro"""
+        return await self._run(self._claim, limit, lease)
+
+    def _claim(self, limit: int, lease: float) -> List[JobItem]:
+        connection = self._connect()
+        now = time.time()
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            rows = connection.execute(
+                "SELECT id, job_id, source, path, image, attempts + 1 FROM items "
+                "WHERE status = 'pending' OR (status = 'claimed' AND claimed_until < ?) ORDER BY id LIMIT ?",
+                (now, limit)
+            ).fetchall()
+            connection.executemany(
+                "UPDATE items SET status = 'claimed', claimed_by = ?, claimed_until = ?, attempts = attempts + 1 "
+                "WHERE id = ?",
+                ((os.getpid(), now + lease, row[0]) for row in rows)
+            )
+            connection.executemany(
+                "UPDATE jobs SET status = 'running', started_at = ? WHERE id = ? AND status = 'queued'",
+                ((datetime.utcnow().isoformat(), job_id) for job_id in {row[1] for row in rows})
+            )
+            connection.execute("COMMIT")
+        except BaseException:
+            connection.execute("ROLLBACK")
+            raise
+        return [JobItem(*row) for row in rows]
+
+    async def complete(self, results: List[Tuple[JobItem, Dict[str, Any]]]):
+        """Grava os resultados de uma rodada e fecha os jobs sem itens restantes"""
+        await self._run(self._complete, results)
+
+    def _complete(self, results: List[Tuple[JobItem, Dict[str, Any]]]):
+        connection = self._connect()
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            counts: Dict[str, List[int]] = {}
+            for item, result in results:
+                # A imagem não é mais necessária: o espaço volta para o arquivo
+                updated = connection.execute(
+                    "UPDATE items SET status = 'done', result = ?, image = NULL, claimed_by = NULL, "
+                    "claimed_until = NULL WHERE id = ? AND status = 'claimed'",
+                    (orjson.dumps(result), item.id)
+                ).rowcount
+                if updated:
+                    succeeded, failed = counts.setdefault(item.job_id, [0, 0])
+                    counts[item.job_id] = [succeeded + ("error" not in result), failed + ("error" in result)]
+            for job_id, (succeeded, failed) in counts.items():
+                connection.execute(
+                    "UPDATE jobs SET succeeded = succeeded + ?, failed = failed + ? WHERE id = ?",
+                    (succeeded, failed, job_id)
+                )
+                connection.execute(
+                    "UPDATE jobs SET status = 'completed', finished_at = ? "
+                    "WHERE id = ? AND succeeded + failed >= total",
+                    (datetime.utcnow().isoformat(), job_id)
+                )
+            connection.execute("COMMIT")
+        except BaseException:
+            connection.execute("ROLLBACK")
+            raise
+
+    async def release(self, items: Optional[List[JobItem]] = None):
+        """Devolve à fila os itens reservados por este processo (todos, ou só ``items``)"""
+        await self._run(self._release, items)
+
+    def _release(self, items: Optional[List[JobItem]]):
+        connection = self._connect()
+        query = "UPDATE items SET status = 'pending', claimed_by = NULL, claimed_until = NULL " \
+                "WHERE status = 'claimed' AND claimed_by = ?"
+        if items is None:
+            connection.execute(query, (os.getpid(),))
+        else:
+            connection.executemany(query + " AND id = ?", ((os.getpid(), item.id) for item in items))
+
+    async def get_stats(self) -> Dict[str, int]:
+        """Jobs por status e itens aguardando processamento"""
+        return await self._run(self._get_stats)
+
+    def _get_stats(self) -> Dict[str, int]:
+        connection = self._connect()
+        stats = {f"jobs_{status}": 0 for status in ("queued", "running", "completed")}
+        for status, count in connection.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status"):
+            stats[f"jobs_{status}"] = count
+        stats["items_pending"] = connection.execute(
+            "SELECT COUNT(*) FROM items WHERE status != 'done'"
+        ).fetchone()[0]
+        return stats
+
+class JobRunner:
+    """Processa itens de jobs com a capacidade ociosa do pipeline"""
+
+    def __init__(self, store: JobStore, pipeline, batch_size: int, idle_threshold: int,
+                 poll_interval: float, claim_lease: float, max_attempts: int = 3):
+        self.store = store
+        self.pipeline = pipeline
+        self.batch_size = batch_size
+        self.idle_threshold = idle_threshold
+        self.poll_interval = poll_interval
+        self.claim_lease = claim_lease
+        self.max_attempts = max_attempts
+        self.processed = 0
+        self.retried = 0
+        self.yielded = 0  # Esperas por tráfego ao vivo
+        self._wakeup: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+        self._inspect = partial(inspect_image, max_pixels=config.MAX_IMAGE_PIXELS, policy=config.OVERSIZE_IMAGE_POLICY)
+
+    async def start(self):
+        """Retoma reservas deixadas por este pid (reinício) e inicia o loop"""
+        await self._release()
+        self._wakeup = asyncio.Event()
+        self._task = asyncio.create_task(self._run())
+        logger.info(f"✅ Worker de jobs iniciado (batch_size={self.batch_size}, idle_threshold={self.idle_threshold})")
+
+    async def stop(self):
+        """Interrompe o loop e devolve os itens reservados à fila"""
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            except Exception as e:
+                # O loop já tinha terminado com erro: o shutdown segue
+                logger.error(f"❌ Worker de jobs havia parado com erro: {str(e)}")
+            self._task = None
+        await self._release()
+        logger.info("🛑 Worker de jobs encerrado")
+
+    def notify(self):
+        """Acorda o loop após a criação de um job"""
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    async def _run(self):
+        while True:
+            # Prioridade do tráfego ao vivo: só seguir com o pipeline ocioso
+            while self.pipeline.in_flight > self.idle_threshold:
+                self.yielded += 1
+                await asyncio.sleep(self.poll_interval)
+
+            self._wakeup.clear()
+            try:
+                items = await self.store.claim(self.batch_size, self.claim_lease)
+            except sqlite3.Error as e:
+                logger.warning(f"⚠️ Falha ao reservar itens de jobs: {str(e)}")
+                items = []
+            if not items:
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=max(self.poll_interval, 1.0))
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            results = await asyncio.gather(*(self._process(item) for item in items), return_exceptions=True)
+            if any(isinstance(result, PipelineClosedError) for result in results):
+                # Shutdown: a rodada volta para a fila sem gastar tentativas
+                await self._release(items)
+                return
+
+            done, retry = [], []
+            for item, result in zip(items, results):
+                if not isinstance(result, BaseException):
+                    done.append((item, result))
+                elif item.attempts >= self.max_attempts:
+                    logger.error(f"❌ Item {item.id} do job {item.job_id} falhou após {item.attempts} tentativas: "
+                                 f"{type(result).__name__}: {str(result)}")
+                    done.append((item, {"error": f"Processing failed after {item.attempts} attempts"}))
+                else:
+                    retry.append((item, result))
+
+            if retry:
+                # Falha fora da imagem (pipeline, erro inesperado): só esses itens voltam para a fila
+                item, error = retry[0]
+                logger.error(f"❌ Erro ao processar {len(retry)} itens de jobs "
+                             f"(item {item.id}, tentativa {item.attempts}): {type(error).__name__}: {str(error)}")
+                self.retried += len(retry)
+                await self._release([item for item, _ in retry])
+
+            if done:
+                try:
+                    await self.store.complete(done)
+                except sqlite3.Error as e:
+                    logger.warning(f"⚠️ Falha ao gravar resultados de jobs: {str(e)}")
+                    await self._release([item for item, _ in done])
+                    await asyncio.sleep(1.0)
+                    continue
+                self.processed += len(done)
+                metrics.increment_predictions("/jobs", sum("error" not in result for _, result in done))
+
+            if retry:
+                await asyncio.sleep(1.0)
+
+    async def _release(self, items: Optional[List[JobItem]] = None):
+        """Devolve itens à fila; com o SQLite indisponível, o lease expira sozinho"""
+        try:
+            await self.store.release(items)
+        except sqlite3.Error as e:
+            logger.warning(f"⚠️ Falha ao devolver itens de jobs à fila: {str(e)}")
+
+    async def _process(self, item: JobItem) -> Dict[str, Any]:
+        """Classifica um item; falhas da imagem viram erro do item"""
+        try:
+            if item.path is not None:
+                # Validado só aqui (realpath faz um lstat por componente: fora do event loop)
+                path = await asyncio.get_running_loop().run_in_executor(
+                    None, resolve_allowed_path, item.path, config.PREDICT_PATH_ROOT, config.SUPPORTED_FORMATS
+                )
+                predicted_class, confidence, all_predictions = await self.pipeline.submit_path(
+                    path, inspect=self._inspect
+                )
+            else:
+                predicted_class, confidence, all_predictions = await self.pipeline.submit(io.BytesIO(item.image))
+        except ImageRejectedError as e:
+            metrics.increment_image_rejects(e.reason)
+            return {"error": "Invalid image file" if e.reason == "unidentified" else f"Image rejected ({e.reason})"}
+        except InvalidImageError:
+            return {"error": "Invalid image file"}
+        except PathNotAllowedError as e:
+            return {"error": str(e)}
+        except FileNotFoundError:
+            return {"error": "File not found"}
+        except OSError as e:
+            return {"error": f"Could not read file: {e.strerror}"}
+        return {"prediction": {
+            "predicted_class": predicted_class,
+            "confidence": round(confidence, 2),
+            "all_predictions": {k: round(v, 2) for k, v in all_predictions.items()}
+        }}
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Itens processados e esperas por tráfego ao vivo neste worker"""
+        return {
+            "running": self._task is not None,
+            "processed": self.processed,
+            "retried": self.retried,
+            "yielded_to_live_traffic": self.yielded
+        }
+
+# Instâncias globais (None se JOBS_DB_PATH não estiver configurado)
+job_store = JobStore(config.JOBS_DB_PATH) if config.JOBS_DB_PATH else None
+job_runner = JobRunner(
+    job_store,
+    inference_pipeline,
+    batch_size=config.JOB_BATCH_SIZE,
+    idle_threshold=config.JOB_IDLE_THRESHOLD,
+    poll_interval=config.JOB_POLL_INTERVAL,
+    claim_lease=config.JOB_CLAIM_LEASE,
+    max_attempts=config.JOB_MAX_ATTEMPTS
+) if job_store else None
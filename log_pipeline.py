@@ -0,0 +1,230 @@
+"""
+Logging não bloqueante com amostragem por tipo de evento
+
+Os handlers do root (stderr) passam a rodar em uma thread de fundo: quem loga
+só aplica a amostragem e coloca o record em uma fila limitada, sem formatar
+nem escrever. Com a fila cheia o record é descartado e contado, em vez de
+bloquear o event loop.
+
+Records podem declarar o tipo de evento com ``extra={"event": "prediction"}``;
+o access log do uvicorn é o evento ``access``. Cada tipo pode ter taxa de
+amostragem (``LOG_SAMPLE_RATES="prediction=0.01"``) e limite de records por
+segundo (``LOG_RATE_LIMITS="access=50"``). WARNING ou acima nunca é amostrado.
+
+Os loggers do uvicorn perdem os handlers próprios (o ``LOGGING_CONFIG`` da
+CLI escreve direto no stderr) e passam a propagar para o root, de modo que o
+access log também passa pela fila e pela amostragem.
+"""
+
+import atexit
+import logging
+import os
+import queue
+import random
+import threading
+import time
+from logging.handlers import QueueHandler, QueueListener
+from typing import Any, Dict, Optional
+
+from monitoring import shared_metrics_path
+from shared_counters import SharedCounters
+
+EVENT_TYPES = ("prediction", "health_check", "access", "other")
+UVICORN_LOGGERS = ("uvicorn", "uvicorn.error", "uvicorn.access")
+
+class LogStats:
+    """Contadores de records enfileirados e descartados (somados entre workers)"""
+
+    def __init__(self, path: Optional[str] = None):
+        self.counters = SharedCounters(
+            ("enqueued", "dropped_queue_full",
+             *(f"sampled_out_{event}" for event in EVENT_TYPES),
+             *(f"rate_limited_{event}" for event in EVENT_TYPES)),
+            path
+        )
+
+    def add(self, field: str):
+        """Incrementa um contador"""
+        self.counters.add(field)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Totais de enfileirados e descartados por motivo"""
+        totals = self.counters.totals()
+        return {
+            "enqueued": totals["enqueued"],
+            "dropped_queue_full": totals["dropped_queue_full"],
+            "sampled_out": {event: totals[f"sampled_out_{event}"] for event in EVENT_TYPES},
+            "rate_limited": {event: totals[f"rate_limited_{event}"] for event in EVENT_TYPES}
+        }
+
+class _TokenBucket:
+    """Limite de eventos por segundo com rajada de até um segundo"""
+
+    def __init__(self, rate: float):
+        self.rate = rate
+        self.tokens = rate
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def take(self) -> bool:
+        """Consome um token se houver"""
+        with self._lock:
+            now = time.monotonic()
+            self.tokens = min(self.rate, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return True
+            return False
+
+class EventSampler(logging.Filter):
+    """Amostragem e limite por tipo de evento, aplicados antes de enfileirar"""
+
+    def __init__(self, sample_rates: Dict[str, float], rate_limits: Dict[str, float], stats: LogStats):
+        super().__init__()
+        self.sample_rates = sample_rates
+        self.buckets = {event: _TokenBucket(rate) for event, rate in rate_limits.items()}
+        self.stats = stats
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno >= logging.WARNING:
+            return True
+        event = _event_type(record)
+        rate = self.sample_rates.get(event)
+        if rate is not None and random.random() >= rate:
+            self.stats.add(f"sampled_out_{event}")
+            return False
+        bucket = self.buckets.get(event)
+        if bucket is not None and not bucket.take():
+            self.stats.add(f"rate_limited_{event}")
+            return False
+        return True
+
+class NonBlockingQueueHandler(QueueHandler):
+    """Enfileira o record sem formatá-lo; descarta (e conta) com a fila cheia"""
+
+    def __init__(self, log_queue: queue.Queue, stats: LogStats):
+        super().__init__(log_queue)
+        self.stats = stats
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # A fila é do mesmo processo: a mensagem é montada na thread de escrita
+        return record
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+            self.stats.add("enqueued")
+        except queue.Full:
+            self.stats.add("dropped_queue_full")
+
+class _LogPipeline:
+    """Fila, handler e listener instalados no root logger"""
+
+    def __init__(self, handlers, queue_size: int, sampler: EventSampler, stats: LogStats):
+        self.handlers = handlers
+        self.queue_size = queue_size
+        self.queue: queue.Queue = queue.Queue(queue_size)
+        self.handler = NonBlockingQueueHandler(self.queue, stats)
+        self.handler.addFilter(sampler)
+        self.listener = QueueListener(self.queue, *handlers, respect_handler_level=True)
+        self.running = False
+
+    def start(self):
+        """Inicia a thread de escrita"""
+        self.listener.start()
+        self.running = True
+
+    def stop(self):
+        """Escreve o que ainda está na fila e encerra a thread"""
+        if self.running:
+            self.running = False
+            self.listener.stop()
+
+    def after_fork(self):
+        """A thread do listener não existe no filho: nova fila e novo listener"""
+        self.queue = queue.Queue(self.queue_size)
+        self.handler.queue = self.queue
+        self.listener = QueueListener(self.queue, *self.handlers, respect_handler_level=True)
+        self.running = False
+        self.start()
+
+_pipeline: Optional[_LogPipeline] = None
+
+# Contadores do pipeline de logging
+log_stats = LogStats(shared_metrics_path("logging"))
+
+def setup_logging(level: str, fmt: str, queued: bool = True, queue_size: int = 10000,
+                  sample_rates: Optional[Dict[str, float]] = None, rate_limits: Optional[Dict[str, float]] = None):
+    """
+    Configura o root logger: handler de stderr atrás da fila (``queued``) ou
+    direto, como o ``logging.basicConfig``
+    """
+    global _pipeline
+    if _pipeline is not None:
+        _pipeline.stop()
+        _pipeline = None
+
+    root = logging.getLogger()
+    for handler in root.handlers[:]:
+        root.removeHandler(handler)
+    root.setLevel(getattr(logging, level.upper()))
+    for name in UVICORN_LOGGERS:
+        uvicorn_logger = logging.getLogger(name)
+        for handler in uvicorn_logger.handlers[:]:
+            uvicorn_logger.removeHandler(handler)
+        uvicorn_logger.propagate = True
+
+    stream_handler = logging.StreamHandler()
+    stream_handler.setFormatter(logging.Formatter(fmt))
+    if not queued:
+        root.addHandler(stream_handler)
+        return
+
+    sampler = EventSampler(sample_rates or {}, rate_limits or {}, log_stats)
+    _pipeline = _LogPipeline([stream_handler], queue_size, sampler, log_stats)
+    _pipeline.start()
+    root.addHandler(_pipeline.handler)
+
+def stop_logging():
+    """Esvazia a fila antes de o processo terminar"""
+    if _pipeline is not None:
+        _pipeline.stop()
+
+def resume_logging():
+    """Reinicia a thread de escrita parada com ``stop_logging`` (mestre do prefork após o fork)"""
+    if _pipeline is not None and not _pipeline.running:
+        _pipeline.start()
+
+def get_log_stats() -> Dict[str, Any]:
+    """Contadores e profundidade atual da fila"""
+    return {
+        "queued": _pipeline is not None,
+        "queue_depth": _pipeline.queue.qsize() if _pipeline is not None else 0,
+        **log_stats.get_stats()
+    }
+
+def parse_event_rates(spec: str) -> Dict[str, float]:
+    """``"prediction=0.01,access=50"`` -> {"prediction": 0.01, "access": 50.0}"""
+    rates = {}
+    for item in filter(None, (part.strip() for part in spec.split(","))):
+        event, _, value = item.partition("=")
+        event = event.strip()
+        if event not in EVENT_TYPES:
+            raise ValueError(f"Unknown log event type: {event}")
+        rates[event] = float(value)
+    return rates
+
+def _event_type(record: logging.LogRecord) -> str:
+    """Tipo de evento do record (``extra={"event": ...}``; access log do uvicorn = access)"""
+    event = getattr(record, "event", None)
+    if event is None and record.name == "uvicorn.access":
+        return "access"
+    return event if event in EVENT_TYPES else "other"
+
+def _after_fork_in_child():
+    if _pipeline is not None:
+        _pipeline.after_fork()
+
+os.register_at_fork(after_in_child=_after_fork_in_child)
+atexit.register(stop_logging)
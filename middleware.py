@@ -0,0 +1,348 @@
+"""
+Middlewares ASGI da API
+"""
+
+import hashlib
+import logging
+import math
+import time
+from typing import Dict, Iterable, Optional, Tuple
+
+from fastapi import HTTPException, status
+from fastapi.responses import JSONResponse
+
+from idempotency import IdempotencyStore, RequestFingerprint, StoredResponse
+from models import ErrorResponse
+from monitoring import (
+    RequestTiming, metrics, observe_request, reset_request_timing, set_request_timing
+)
+from rate_limit import ANONYMOUS_TIER, RateLimitDecision, RateLimitTier, TokenBucketLimiter, retry_after_seconds
+
+logger = logging.getLogger(__name__)
+
+class UploadSizeLimitMiddleware:
+    """
+    Rejeita corpos de request acima do limite antes que sejam lidos
+
+    Verifica o ``Content-Length`` antes de chamar a aplicação e conta os bytes
+    recebidos enquanto o corpo é consumido (cobre uploads chunked ou com
+    ``Content-Length`` falso), abortando assim que o limite é ultrapassado.
+    Dessa forma o parser multipart nunca enche o SpooledTemporaryFile.
+    ``path_limits`` permite limites próprios por caminho exato.
+    """
+
+    def __init__(self, app, max_body_size: int, path_limits: Optional[Dict[str, int]] = None):
+        self.app = app
+        self.max_body_size = max_body_size
+        self.path_limits = path_limits or {}
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        max_body_size = self.path_limits.get(scope["path"], self.max_body_size)
+
+        for name, value in scope["headers"]:
+            if name == b"content-length":
+                try:
+                    content_length = int(value)
+                except ValueError:
+                    content_length = 0
+                if content_length > max_body_size:
+                    logger.warning(f"Upload rejeitado: Content-Length {content_length} > {max_body_size}")
+                    response = self._too_large_response()
+                    await response(scope, receive, send)
+                    return
+                break
+
+        received = 0
+
+        async def limited_receive():
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > max_body_size:
+                    logger.warning(f"Upload abortado após {received} bytes (limite {max_body_size})")
+                    raise HTTPException(
+                        status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+                        detail="Upload too large"
+                    )
+            return message
+
+        await self.app(scope, limited_receive, send)
+
+    def _too_large_response(self) -> JSONResponse:
+        """Resposta 413 no mesmo formato do handler de HTTPException"""
+        return JSONResponse(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            content=ErrorResponse(
+                error="Upload too large",
+                detail=f"Status code: {status.HTTP_413_REQUEST_ENTITY_TOO_LARGE}"
+            ).model_dump()
+        )
+
+class IdempotencyMiddleware:
+    """
+    Reenvios com o mesmo ``Idempotency-Key`` recebem a resposta guardada
+
+    Fica antes do ``UploadSizeLimitMiddleware``: num acerto, o corpo do
+    reenvio não é lido e o request não chega ao endpoint. A chave guardada é
+    o hash de caminho + API key + ``Idempotency-Key``, então chaves iguais de
+    clientes ou endpoints diferentes não colidem. O corpo é lido só para
+    conferir a impressão digital: outro corpo com a mesma chave recebe 422.
+    """
+
+    def __init__(self, app, store: IdempotencyStore, paths: Iterable[str], api_key_header: str = "x-api-key",
+                 max_key_length: int = 255):
+        self.app = app
+        self.store = store
+        self.paths = frozenset(paths)
+        self.api_key_header = api_key_header.lower().encode("latin-1")
+        self.max_key_length = max_key_length
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] != "POST" or scope["path"] not in self.paths:
+            await self.app(scope, receive, send)
+            return
+
+        idempotency_key = api_key = content_type = b""
+        content_length = None
+        for name, value in scope["headers"]:
+            if name == b"idempotency-key":
+                idempotency_key = value
+            elif name == self.api_key_header:
+                api_key = value
+            elif name == b"content-type":
+                content_type = value
+            elif name == b"content-length" and value.isdigit():
+                content_length = int(value)
+        if not idempotency_key:
+            await self.app(scope, receive, send)
+            return
+        if len(idempotency_key) > self.max_key_length:
+            response = self._error_response(
+                status.HTTP_400_BAD_REQUEST, f"Idempotency-Key longer than {self.max_key_length} bytes"
+            )
+            await response(scope, receive, send)
+            return
+
+        key = hashlib.sha256(b"\0".join((scope["path"].encode("utf-8"), api_key, idempotency_key))).hexdigest()
+        stored, reservation = await self.store.lookup(key)
+        if stored is not None:
+            if not await self._same_request(stored, content_type, content_length, receive):
+                self.store.counters.add("mismatches")
+                response = self._error_response(
+                    status.HTTP_422_UNPROCESSABLE_ENTITY, "Idempotency-Key reused with a different request body"
+                )
+                await response(scope, receive, send)
+                return
+            await send({
+                "type": "http.response.start",
+                "status": stored.status,
+                "headers": [*stored.headers, (b"idempotent-replayed", b"true")]
+            })
+            await send({"type": "http.response.body", "body": stored.body})
+            return
+
+        status_code = None
+        headers = []
+        chunks = []
+        fingerprint = RequestFingerprint(content_type)
+
+        async def recording_receive():
+            message = await receive()
+            if message["type"] == "http.request":
+                fingerprint.update(message.get("body", b""), message.get("more_body", False))
+            return message
+
+        async def recording_send(message):
+            nonlocal status_code, headers
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+                headers = list(message.get("headers", []))
+            elif message["type"] == "http.response.body":
+                chunks.append(message.get("body", b""))
+            await send(message)
+
+        try:
+            await self.app(scope, recording_receive, recording_send)
+        finally:
+            await self.store.complete(
+                key, reservation, status_code, headers, b"".join(chunks),
+                fingerprint.digest() if fingerprint.complete else None
+            )
+
+    @staticmethod
+    async def _same_request(stored: StoredResponse, content_type: bytes, content_length: Optional[int],
+                            receive) -> bool:
+        """Confere o corpo do reenvio com a impressão digital guardada (lê no máximo o tamanho original)"""
+        size = int(stored.request_digest.split(":", 1)[0])
+        fingerprint = RequestFingerprint(content_type)
+        # Sem multipart o tamanho do hash é o do corpo: dá para recusar sem ler
+        if not fingerprint.boundary and content_length is not None and content_length != size:
+            return False
+        more_body = True
+        while more_body:
+            message = await receive()
+            if message["type"] != "http.request":
+                return False
+            more_body = message.get("more_body", False)
+            fingerprint.update(message.get("body", b""), more_body)
+            if fingerprint.size > size:
+                return False
+        return fingerprint.digest() == stored.request_digest
+
+    @staticmethod
+    def _error_response(status_code: int, error: str) -> JSONResponse:
+        """Resposta de erro no mesmo formato do handler de HTTPException"""
+        return JSONResponse(
+            status_code=status_code,
+            content=ErrorResponse(error=error, detail=f"Status code: {status_code}").model_dump()
+        )
+
+class RateLimitMiddleware:
+    """
+    Token bucket por API key ou IP nos caminhos de predição
+
+    Roda antes do ``UploadSizeLimitMiddleware`` ler qualquer byte do corpo:
+    um cliente acima do limite recebe 429 com ``Retry-After`` sem custo de
+    upload nem de modelo. Respostas permitidas também levam os headers
+    ``X-RateLimit-*``. Com ``trust_proxy``, o IP é o último endereço do
+    ``X-Forwarded-For`` (o que o proxy da plataforma acrescentou).
+    """
+
+    def __init__(self, app, limiter: TokenBucketLimiter, paths: Iterable[str],
+                 api_keys: Dict[str, RateLimitTier], api_key_header: str = "x-api-key",
+                 trust_proxy: bool = False):
+        self.app = app
+        self.limiter = limiter
+        self.paths = frozenset(paths)
+        self.api_keys = api_keys
+        self.api_key_header = api_key_header.lower().encode("latin-1")
+        self.trust_proxy = trust_proxy
+
+    async def __call__(self, scope, receive, send):
+        # Preflight CORS não consome tokens
+        if scope["type"] != "http" or scope["path"] not in self.paths or scope["method"] == "OPTIONS":
+            await self.app(scope, receive, send)
+            return
+
+        client, tier = self._identify(scope)
+        decision = self.limiter.check(client, tier)
+        if not decision.allowed:
+            # Contado por tier em ``limiter.counters``; sem WARNING por request recusado
+            logger.debug(f"Rate limit excedido: tier={tier.name} {client.split(':', 1)[0]}")
+            response = self._throttled_response(decision)
+            await response(scope, receive, send)
+            return
+
+        headers = self._rate_limit_headers(decision)
+
+        async def send_with_headers(message):
+            if message["type"] == "http.response.start":
+                message["headers"] = [*message.get("headers", []), *headers]
+            await send(message)
+
+        await self.app(scope, receive, send_with_headers)
+
+    def _identify(self, scope) -> Tuple[str, RateLimitTier]:
+        """Chave do bucket e tier: API key cadastrada ou IP do cliente"""
+        api_key = forwarded = None
+        for name, value in scope["headers"]:
+            if name == self.api_key_header:
+                api_key = value.decode("latin-1")
+            elif name == b"x-forwarded-for":
+                forwarded = value.decode("latin-1")
+
+        tier = self.api_keys.get(api_key) if api_key else None
+        if tier is not None:
+            return f"key:{api_key}", tier
+
+        if self.trust_proxy and forwarded:
+            ip = forwarded.rsplit(",", 1)[-1].strip()
+        else:
+            ip = scope["client"][0] if scope.get("client") else "unknown"
+        return f"ip:{ip}", self.limiter.tiers[ANONYMOUS_TIER]
+
+    def _rate_limit_headers(self, decision: RateLimitDecision):
+        """Headers ``X-RateLimit-*`` (capacidade, tokens restantes, segundos até encher)"""
+        return [
+            (b"x-ratelimit-limit", str(int(decision.tier.burst)).encode("latin-1")),
+            (b"x-ratelimit-remaining", str(decision.remaining).encode("latin-1")),
+            (b"x-ratelimit-reset", str(math.ceil(decision.reset)).encode("latin-1"))
+        ]
+
+    def _throttled_response(self, decision: RateLimitDecision) -> JSONResponse:
+        """Resposta 429 no mesmo formato do handler de HTTPException"""
+        response = JSONResponse(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            content=ErrorResponse(
+                error="Rate limit exceeded",
+                detail=f"Status code: {status.HTTP_429_TOO_MANY_REQUESTS}"
+            ).model_dump(),
+            headers={"Retry-After": str(retry_after_seconds(decision))}
+        )
+        response.raw_headers.extend(self._rate_limit_headers(decision))
+        return response
+
+class RequestTimingMiddleware:
+    """
+    Instrumentação única de todos os requests HTTP
+
+    Cria o ``RequestTiming`` do request (lido pelo código do endpoint e pelo
+    pipeline via ``get_request_timing()``), mede a leitura do corpo como
+    ``upload_read``, envia os estágios no header ``Server-Timing`` e alimenta
+    os contadores de ``metrics``, os histogramas de latência e os quantis.
+    """
+
+    def __init__(self, app, server_timing: bool = True):
+        self.app = app
+        self.server_timing = server_timing
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        timing = RequestTiming()
+        token = set_request_timing(timing)
+        metrics.increment_requests()
+        status_code = 500
+
+        async def timed_receive():
+            start = time.perf_counter()
+            message = await receive()
+            if message["type"] == "http.request":
+                timing.record("upload_read", time.perf_counter() - start)
+            return message
+
+        async def timed_send(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+                if self.server_timing:
+                    header = timing.server_timing(timing.elapsed()).encode("latin-1")
+                    message["headers"] = [*message.get("headers", []), (b"server-timing", header)]
+            await send(message)
+
+        try:
+            await self.app(scope, timed_receive, timed_send)
+        finally:
+            total = timing.elapsed()
+            reset_request_timing(token)
+            metrics.add_response_time(total)
+            if status_code >= 400:
+                metrics.increment_errors()
+            # Rotas sem match (404) agrupadas para não criar um histograma por URL
+            route = _route_template(scope) if "endpoint" in scope else None
+            observe_request(route, timing, total, status_code)
+            logger.debug(f"{scope['method']} {scope['path']} {status_code} em {total * 1000:.2f}ms {timing.stages}")
+
+def _route_template(scope) -> str:
+    """Caminho com os parâmetros de volta ao template (``/jobs/abc`` -> ``/jobs/{job_id}``)"""
+    path = scope["path"]
+    for name, value in scope.get("path_params", {}).items():
+        path = path.replace(f"/{value}", f"/{{{name}}}", 1)
+    return path
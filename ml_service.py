@@ -8,12 +8,12 @@ from keras.models import load_model
 import gdown
 from PIL import Image
 import logging
-from typing import Tuple, Dict, Optional
+from typing import Tuple, Dict, List, Optional
 import time
 
 # Importar MLFlow
 from mlflow_config import mlflow_manager
-from mlflow_utils import performance_monitor
+from mlflow_utils import mlflow_tracker, performance_monitor, prediction_telemetry
 
 # Importar downloader de modelos
 from model_downloader import model_downloader
@@ -44,6 +44,9 @@ class MLService:
         # Modo de desenvolvimento (sem modelo real)
         self.dev_mode = os.getenv("DEV_MODE", "false").lower() == "true"
 
+        # Inferência eager (op a op na thread chamadora), usada pelo launcher pre-fork
+        self.eager_inference = os.getenv("TF_EAGER_INFERENCE", "false").lower() == "true"
+
     def _setup_mlflow_integration(self):
         """Configura integração com MLFlow"""
         try:
@@ -200,19 +203,31 @@ class MLService:
             logger.error(f"❌ Erro ao carregar modelo: {str(e)}")
             return False
     
-    def preprocess_image(self, image: Image.Image) -> np.ndarray:
-        """Preprocessa a imagem para predição"""
+    def preprocess_image(self, image: Image.Image, out: Optional[np.ndarray] = None) -> np.ndarray:
+        """
+        Preprocessa a imagem para predição
+
+        Args:
+            image: Imagem PIL em RGB
+            out: Slot float32 (256, 256, 3) onde escrever o resultado in-place.
+                Se None, aloca um batch (1, 256, 256, 3)
+
+        Returns:
+            O array preenchido (``out`` ou o batch recém-alocado)
+        """
         try:
             # Redimensionar para 256x256
             img = image.resize((256, 256))
             
-            # Converter para array numpy
-            img_array = tf.keras.utils.img_to_array(img)
-            
-            # Expandir dimensões para batch
-            img_array = np.expand_dims(img_array, axis=0).astype(np.float32)
+            # Buffer uint8 do PIL convertido direto para float32 no destino
+            pixels = np.asarray(img)
+            if out is None:
+                out = np.empty((1, 256, 256, 3), dtype=np.float32)
+                np.copyto(out[0], pixels)
+            else:
+                np.copyto(out, pixels)
             
-            return img_array
+            return out
         except Exception as e:
             logger.error(f"❌ Error preprocessing image: {str(e)}")
             raise
@@ -227,103 +242,116 @@ class MLService:
         Returns:
             Tuple contendo (classe_predita, confiança, todas_predições)
         """
+        return self.predict_batch(self.preprocess_image(image))[0]
+
+    def predict_batch(self, batch: np.ndarray) -> List[Tuple[str, float, Dict[str, float]]]:
+        """
+        Faz predição em um batch já preprocessado com tracking MLFlow
+
+        Args:
+            batch: Array float32 com shape (N, 256, 256, 3)
+
+        Returns:
+            Lista com (classe_predita, confiança, todas_predições) por imagem
+        """
         start_time = time.time()
+        predictions = self.infer_batch(batch)
+        return self.postprocess_batch(predictions, time.time() - start_time)
+
+    def infer_batch(self, batch: np.ndarray) -> np.ndarray:
+        """
+        Executa o modelo em um batch já preprocessado
 
+        Args:
+            batch: Array float32 com shape (N, 256, 256, 3)
+
+        Returns:
+            Probabilidades com shape (N, num_classes)
+        """
         try:
             # Modo de desenvolvimento (predição mock)
             if self.dev_mode:
-                return self._mock_prediction(start_time)
+                return self._mock_probabilities(len(batch))
 
             if not self.is_loaded:
                 raise ValueError("Model not loaded")
 
-            # Preprocessar imagem
-            img_array = self.preprocess_image(image)
+            return self._infer(batch)
+
+        except Exception as e:
+            # Erro contado no intervalo corrente da telemetria do MLFlow
+            prediction_telemetry.add_error()
 
-            # Fazer predição
-            predictions = self.model.predict(img_array, verbose=0)
+            logger.error(f"❌ Error making prediction: {str(e)}")
+            raise
 
+    def postprocess_batch(self, predictions: np.ndarray,
+                          inference_time: float) -> List[Tuple[str, float, Dict[str, float]]]:
+        """
+        Converte as probabilidades em resultados e registra cada predição
+
+        Args:
+            predictions: Probabilidades (N, num_classes) retornadas por ``infer_batch``
+            inference_time: Latência do batch inteiro em segundos
+
+        Returns:
+            Lista com (classe_predita, confiança, todas_predições) por imagem
+        """
+        results = []
+        for row in predictions:
             # Obter classe predita
-            predicted_class_idx = np.argmax(predictions[0])
+            predicted_class_idx = int(np.argmax(row))
             predicted_class = self.class_names[predicted_class_idx]
 
             # Calcular confiança
-            confidence = float(np.max(predictions[0]) * 100)
+            confidence = float(row[predicted_class_idx] * 100)
 
             # Criar dicionário com todas as predições
-            all_predictions = {}
-            for i, class_name in enumerate(self.class_names):
-                all_predictions[class_name] = float(predictions[0][i] * 100)
-
-            # Calcular tempo de inferência
-            inference_time = time.time() - start_time
+            all_predictions = {
+                class_name: float(probability * 100) for class_name, probability in zip(self.class_names, row)
+            }
 
             # Adicionar ao monitor de performance
             performance_monitor.add_prediction(predicted_class, confidence, inference_time)
 
-            # Log métricas no MLFlow
-            mlflow_manager.log_metrics({
-                "prediction_inference_time_ms": inference_time * 1000,
-                "prediction_confidence": confidence,
-                "prediction_count": 1
-            })
-
-            # Log distribuição de probabilidades
-            prob_metrics = {f"prob_{class_name}": prob for class_name, prob in all_predictions.items()}
-            mlflow_manager.log_metrics(prob_metrics)
+            # Tracking MLFlow (inferência, confiança e distribuição de probabilidades)
+            mlflow_tracker.track_prediction(predicted_class, confidence, inference_time, all_predictions)
 
-            logger.info(f"Prediction: {predicted_class} with {confidence:.2f}% confidence (inference: {inference_time:.3f}s)")
+            results.append((predicted_class, confidence, all_predictions))
 
-            return predicted_class, confidence, all_predictions
+        return results
 
-        except Exception as e:
-            inference_time = time.time() - start_time
+    def _infer(self, batch: np.ndarray) -> np.ndarray:
+        """Executa o modelo e retorna as probabilidades (N, num_classes)"""
+        if self.eager_inference:
+            return np.asarray(self.model(batch, training=False))
+        return self.model.predict(batch, verbose=0)
 
-            # Log erro no MLFlow
-            mlflow_manager.log_metrics({
-                "prediction_error_count": 1,
-                "prediction_error_time_ms": inference_time * 1000
-            })
+    def warmup(self, batch_size: int = 1) -> float:
+        """
+        Executa uma inferência descartável para inicializar o runtime
 
-            mlflow_manager.log_params({
-                "prediction_error": str(e)
-            })
+        Não registra métricas nem entra no monitor de performance.
 
-            logger.error(f"❌ Error making prediction: {str(e)}")
-            raise
+        Returns:
+            Tempo da inferência de aquecimento em segundos
+        """
+        if self.dev_mode or not self.is_loaded:
+            return 0.0
 
-    def _mock_prediction(self, start_time: float) -> Tuple[str, float, Dict[str, float]]:
-        """Predição mock para modo de desenvolvimento"""
-        import random
+        start_time = time.time()
+        self._infer(np.zeros((batch_size, 256, 256, 3), dtype=np.float32))
+        warmup_time = time.time() - start_time
+        logger.info(f"🔥 Modelo aquecido em {warmup_time:.2f}s")
+        return warmup_time
 
-        # Simular tempo de processamento
+    def _mock_probabilities(self, batch_size: int) -> np.ndarray:
+        """Probabilidades mock para modo de desenvolvimento: um único tempo simulado por batch"""
         time.sleep(0.1)
 
         # Predição aleatória realística
-        predictions = np.random.dirichlet([2, 1, 1, 3])  # Favorece normal e cataract
+        return np.random.dirichlet([2, 1, 1, 3], size=batch_size)  # Favorece normal e cataract
 
-        predicted_class_idx = np.argmax(predictions)
-        predicted_class = self.class_names[predicted_class_idx]
-        confidence = float(predictions[predicted_class_idx] * 100)
-
-        all_predictions = {}
-        for i, class_name in enumerate(self.class_names):
-            all_predictions[class_name] = float(predictions[i] * 100)
-
-        inference_time = time.time() - start_time
-
-        # Log métricas mock
-        mlflow_manager.log_metrics({
-            "prediction_inference_time_ms": inference_time * 1000,
-            "prediction_confidence": confidence,
-            "prediction_count": 1,
-            "mock_mode": 1
-        })
-
-        logger.info(f"🎭 MOCK Prediction: {predicted_class} with {confidence:.2f}% confidence")
-
-        return predicted_class, confidence, all_predictions
-    
     def is_model_loaded(self) -> bool:
         """Verifica se o modelo está carregado"""
         return self.is_loaded
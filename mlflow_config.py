@@ -3,11 +3,19 @@ Configurações e utilitários para integração com MLFlow
 """
 
 import os
+import threading
+import time
+from collections import deque
 import mlflow
 import mlflow.tensorflow
-from typing import Optional, Dict, Any
+from mlflow.entities import Metric, Param
+from mlflow.tracking import MlflowClient
+from typing import Any, Callable, Dict, List, Optional
 import logging
 
+from monitoring import shared_metrics_path
+from shared_counters import SharedCounters
+
 logger = logging.getLogger(__name__)
 
 class MLFlowConfig:
@@ -33,6 +41,12 @@ class MLFlowConfig:
     # Configurações de armazenamento
     MLFLOW_ARTIFACT_ROOT = os.getenv("MLFLOW_ARTIFACT_ROOT", "./mlruns")
     
+    # Envio em background via log_batch
+    MLFLOW_BUFFER_SIZE = int(os.getenv("MLFLOW_BUFFER_SIZE", 10000))  # Métricas/parâmetros aguardando envio
+    MLFLOW_BATCH_SIZE = int(os.getenv("MLFLOW_BATCH_SIZE", 1000))  # Itens no buffer que disparam um envio
+    MLFLOW_FLUSH_INTERVAL = float(os.getenv("MLFLOW_FLUSH_INTERVAL", 5.0))  # Envio periódico em segundos
+    MLFLOW_AGGREGATION_INTERVAL = int(os.getenv("MLFLOW_AGGREGATION_INTERVAL", 60))  # Segundos por resumo de predições
+    
     # Tags padrão para experimentos
     DEFAULT_TAGS = {
         "project": "eye-disease-classifier",
@@ -41,6 +55,139 @@ class MLFlowConfig:
         "environment": os.getenv("ENVIRONMENT", "production")
     }
 
+class TelemetryBuffer:
+    """
+    Buffer limitado de métricas e parâmetros, enviado ao MLflow em background
+
+    Quem loga só acrescenta tuplas ao buffer; uma thread envia tudo com
+    ``MlflowClient.log_batch`` quando o buffer chega a ``batch_size`` itens ou
+    a cada ``flush_interval`` segundos. Com o buffer cheio os itens são
+    descartados e contados, em vez de atrasar o request.
+
+    Coletores (``add_collector``) rodam na mesma thread antes de cada envio,
+    e uma última vez com ``final=True`` no encerramento: é onde agregados por
+    intervalo viram métricas.
+    """
+
+    # Limites do log_batch por chamada
+    MAX_METRICS_PER_BATCH = 1000
+    MAX_PARAMS_PER_BATCH = 100
+
+    def __init__(self, max_size: int, batch_size: int, flush_interval: float, stats_path: Optional[str] = None):
+        self.max_size = max_size
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.run_id: Optional[str] = None
+        self._metrics: deque = deque()  # (chave, valor, timestamp_ms, step)
+        self._params: deque = deque()  # (chave, valor)
+        self._wakeup = threading.Event()
+        self._stop = threading.Event()
+        self._flush_lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self._collectors: List[Callable[[bool], None]] = []
+        self.counters = SharedCounters(("buffered", "dropped", "sent", "batches", "errors"), stats_path)
+        os.register_at_fork(after_in_child=self._after_fork)
+
+    def add_collector(self, collector: Callable[[bool], None]):
+        """Registra uma função chamada antes de cada envio (argumento: encerramento)"""
+        self._collectors.append(collector)
+
+    def start(self, run_id: str):
+        """Inicia a thread de envio para a run"""
+        self.run_id = run_id
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="mlflow-telemetry", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Interrompe a thread e envia o que restou no buffer"""
+        self._stop.set()
+        self._wakeup.set()
+        if self._thread is not None:
+            self._thread.join(timeout=self.flush_interval + 5)
+            self._thread = None
+        self._collect(final=True)
+        self.flush()
+
+    def add_metrics(self, metrics: Dict[str, float], step: Optional[int] = None, timestamp: Optional[float] = None):
+        """Acrescenta métricas ao buffer (sem I/O); ``timestamp`` em segundos, padrão agora"""
+        if len(self._metrics) + len(self._params) + len(metrics) > self.max_size:
+            self.counters.add("dropped", len(metrics))
+            return
+        timestamp = int((time.time() if timestamp is None else timestamp) * 1000)
+        self._metrics.extend((key, float(value), timestamp, step or 0) for key, value in metrics.items())
+        self.counters.add("buffered", len(metrics))
+        self._maybe_wakeup()
+
+    def add_params(self, params: Dict[str, Any]):
+        """Acrescenta parâmetros ao buffer (sem I/O)"""
+        if len(self._metrics) + len(self._params) + len(params) > self.max_size:
+            self.counters.add("dropped", len(params))
+            return
+        self._params.extend(params.items())
+        self.counters.add("buffered", len(params))
+        self._maybe_wakeup()
+
+    def _maybe_wakeup(self):
+        if len(self._metrics) + len(self._params) >= self.batch_size:
+            self._wakeup.set()
+
+    def _run(self):
+        while not self._stop.is_set():
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            self._collect(final=False)
+            self.flush()
+
+    def _collect(self, final: bool):
+        for collector in self._collectors:
+            try:
+                collector(final)
+            except Exception as e:
+                logger.error(f"❌ Erro ao coletar telemetria: {str(e)}")
+
+    def flush(self):
+        """Envia o buffer em chamadas log_batch (parâmetros e métricas separados)"""
+        with self._flush_lock:
+            if self.run_id is None:
+                return
+            client = MlflowClient()
+            while self._params:
+                # Chaves repetidas no mesmo batch são recusadas pelo MLflow
+                batch = {}
+                while self._params and len(batch) < self.MAX_PARAMS_PER_BATCH:
+                    key, value = self._params.popleft()
+                    batch.setdefault(key, str(value))
+                self._send(client, params=[Param(key, value) for key, value in batch.items()])
+            while self._metrics:
+                count = min(len(self._metrics), self.MAX_METRICS_PER_BATCH)
+                batch = [Metric(*self._metrics.popleft()) for _ in range(count)]
+                self._send(client, metrics=batch)
+
+    def _send(self, client: MlflowClient, **entities):
+        sent = sum(len(items) for items in entities.values())
+        try:
+            client.log_batch(self.run_id, **entities)
+            self.counters.add("sent", sent)
+            self.counters.add("batches")
+        except Exception as e:
+            self.counters.add("errors", sent)
+            logger.error(f"❌ Erro ao enviar batch ao MLFlow: {str(e)}")
+
+    def _after_fork(self):
+        """O filho não reenvia o buffer do pai e inicia a própria thread com a própria run"""
+        self._metrics = deque()
+        self._params = deque()
+        self._wakeup = threading.Event()
+        self._stop = threading.Event()
+        self._flush_lock = threading.Lock()
+        self._thread = None
+        self.run_id = None
+
+    def get_stats(self) -> Dict[str, int]:
+        """Itens aguardando envio neste processo e contadores somados entre workers"""
+        return {"buffer_depth": len(self._metrics) + len(self._params), **self.counters.totals()}
+
 class MLFlowManager:
     """Gerenciador para operações do MLFlow"""
     
@@ -48,6 +195,12 @@ class MLFlowManager:
         self.config = MLFlowConfig()
         self.experiment_id = None
         self.run_id = None
+        self.telemetry = TelemetryBuffer(
+            self.config.MLFLOW_BUFFER_SIZE,
+            self.config.MLFLOW_BATCH_SIZE,
+            self.config.MLFLOW_FLUSH_INTERVAL,
+            shared_metrics_path("mlflow_telemetry")
+        )
 
         # Só configurar MLFlow se estiver habilitado
         if self.config.ENABLE_TRACKING:
@@ -123,6 +276,7 @@ class MLFlowManager:
             )
             
             self.run_id = run.info.run_id
+            self.telemetry.start(self.run_id)
             logger.info(f"✅ MLFlow run iniciada: {self.run_id}")
             
             return run
@@ -137,6 +291,8 @@ class MLFlowManager:
             return
         
         try:
+            # Enviar o que ainda está no buffer antes de fechar a run
+            self.telemetry.stop()
             mlflow.end_run(status=status)
             logger.info(f"✅ MLFlow run finalizada: {self.run_id}")
             self.run_id = None
@@ -144,25 +300,24 @@ class MLFlowManager:
         except Exception as e:
             logger.error(f"❌ Erro ao finalizar run: {str(e)}")
     
-    def log_metrics(self, metrics: Dict[str, float], step: Optional[int] = None):
-        """Loga métricas no MLFlow"""
+    def log_metrics(self, metrics: Dict[str, float], step: Optional[int] = None, timestamp: Optional[float] = None):
+        """Loga métricas no MLFlow (enfileiradas para envio em batch)"""
         if not self.config.ENABLE_TRACKING or not self.run_id:
             return
         
         try:
-            for key, value in metrics.items():
-                mlflow.log_metric(key, value, step=step)
+            self.telemetry.add_metrics(metrics, step, timestamp)
             
         except Exception as e:
             logger.error(f"❌ Erro ao logar métricas: {str(e)}")
     
     def log_params(self, params: Dict[str, Any]):
-        """Loga parâmetros no MLFlow"""
+        """Loga parâmetros no MLFlow (enfileirados para envio em batch)"""
         if not self.config.ENABLE_TRACKING or not self.run_id:
             return
         
         try:
-            mlflow.log_params(params)
+            self.telemetry.add_params(params)
             
         except Exception as e:
             logger.error(f"❌ Erro ao logar parâmetros: {str(e)}")
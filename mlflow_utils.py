@@ -5,25 +5,163 @@ Utilitários para integração com MLFlow
 import mlflow
 import mlflow.tensorflow
 import numpy as np
-from typing import Dict, Any, Optional, List
+from typing import Dict, Any, Optional, List, Sequence
 import logging
+import os
+import threading
 import time
 from datetime import datetime
 import json
-from functools import wraps
 
 from mlflow_config import mlflow_manager
+from quantile_sketch import DDSketch, quantile_label
 
 logger = logging.getLogger(__name__)
 
+class RunningStats:
+    """Média e variância acumuladas (Welford), sem guardar os valores"""
+
+    def __init__(self):
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+
+    def add(self, value: float):
+        """Registra um valor"""
+        self.count += 1
+        delta = value - self.mean
+        self.mean += delta / self.count
+        self.m2 += delta * (value - self.mean)
+
+    @property
+    def std(self) -> float:
+        """Desvio padrão populacional (como ``np.std``)"""
+        return (self.m2 / self.count) ** 0.5 if self.count else 0.0
+
+class _IntervalStats:
+    """Acumulado das predições de um intervalo"""
+
+    def __init__(self, interval_id: int):
+        self.interval_id = interval_id
+        self.count = 0
+        self.errors = 0
+        self.class_counts: Dict[str, int] = {}
+        self.prob_sums: Dict[str, float] = {}
+        self.confidence_sum = 0.0
+        self.confidence = DDSketch(min_value=0.01, max_value=100)
+        self.latency_sum = 0.0
+        self.latency = DDSketch()
+
+    def summary(self) -> Dict[str, float]:
+        """Métricas do intervalo enviadas ao MLflow"""
+        metrics = {"predictions_count": self.count, "prediction_errors_count": self.errors}
+        if self.count == 0:
+            return metrics
+        for class_name, count in self.class_counts.items():
+            metrics[f"class_count_{class_name}"] = count
+        for class_name, prob_sum in self.prob_sums.items():
+            metrics[f"prob_{class_name}_mean"] = prob_sum / self.count
+        metrics["confidence_mean"] = self.confidence_sum / self.count
+        for q, value in self.confidence.quantiles((0.1, 0.5, 0.9)).items():
+            metrics[f"confidence_{quantile_label(q)}"] = value
+        metrics["latency_ms_mean"] = self.latency_sum / self.count
+        for q, value in self.latency.quantiles((0.5, 0.9, 0.99)).items():
+            metrics[f"latency_ms_{quantile_label(q)}"] = value
+        return metrics
+
+class PredictionAggregator:
+    """
+    Telemetria de predições agregada em intervalos fixos
+
+    Cada predição só atualiza contadores e sketches do intervalo corrente
+    (alinhado ao relógio: ``step`` = ``int(time.time() // interval)``). Os
+    intervalos encerrados viram um único conjunto de métricas, com esse step e
+    o timestamp do fim do intervalo, enviado pela thread de telemetria do
+    ``mlflow_config``: o volume de escrita no tracking server depende do tempo,
+    não do tráfego. O intervalo em andamento é enviado no encerramento da run.
+    """
+
+    def __init__(self, interval: int):
+        self.interval = interval
+        self._lock = threading.Lock()
+        self._current = _IntervalStats(self._interval_id())
+        self._completed: List[_IntervalStats] = []
+        self.intervals_emitted = 0
+        os.register_at_fork(after_in_child=self._after_fork)
+
+    def _interval_id(self) -> int:
+        return int(time.time() // self.interval)
+
+    def _stats(self) -> _IntervalStats:
+        """Acumulado do intervalo corrente (chamado com o lock)"""
+        interval_id = self._interval_id()
+        if interval_id != self._current.interval_id:
+            self._completed.append(self._current)
+            self._current = _IntervalStats(interval_id)
+        return self._current
+
+    def add_prediction(self, predicted_class: str, confidence: float, inference_time: float,
+                       all_predictions: Dict[str, float]):
+        """Acrescenta uma predição ao intervalo corrente (sem I/O)"""
+        latency_ms = inference_time * 1000
+        with self._lock:
+            stats = self._stats()
+            stats.count += 1
+            stats.class_counts[predicted_class] = stats.class_counts.get(predicted_class, 0) + 1
+            for class_name, prob in all_predictions.items():
+                stats.prob_sums[class_name] = stats.prob_sums.get(class_name, 0.0) + prob
+            stats.confidence_sum += confidence
+            stats.confidence.add(confidence)
+            stats.latency_sum += latency_ms
+            stats.latency.add(latency_ms)
+
+    def add_error(self):
+        """Conta uma falha de inferência no intervalo corrente"""
+        with self._lock:
+            self._stats().errors += 1
+
+    def collect(self, final: bool = False):
+        """Envia os intervalos encerrados (e o corrente, se ``final``) ao buffer do MLflow"""
+        with self._lock:
+            self._stats()
+            completed, self._completed = self._completed, []
+            if final:
+                completed.append(self._current)
+                self._current = _IntervalStats(self._interval_id())
+        for stats in completed:
+            if stats.count == 0 and stats.errors == 0:
+                continue
+            end = min((stats.interval_id + 1) * self.interval, time.time())
+            mlflow_manager.log_metrics(stats.summary(), step=stats.interval_id, timestamp=end)
+            self.intervals_emitted += 1
+
+    def _after_fork(self):
+        # O acumulado do pai é enviado pelo pai
+        self._lock = threading.Lock()
+        self._current = _IntervalStats(self._interval_id())
+        self._completed = []
+
+# Agregação global da telemetria de predições, enviada pela thread de telemetria
+prediction_telemetry = PredictionAggregator(mlflow_manager.config.MLFLOW_AGGREGATION_INTERVAL)
+mlflow_manager.telemetry.add_collector(prediction_telemetry.collect)
+
 class MLFlowTracker:
-    """Classe para tracking de predições e métricas"""
+    """
+    Classe para tracking de predições e métricas
+
+    As estatísticas da sessão são acumuladas sem guardar as predições (média e
+    variância de Welford, contagem por classe e sketches de quantis): memória
+    constante e resumo O(classes), qualquer que seja a duração da sessão.
+    """
     
     def __init__(self):
         self.prediction_count = 0
         self.total_inference_time = 0.0
-        self.confidence_scores = []
-        self.class_predictions = []
+        self.confidence = RunningStats()
+        self.inference_time = RunningStats()
+        self.confidence_sketch = DDSketch(min_value=0.01, max_value=100)
+        self.inference_time_sketch = DDSketch()  # ms
+        self.class_counts: Dict[str, int] = {}
     
     def track_prediction(self, 
                         predicted_class: str, 
@@ -35,21 +173,14 @@ class MLFlowTracker:
         
         self.prediction_count += 1
         self.total_inference_time += inference_time
-        self.confidence_scores.append(confidence)
-        self.class_predictions.append(predicted_class)
+        self.confidence.add(confidence)
+        self.inference_time.add(inference_time)
+        self.confidence_sketch.add(confidence)
+        self.inference_time_sketch.add(inference_time * 1000)
+        self.class_counts[predicted_class] = self.class_counts.get(predicted_class, 0) + 1
         
-        # Log métricas da predição
-        metrics = {
-            "inference_time_ms": inference_time * 1000,
-            "confidence_score": confidence,
-            "prediction_count": self.prediction_count
-        }
-        
-        # Adicionar distribuição de classes
-        for class_name, prob in all_predictions.items():
-            metrics[f"prob_{class_name}"] = prob
-        
-        mlflow_manager.log_metrics(metrics)
+        # Métricas agregadas por intervalo (enviadas em background)
+        prediction_telemetry.add_prediction(predicted_class, confidence, inference_time, all_predictions)
         
         # Log parâmetros se fornecidos
         if image_metadata:
@@ -57,7 +188,7 @@ class MLFlowTracker:
                 f"image_{k}": v for k, v in image_metadata.items()
             })
         
-        logger.info(f"📊 Predição trackada: {predicted_class} ({confidence:.2f}%)")
+        logger.info("📊 Predição trackada: %s (%.2f%%)", predicted_class, confidence, extra={"event": "prediction"})
     
     def get_session_metrics(self) -> Dict[str, float]:
         """Obtém métricas da sessão atual"""
@@ -65,18 +196,23 @@ class MLFlowTracker:
             return {}
         
         avg_inference_time = self.total_inference_time / self.prediction_count
-        avg_confidence = np.mean(self.confidence_scores)
         
         # Distribuição de classes
-        class_distribution = {}
-        for class_name in set(self.class_predictions):
-            count = self.class_predictions.count(class_name)
-            class_distribution[f"class_dist_{class_name}"] = count / self.prediction_count
+        class_distribution = {
+            f"class_dist_{class_name}": count / self.prediction_count
+            for class_name, count in self.class_counts.items()
+        }
         
         metrics = {
             "session_total_predictions": self.prediction_count,
             "session_avg_inference_time_ms": avg_inference_time * 1000,
-            "session_avg_confidence": avg_confidence,
+            "session_std_inference_time_ms": self.inference_time.std * 1000,
+            "session_avg_confidence": self.confidence.mean,
+            "session_std_confidence": self.confidence.std,
+            **{f"session_confidence_{quantile_label(q)}": value
+               for q, value in self.confidence_sketch.quantiles((0.1, 0.5, 0.9)).items()},
+            **{f"session_inference_time_ms_{quantile_label(q)}": value
+               for q, value in self.inference_time_sketch.quantiles((0.5, 0.9, 0.99)).items()},
             **class_distribution
         }
         
@@ -92,147 +228,158 @@ class MLFlowTracker:
 # Instância global do tracker
 mlflow_tracker = MLFlowTracker()
 
-def mlflow_track_prediction(func):
-    """Decorator para tracking automático de predições"""
-    @wraps(func)
-    async def wrapper(*args, **kwargs):
-        start_time = time.time()
-        
-        try:
-            # Executar função original
-            result = await func(*args, **kwargs)
-            
-            # Calcular tempo de inferência
-            inference_time = time.time() - start_time
-            
-            # Extrair dados da predição
-            if hasattr(result, 'predicted_class') and hasattr(result, 'confidence'):
-                predicted_class = result.predicted_class
-                confidence = result.confidence
-                all_predictions = getattr(result, 'all_predictions', {})
-                
-                # Trackar predição
-                mlflow_tracker.track_prediction(
-                    predicted_class=predicted_class,
-                    confidence=confidence,
-                    inference_time=inference_time,
-                    all_predictions=all_predictions
-                )
-            
-            return result
-            
-        except Exception as e:
-            # Log erro
-            mlflow_manager.log_metrics({
-                "error_count": 1,
-                "error_inference_time_ms": (time.time() - start_time) * 1000
-            })
-            
-            mlflow_manager.log_params({
-                "error_message": str(e),
-                "error_timestamp": datetime.utcnow().isoformat()
-            })
-            
-            raise
-    
-    return wrapper
-
-def mlflow_track_health_check(func):
-    """Decorator para tracking de health checks"""
-    @wraps(func)
-    async def wrapper(*args, **kwargs):
-        start_time = time.time()
-        
-        try:
-            result = await func(*args, **kwargs)
-            
-            # Log métricas de health check
-            response_time = time.time() - start_time
-            
-            metrics = {
-                "health_check_response_time_ms": response_time * 1000,
-                "health_check_count": 1
-            }
-            
-            if hasattr(result, 'model_loaded'):
-                metrics["model_loaded"] = 1 if result.model_loaded else 0
-            
-            mlflow_manager.log_metrics(metrics)
-            
-            return result
-            
-        except Exception as e:
-            mlflow_manager.log_metrics({
-                "health_check_error_count": 1
-            })
-            raise
-    
-    return wrapper
+# Colunas do vetor de cada predição; as contagens por classe vêm depois
+_COUNT, _CONF, _CONF_SQ, _TIME, _TIME_SQ, _LOW_CONF = range(6)
+_CLASS_OFFSET = 6
 
 class ModelPerformanceMonitor:
-    """Monitor de performance do modelo"""
+    """
+    Monitor de performance do modelo
+
+    Cada predição vira um vetor (1, confiança, confiança², tempo, tempo²,
+    baixa confiança, classe one-hot) gravado em um ring buffer NumPy
+    preallocado. Cada janela por contagem (``windows``) mantém a soma desses
+    vetores: a inserção soma o novo e subtrai o que saiu da janela, em O(1), e
+    a leitura só divide somas. A janela por tempo (``time_window`` segundos) é
+    um anel de fatias, cada uma com a soma das suas predições. As somas são
+    refeitas a partir do buffer a cada volta completa dele, para não acumular
+    erro de ponto flutuante.
+
+    ``window_size`` é a janela das métricas ``recent_*`` e da detecção de drift.
+    """
     
-    def __init__(self, window_size: int = 100):
+    def __init__(self, window_size: int = 100, windows: Sequence[int] = (100, 1000, 10000),
+                 time_window: float = 300, time_slices: int = 60):
         self.window_size = window_size
-        self.recent_predictions = []
-        self.recent_confidences = []
-        self.recent_times = []
+        self.windows = sorted(set(windows) | {window_size})
+        self.time_window = time_window
+        self.time_slices = time_slices
+        self.slice_seconds = time_window / time_slices
+        self.capacity = self.windows[-1]
+        self.total = 0
+        self.classes: List[str] = []
+        self._class_index: Dict[str, int] = {}
+        self._lock = threading.Lock()
+        self._sizes = np.array(self.windows)
+        self._ring = np.zeros((self.capacity, _CLASS_OFFSET))
+        self._sums = np.zeros((len(self.windows), _CLASS_OFFSET))
+        self._slices = np.zeros((time_slices, _CLASS_OFFSET))
+        self._slice_ids = np.full(time_slices, -1, dtype=np.int64)
     
     def add_prediction(self, predicted_class: str, confidence: float, inference_time: float):
         """Adiciona uma predição ao monitor"""
-        self.recent_predictions.append(predicted_class)
-        self.recent_confidences.append(confidence)
-        self.recent_times.append(inference_time)
-        
-        # Manter apenas as últimas N predições
-        if len(self.recent_predictions) > self.window_size:
-            self.recent_predictions.pop(0)
-            self.recent_confidences.pop(0)
-            self.recent_times.pop(0)
+        with self._lock:
+            index = self._class_index.get(predicted_class)
+            if index is None:
+                index = self._add_class(predicted_class)
+
+            # Janelas cheias perdem a predição mais antiga (antes de o slot ser sobrescrito)
+            position = self.total % self.capacity
+            if self.total >= self.capacity:
+                self._sums -= self._ring[(position - self._sizes) % self.capacity]
+            elif self.total >= self.windows[0]:
+                full = self._sizes <= self.total
+                self._sums[full] -= self._ring[(position - self._sizes[full]) % self.capacity]
+
+            row = self._ring[position]
+            row[:_CLASS_OFFSET] = (1, confidence, confidence * confidence, inference_time,
+                                   inference_time * inference_time, confidence < 70)
+            row[_CLASS_OFFSET:] = 0
+            row[_CLASS_OFFSET + index] = 1
+            self._sums += row
+
+            slice_id = int(time.time() // self.slice_seconds)
+            slot = slice_id % self.time_slices
+            if self._slice_ids[slot] != slice_id:
+                self._slices[slot] = 0
+                self._slice_ids[slot] = slice_id
+            self._slices[slot] += row
+
+            self.total += 1
+            if position == self.capacity - 1:
+                self._recompute()
+
+    def _add_class(self, class_name: str) -> int:
+        """Nova coluna de contagem para uma classe ainda não vista"""
+        self._class_index[class_name] = len(self.classes)
+        self.classes.append(class_name)
+        self._ring = np.hstack([self._ring, np.zeros((len(self._ring), 1))])
+        self._sums = np.hstack([self._sums, np.zeros((len(self._sums), 1))])
+        self._slices = np.hstack([self._slices, np.zeros((len(self._slices), 1))])
+        return self._class_index[class_name]
+
+    def _recompute(self):
+        """Refaz as somas das janelas a partir do buffer"""
+        for i, size in enumerate(self.windows):
+            count = min(size, self.total)
+            positions = (self.total - 1 - np.arange(count)) % self.capacity
+            self._sums[i] = self._ring[positions].sum(axis=0)
+
+    def _time_sums(self) -> np.ndarray:
+        """Soma das fatias ainda dentro da janela por tempo (chamado com o lock)"""
+        oldest = int(time.time() // self.slice_seconds) - self.time_slices
+        return self._slices[self._slice_ids > oldest].sum(axis=0)
+
+    def _summarize(self, sums: np.ndarray) -> Dict[str, Any]:
+        """Métricas de uma janela a partir das somas"""
+        count = int(sums[_COUNT])
+        if count == 0:
+            return {"count": 0}
+        avg_confidence = sums[_CONF] / count
+        avg_time = sums[_TIME] / count
+        return {
+            "count": count,
+            "avg_confidence": float(avg_confidence),
+            "std_confidence": float(np.sqrt(max(sums[_CONF_SQ] / count - avg_confidence ** 2, 0.0))),
+            "avg_inference_time_ms": float(avg_time * 1000),
+            "std_inference_time_ms": float(np.sqrt(max(sums[_TIME_SQ] / count - avg_time ** 2, 0.0)) * 1000),
+            "low_confidence_ratio": float(sums[_LOW_CONF] / count),
+            "class_ratios": {
+                class_name: float(sums[_CLASS_OFFSET + i] / count)
+                for i, class_name in enumerate(self.classes) if sums[_CLASS_OFFSET + i] > 0
+            }
+        }
     
     def get_performance_metrics(self) -> Dict[str, float]:
-        """Calcula métricas de performance"""
-        if not self.recent_predictions:
+        """Calcula métricas de performance (janela ``window_size``)"""
+        with self._lock:
+            sums = self._sums[self.windows.index(self.window_size)].copy()
+        summary = self._summarize(sums)
+        if summary["count"] == 0:
             return {}
         
-        # Métricas básicas
-        avg_confidence = np.mean(self.recent_confidences)
-        avg_inference_time = np.mean(self.recent_times)
-        std_confidence = np.std(self.recent_confidences)
-        std_inference_time = np.std(self.recent_times)
-        
         # Distribuição de classes
-        class_counts = {}
-        for pred in self.recent_predictions:
-            class_counts[pred] = class_counts.get(pred, 0) + 1
-        
-        total_preds = len(self.recent_predictions)
         class_distribution = {
-            f"recent_class_ratio_{k}": v / total_preds 
-            for k, v in class_counts.items()
+            f"recent_class_ratio_{k}": v for k, v in summary["class_ratios"].items()
         }
         
-        # Detectar possível drift (confiança muito baixa)
-        low_confidence_ratio = sum(1 for c in self.recent_confidences if c < 70) / total_preds
-        
         metrics = {
-            "recent_avg_confidence": avg_confidence,
-            "recent_avg_inference_time_ms": avg_inference_time * 1000,
-            "recent_std_confidence": std_confidence,
-            "recent_std_inference_time_ms": std_inference_time * 1000,
-            "recent_low_confidence_ratio": low_confidence_ratio,
-            "recent_prediction_count": total_preds,
+            "recent_avg_confidence": summary["avg_confidence"],
+            "recent_avg_inference_time_ms": summary["avg_inference_time_ms"],
+            "recent_std_confidence": summary["std_confidence"],
+            "recent_std_inference_time_ms": summary["std_inference_time_ms"],
+            # Detectar possível drift (confiança muito baixa)
+            "recent_low_confidence_ratio": summary["low_confidence_ratio"],
+            "recent_prediction_count": summary["count"],
             **class_distribution
         }
         
         return metrics
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Métricas de todas as janelas (deste worker), barato o bastante para o /metrics"""
+        with self._lock:
+            sums = self._sums.copy()
+            time_sums = self._time_sums()
+        windows = {f"last_{size}": self._summarize(row) for size, row in zip(self.windows, sums)}
+        windows[f"last_{self.time_window:g}s"] = self._summarize(time_sums)
+        return {"total_predictions": self.total, "windows": windows}
     
     def check_model_drift(self) -> Dict[str, Any]:
         """Verifica possível drift do modelo"""
-        if len(self.recent_predictions) < self.window_size // 2:
-            return {"drift_detected": False, "reason": "insufficient_data"}
-        
         metrics = self.get_performance_metrics()
+        if metrics.get("recent_prediction_count", 0) < self.window_size // 2:
+            return {"drift_detected": False, "reason": "insufficient_data"}
         
         # Critérios para detecção de drift
         drift_indicators = []
@@ -29,6 +29,94 @@ class PredictionResponse(BaseModel):
             }
         }
 
+class BatchPredictionResponse(BaseModel):
+    """Modelo de resposta para predições em batch"""
+    count: int = Field(..., ge=0, description="Número de imagens classificadas")
+    predictions: List[PredictionResponse] = Field(..., description="Predições na ordem de entrada")
+    
+    class Config:
+        json_schema_extra = {
+            "example": {
+                "count": 1,
+                "predictions": [
+                    {
+                        "predicted_class": "normal",
+                        "confidence": 95.67,
+                        "all_predictions": {
+                            "cataract": 1.23,
+                            "diabetic_retinopathy": 2.10,
+                            "glaucoma": 1.00,
+                            "normal": 95.67
+                        }
+                    }
+                ]
+            }
+        }
+
+class PathPredictionRequest(BaseModel):
+    """Requisição de predição por caminho em volume montado"""
+    paths: List[str] = Field(..., min_length=1, description="Caminhos relativos à raiz configurada")
+    
+    class Config:
+        json_schema_extra = {
+            "example": {
+                "paths": ["2024/patient_001/left.jpg", "2024/patient_001/right.jpg"]
+            }
+        }
+
+class PathPredictionResult(BaseModel):
+    """Resultado da predição de um caminho"""
+    path: str = Field(..., description="Caminho informado na requisição")
+    prediction: Optional[PredictionResponse] = Field(None, description="Predição, se bem-sucedida")
+    error: Optional[str] = Field(None, description="Motivo da falha, se houver")
+
+class PathPredictionResponse(BaseModel):
+    """Modelo de resposta para predições por caminho"""
+    count: int = Field(..., ge=0, description="Número de caminhos processados")
+    succeeded: int = Field(..., ge=0, description="Predições bem-sucedidas")
+    failed: int = Field(..., ge=0, description="Caminhos com erro")
+    elapsed_seconds: float = Field(..., ge=0, description="Tempo total de processamento")
+    images_per_second: float = Field(..., ge=0, description="Throughput da requisição")
+    results: List[PathPredictionResult] = Field(..., description="Resultados na ordem de entrada")
+
+class JobRequest(BaseModel):
+    """Requisição de job em lote por caminhos em volume montado"""
+    paths: List[str] = Field(..., min_length=1, description="Caminhos relativos à raiz configurada")
+    
+    class Config:
+        json_schema_extra = {
+            "example": {
+                "paths": ["archive/2019/patient_001/left.jpg", "archive/2019/patient_001/right.jpg"]
+            }
+        }
+
+class JobResponse(BaseModel):
+    """Estado e progresso de um job em lote"""
+    job_id: str = Field(..., description="Identificador do job")
+    status: str = Field(..., description="queued, running ou completed")
+    total: int = Field(..., ge=0, description="Itens no job")
+    completed: int = Field(..., ge=0, description="Itens processados")
+    succeeded: int = Field(..., ge=0, description="Predições bem-sucedidas")
+    failed: int = Field(..., ge=0, description="Itens com erro")
+    created_at: str = Field(..., description="Criação do job (UTC)")
+    started_at: Optional[str] = Field(None, description="Início do processamento (UTC)")
+    finished_at: Optional[str] = Field(None, description="Conclusão do job (UTC)")
+
+class JobItemResult(BaseModel):
+    """Resultado de um item de job"""
+    index: int = Field(..., ge=0, description="Posição do item na requisição")
+    source: str = Field(..., description="Caminho ou nome do arquivo enviado")
+    prediction: Optional[PredictionResponse] = Field(None, description="Predição, se bem-sucedida")
+    error: Optional[str] = Field(None, description="Motivo da falha, se houver")
+
+class JobResultsResponse(BaseModel):
+    """Página de resultados de um job"""
+    job_id: str = Field(..., description="Identificador do job")
+    status: str = Field(..., description="queued, running ou completed")
+    offset: int = Field(..., ge=0, description="Posição inicial da página")
+    count: int = Field(..., ge=0, description="Resultados nesta página")
+    results: List[JobItemResult] = Field(..., description="Resultados concluídos, em ordem de entrada")
+
 class ErrorResponse(BaseModel):
     """Modelo de resposta para erros"""
     error: str = Field(..., description="Mensagem de erro")
@@ -47,13 +135,15 @@ class HealthResponse(BaseModel):
     status: str = Field(..., description="Status da API")
     model_loaded: bool = Field(..., description="Se o modelo está carregado")
     version: str = Field(..., description="Versão da API")
+    event_loop_lag_ms: Optional[float] = Field(None, description="Atraso do event loop principal em ms")
     
     class Config:
         json_schema_extra = {
             "example": {
                 "status": "healthy",
                 "model_loaded": True,
-                "version": "1.0.0"
+                "version": "1.0.0",
+                "event_loop_lag_ms": 0.4
             }
         }
 
@@ -4,147 +4,328 @@ Módulo de monitoramento e métricas para a API
 
 import time
 import logging
-from functools import wraps
-from typing import Dict, Any
+from typing import Dict, Any, List, Optional, Tuple
 import json
+import os
+import threading
+from bisect import bisect_left
+from contextlib import contextmanager
+from contextvars import ContextVar, Token
 from datetime import datetime
 
+import psutil
+
+from image_processing import REJECT_REASONS
+from production_config import get_config
+from quantile_sketch import WindowedQuantiles
+from shared_counters import SharedCounters
+
 logger = logging.getLogger(__name__)
 
 class APIMetrics:
-    """Classe para coletar métricas da API"""
+    """
+    Classe para coletar métricas da API
+
+    Os contadores ficam em uma tabela ``SharedCounters``: seguros para
+    incremento a partir de threads dos executores sem lock e, com
+    ``METRICS_FILE``, somados entre todos os workers da instância.
+    """
     
-    def __init__(self):
-        self.request_count = 0
-        self.prediction_count = 0
-        self.error_count = 0
-        self.total_response_time = 0.0
-        self.start_time = time.time()
+    # Origens das predições (rotas HTTP/WebSocket e o serviço gRPC)
+    PREDICTION_ENDPOINTS = ("/predict", "/predict/tensor", "/predict/paths", "/ws/predict", "grpc", "/jobs")
+    
+    FIELDS = (
+        "requests", "errors", "response_time_us",
+        *(f"predictions_{endpoint}" for endpoint in PREDICTION_ENDPOINTS),
+        *(f"image_rejects_{reason}" for reason in REJECT_REASONS), "image_rejects_other"
+    )
+    
+    def __init__(self, path: Optional[str] = None):
+        self.counters = SharedCounters(self.FIELDS, path)
+        self.start_time = self.counters.started_at
         
     def increment_requests(self):
         """Incrementa contador de requests"""
-        self.request_count += 1
+        self.counters.add("requests")
         
-    def increment_predictions(self):
-        """Incrementa contador de predições"""
-        self.prediction_count += 1
+    def increment_predictions(self, endpoint: str, count: int = 1):
+        """Incrementa contador de predições da origem ``endpoint``"""
+        self.counters.add(f"predictions_{endpoint}", count)
         
     def increment_errors(self):
         """Incrementa contador de erros"""
-        self.error_count += 1
+        self.counters.add("errors")
+        
+    def increment_image_rejects(self, reason: str):
+        """Incrementa contador de imagens recusadas na inspeção do cabeçalho"""
+        field = f"image_rejects_{reason}"
+        self.counters.add(field if field in self.counters.index else "image_rejects_other")
         
     def add_response_time(self, response_time: float):
         """Adiciona tempo de resposta"""
-        self.total_response_time += response_time
+        self.counters.add("response_time_us", int(response_time * 1_000_000))
+        
+    def get_predictions_by_endpoint(self, totals: Optional[Dict[str, int]] = None) -> Dict[str, int]:
+        """Predições por origem"""
+        totals = totals or self.counters.totals()
+        return {endpoint: totals[f"predictions_{endpoint}"] for endpoint in self.PREDICTION_ENDPOINTS}
         
     def get_metrics(self) -> Dict[str, Any]:
-        """Retorna métricas atuais"""
+        """Retorna métricas atuais (totais da instância)"""
+        totals = self.counters.totals()
         uptime = time.time() - self.start_time
+        request_count = totals["requests"]
         avg_response_time = (
-            self.total_response_time / self.request_count 
-            if self.request_count > 0 else 0
+            totals["response_time_us"] / 1_000_000 / request_count
+            if request_count > 0 else 0
         )
+        image_rejects = {
+            field[len("image_rejects_"):]: count
+            for field, count in totals.items() if field.startswith("image_rejects_") and count > 0
+        }
         
         return {
             "uptime_seconds": round(uptime, 2),
-            "total_requests": self.request_count,
-            "total_predictions": self.prediction_count,
-            "total_errors": self.error_count,
+            "total_requests": request_count,
+            "total_predictions": sum(self.get_predictions_by_endpoint(totals).values()),
+            "total_errors": totals["errors"],
             "average_response_time_ms": round(avg_response_time * 1000, 2),
-            "requests_per_second": round(self.request_count / uptime, 2) if uptime > 0 else 0,
-            "error_rate": round(self.error_count / self.request_count * 100, 2) if self.request_count > 0 else 0
+            "requests_per_second": round(request_count / uptime, 2) if uptime > 0 else 0,
+            "error_rate": round(totals["errors"] / request_count * 100, 2) if request_count > 0 else 0,
+            "image_rejects": image_rejects,
+            "processes": len(self.counters.live_pids())
         }
 
 # Instância global de métricas
-metrics = APIMetrics()
-
-def log_request(func):
-    """Decorator para logar requests e coletar métricas"""
-    @wraps(func)
-    async def wrapper(*args, **kwargs):
-        start_time = time.time()
-        metrics.increment_requests()
-        
-        try:
-            # Log do início da request
-            logger.info(f"Starting {func.__name__}")
-            
-            # Executar função
-            result = await func(*args, **kwargs)
-            
-            # Calcular tempo de resposta
-            response_time = time.time() - start_time
-            metrics.add_response_time(response_time)
-            
-            # Log de sucesso
-            logger.info(f"Completed {func.__name__} in {response_time:.3f}s")
-            
-            return result
-            
-        except Exception as e:
-            # Calcular tempo de resposta mesmo em caso de erro
-            response_time = time.time() - start_time
-            metrics.add_response_time(response_time)
-            metrics.increment_errors()
-            
-            # Log de erro
-            logger.error(f"Error in {func.__name__} after {response_time:.3f}s: {str(e)}")
-            raise
-            
-    return wrapper
-
-def log_prediction(func):
-    """Decorator específico para logar predições"""
-    @wraps(func)
-    async def wrapper(*args, **kwargs):
-        start_time = time.time()
-        metrics.increment_predictions()
-        
+metrics = APIMetrics(get_config().METRICS_FILE)
+
+# Estágios de um request, na ordem em que aparecem no Server-Timing: upload_read é o
+# corpo vindo da rede (middleware) e upload_copy a releitura do arquivo já recebido
+REQUEST_STAGES = ("upload_read", "upload_copy", "decode", "preprocess", "queue_wait", "inference", "postprocess", "serialize")
+
+# Rotas HTTP com série própria nos histogramas e quantis; as demais (docs, 404) entram em "other"
+HTTP_ROUTES = ("/", "/health", "/metrics", "/metrics/prometheus", "/predict", "/predict/tensor", "/predict/paths",
+               "/jobs", "/jobs/images", "/jobs/{job_id}", "/jobs/{job_id}/results", "/jobs/{job_id}/events", "other")
+
+class RequestTiming:
+    """
+    Tempo gasto por estágio em um request
+
+    Criado pelo ``RequestTimingMiddleware`` e acessível via ``get_request_timing()``
+    no código do endpoint. Estágios executados em threads (decode, inferência)
+    recebem a instância explicitamente, já que o contexto não é propagado
+    para os executores. Em requests com várias imagens, os estágios por imagem
+    são somados.
+    """
+
+    __slots__ = ("stages", "start", "_lock")
+
+    def __init__(self):
+        self.stages: Dict[str, float] = {}
+        self.start = time.perf_counter()
+        self._lock = threading.Lock()
+
+    def record(self, stage: str, seconds: float):
+        """Acumula a duração de um estágio"""
+        with self._lock:
+            self.stages[stage] = self.stages.get(stage, 0.0) + seconds
+
+    @contextmanager
+    def stage(self, name: str):
+        """Mede o bloco como o estágio ``name``"""
+        start = time.perf_counter()
         try:
-            result = await func(*args, **kwargs)
-            
-            response_time = time.time() - start_time
-            
-            # Log estruturado da predição
-            prediction_log = {
-                "timestamp": datetime.utcnow().isoformat(),
-                "function": func.__name__,
-                "response_time_ms": round(response_time * 1000, 2),
-                "predicted_class": result.predicted_class if hasattr(result, 'predicted_class') else None,
-                "confidence": result.confidence if hasattr(result, 'confidence') else None,
-                "status": "success"
-            }
-            
-            logger.info(f"PREDICTION: {json.dumps(prediction_log)}")
-            
-            return result
-            
-        except Exception as e:
-            response_time = time.time() - start_time
-            
-            # Log estruturado do erro
-            error_log = {
-                "timestamp": datetime.utcnow().isoformat(),
-                "function": func.__name__,
-                "response_time_ms": round(response_time * 1000, 2),
-                "error": str(e),
-                "status": "error"
-            }
-            
-            logger.error(f"PREDICTION_ERROR: {json.dumps(error_log)}")
-            raise
-            
-    return wrapper
-
-def log_health_check():
-    """Log para health checks"""
-    health_log = {
-        "timestamp": datetime.utcnow().isoformat(),
-        "type": "health_check",
-        "metrics": metrics.get_metrics()
+            yield
+        finally:
+            self.record(name, time.perf_counter() - start)
+
+    def elapsed(self) -> float:
+        """Segundos desde o início do request"""
+        return time.perf_counter() - self.start
+
+    def server_timing(self, total: float) -> str:
+        """Valor do header Server-Timing (durações em ms)"""
+        parts = [f"{name};dur={seconds * 1000:.2f}" for name, seconds in self.stages.items()]
+        parts.append(f"total;dur={total * 1000:.2f}")
+        return ", ".join(parts)
+
+_request_timing: ContextVar[Optional[RequestTiming]] = ContextVar("request_timing", default=None)
+
+def get_request_timing() -> Optional[RequestTiming]:
+    """Timing do request atual (None fora de um request HTTP)"""
+    return _request_timing.get()
+
+def set_request_timing(timing: Optional[RequestTiming]) -> Token:
+    """Define o timing do request atual; retorna o token para ``reset_request_timing``"""
+    return _request_timing.set(timing)
+
+def reset_request_timing(token: Token):
+    """Restaura o timing anterior"""
+    _request_timing.reset(token)
+
+@contextmanager
+def request_stage(name: str):
+    """Mede o bloco como estágio do request atual (sem efeito fora de um request)"""
+    timing = _request_timing.get()
+    if timing is None:
+        yield
+        return
+    with timing.stage(name):
+        yield
+
+class LatencyHistograms:
+    """
+    Histogramas de buckets fixos: latência por estágio e por rota, status por
+    rota e tamanho dos batches de inferência
+
+    Ficam em uma tabela ``SharedCounters`` (com ``METRICS_FILE``, no arquivo
+    ``<METRICS_FILE>.histograms``): cada observação é um ``bisect`` e
+    incrementos sem lock, somados entre os workers como os contadores de
+    ``APIMetrics``. Somas de latência são guardadas em microssegundos.
+    """
+
+    BUCKETS_MS = (1, 2.5, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+    BATCH_SIZE_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128)
+    ROUTES = HTTP_ROUTES
+    STATUS_CODES = ("200", "400", "403", "404", "405", "413", "415", "422", "429", "500", "503", "other")
+
+    def __init__(self, path: Optional[str] = None):
+        fields = []
+        for stage in REQUEST_STAGES:
+            fields += _histogram_fields(f"stage:{stage}", self.BUCKETS_MS)
+        for route in self.ROUTES:
+            fields += _histogram_fields(f"route:{route}", self.BUCKETS_MS)
+            fields += [f"status:{route}:{code}" for code in self.STATUS_CODES]
+        fields += _histogram_fields("batch_size", self.BATCH_SIZE_BUCKETS)
+        self.counters = SharedCounters(fields, path, rows=128)
+
+    def observe_request(self, route: str, stages: Dict[str, float], total: float, status_code: int):
+        """Registra os estágios, o tempo total e o status de um request (rota já normalizada)"""
+        for stage, seconds in stages.items():
+            self._observe(f"stage:{stage}", self.BUCKETS_MS, seconds * 1000, 1000)
+        self._observe(f"route:{route}", self.BUCKETS_MS, total * 1000, 1000)
+        code = str(status_code)
+        self.counters.add(f"status:{route}:{code if code in self.STATUS_CODES else 'other'}")
+
+    def observe_batch(self, size: int):
+        """Registra o tamanho de um batch de inferência"""
+        self._observe("batch_size", self.BATCH_SIZE_BUCKETS, size, 1)
+
+    def _observe(self, name: str, buckets: Tuple[float, ...], value: float, sum_scale: int):
+        self.counters.add(f"{name}:{bisect_left(buckets, value)}")
+        self.counters.add(f"{name}:sum", int(value * sum_scale))
+
+    def snapshot(self) -> Dict[str, Any]:
+        """
+        Totais atuais: por histograma, contagens por bucket (não cumulativas,
+        a última é +Inf) e soma (ms para latência); status por (rota, código)
+        """
+        totals = self.counters.totals()
+
+        def histogram(name: str, buckets: Tuple[float, ...], sum_scale: int):
+            counts = [totals[f"{name}:{i}"] for i in range(len(buckets) + 1)]
+            return counts, totals[f"{name}:sum"] / sum_scale
+
+        return {
+            "stages": {stage: histogram(f"stage:{stage}", self.BUCKETS_MS, 1000) for stage in REQUEST_STAGES},
+            "routes": {route: histogram(f"route:{route}", self.BUCKETS_MS, 1000) for route in self.ROUTES},
+            "statuses": {
+                (route, code): totals[f"status:{route}:{code}"]
+                for route in self.ROUTES for code in self.STATUS_CODES
+            },
+            "batch_size": histogram("batch_size", self.BATCH_SIZE_BUCKETS, 1)
+        }
+
+    def _summary(self, counts: List[int], total_ms: float) -> Dict[str, Any]:
+        count = sum(counts)
+        buckets = {}
+        cumulative = 0
+        for bound, bucket_count in zip(self.BUCKETS_MS + ("+Inf",), counts):
+            cumulative += bucket_count
+            buckets[str(bound)] = cumulative
+        return {
+            "count": count,
+            "sum_ms": round(total_ms, 2),
+            "avg_ms": round(total_ms / count, 2) if count > 0 else 0,
+            "buckets_ms": buckets
+        }
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Contagens cumulativas por bucket (le), soma e média dos estágios e rotas observados"""
+        snapshot = self.snapshot()
+        return {
+            kind: {name: self._summary(*histogram) for name, histogram in snapshot[kind].items() if sum(histogram[0])}
+            for kind in ("stages", "routes")
+        }
+
+def _histogram_fields(name: str, buckets: Tuple[float, ...]) -> List[str]:
+    """Colunas de um histograma: um contador por bucket (+Inf incluso) e a soma"""
+    return [f"{name}:{i}" for i in range(len(buckets) + 1)] + [f"{name}:sum"]
+
+def shared_metrics_path(suffix: str) -> Optional[str]:
+    """Arquivo de uma tabela adicional ao lado de ``METRICS_FILE`` (None sem ele)"""
+    path = get_config().METRICS_FILE
+    return f"{path}.{suffix}" if path else None
+
+# Instância global dos histogramas de latência
+latency_histograms = LatencyHistograms(shared_metrics_path("histograms"))
+
+# Sketches de quantis: todos os requests, por rota e por estágio
+latency_quantiles = WindowedQuantiles(
+    ("all", *(f"route:{route}" for route in HTTP_ROUTES), *(f"stage:{stage}" for stage in REQUEST_STAGES)),
+    shared_metrics_path("quantiles"),
+    rows=get_config().LATENCY_QUANTILE_ROWS
+)
+
+def observe_request(route: Optional[str], timing: RequestTiming, total: float, status_code: int):
+    """Registra um request concluído nos histogramas e nos sketches de quantis"""
+    route = route if route in HTTP_ROUTES else "other"
+    stages = {stage: seconds for stage, seconds in list(timing.stages.items()) if stage in REQUEST_STAGES}
+    latency_histograms.observe_request(route, stages, total, status_code)
+    latency_quantiles.observe({
+        "all": total * 1000,
+        f"route:{route}": total * 1000,
+        **{f"stage:{stage}": seconds * 1000 for stage, seconds in stages.items()}
+    })
+
+def get_latency_quantiles() -> Dict[str, Any]:
+    """p50/p90/p99/p99.9 (ms) por janela: todos os requests, por rota e por estágio"""
+    stats = latency_quantiles.get_stats()
+    return {
+        "all": stats.get("all", {}),
+        "routes": {name[len("route:"):]: value for name, value in stats.items() if name.startswith("route:")},
+        "stages": {name[len("stage:"):]: value for name, value in stats.items() if name.startswith("stage:")}
     }
-    
-    logger.info(f"HEALTH: {json.dumps(health_log)}")
+
+def get_process_memory(pid: Optional[int] = None) -> Dict[str, float]:
+    """
+    Memória de um processo em MB (padrão: o processo atual)
+
+    ``uss`` é a memória exclusiva do processo e ``pss`` divide as páginas
+    compartilhadas entre os processos que as usam; com workers pre-fork a
+    diferença entre ``rss`` e ``uss`` é o que vem herdado do mestre.
+    """
+    memory = get_process_memory_bytes(pid)
+    return {
+        "pid": pid or os.getpid(),
+        **{f"{kind}_mb": round(value / 1024 / 1024, 1) for kind, value in memory.items()}
+    }
+
+def get_process_memory_bytes(pid: Optional[int] = None) -> Dict[str, int]:
+    """RSS, USS e PSS de um processo em bytes (PSS é 0 fora do Linux)"""
+    info = psutil.Process(pid or os.getpid()).memory_full_info()
+    return {"rss": info.rss, "uss": info.uss, "pss": getattr(info, "pss", 0)}
+
+class LazyJSON:
+    """Serializa o objeto só quando a mensagem é formatada (na thread de escrita do log)"""
+
+    __slots__ = ("obj",)
+
+    def __init__(self, obj: Any):
+        self.obj = obj
+
+    def __str__(self) -> str:
+        return json.dumps(self.obj, default=str)
 
 class StructuredLogger:
     """Logger estruturado para Cloud Logging"""
@@ -157,18 +338,19 @@ class StructuredLogger:
             "type": "application_startup",
             "message": "Eye Disease Classifier API starting up"
         }
-        logger.info(f"STARTUP: {json.dumps(startup_log)}")
+        logger.info("STARTUP: %s", LazyJSON(startup_log))
     
     @staticmethod
-    def log_shutdown():
-        """Log de encerramento da aplicação"""
+    def log_shutdown(drain: Optional[Dict[str, Any]] = None):
+        """Log de encerramento da aplicação (com o resultado da drenagem do pipeline)"""
         shutdown_log = {
             "timestamp": datetime.utcnow().isoformat(),
             "type": "application_shutdown",
             "message": "Eye Disease Classifier API shutting down",
+            "drain": drain,
             "final_metrics": metrics.get_metrics()
         }
-        logger.info(f"SHUTDOWN: {json.dumps(shutdown_log)}")
+        logger.info("SHUTDOWN: %s", LazyJSON(shutdown_log))
     
     @staticmethod
     def log_model_load(success: bool, load_time: float = None, error: str = None):
@@ -182,9 +364,9 @@ class StructuredLogger:
         }
         
         if success:
-            logger.info(f"MODEL_LOAD: {json.dumps(model_log)}")
+            logger.info("MODEL_LOAD: %s", LazyJSON(model_log))
         else:
-            logger.error(f"MODEL_LOAD_ERROR: {json.dumps(model_log)}")
+            logger.error("MODEL_LOAD_ERROR: %s", LazyJSON(model_log))
 
 # Instância global do logger estruturado
 structured_logger = StructuredLogger()
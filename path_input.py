@@ -0,0 +1,43 @@
+"""
+Acesso restrito a imagens em um volume montado (predição por caminho)
+"""
+
+import logging
+import os
+from typing import Iterable
+
+logger = logging.getLogger(__name__)
+
+class PathNotAllowedError(ValueError):
+    """O caminho está fora da raiz permitida ou não é uma imagem suportada"""
+
+def resolve_allowed_path(path: str, root: str, supported_formats: Iterable[str]) -> str:
+    """
+    Resolve um caminho garantindo que ele esteja dentro de ``root``
+
+    Caminhos relativos são resolvidos a partir de ``root``. Symlinks são
+    seguidos antes da verificação, então um link apontando para fora da raiz
+    também é recusado.
+
+    Args:
+        path: Caminho informado pelo cliente
+        root: Diretório raiz permitido
+        supported_formats: Extensões aceitas (sem ponto)
+
+    Returns:
+        Caminho absoluto e canônico do arquivo
+
+    Raises:
+        PathNotAllowedError: Se o caminho escapar da raiz ou tiver extensão não suportada
+    """
+    root_real = os.path.realpath(root)
+    candidate = os.path.realpath(os.path.join(root_real, path))
+
+    if os.path.commonpath([root_real, candidate]) != root_real:
+        raise PathNotAllowedError(f"Path outside allowed root: {path}")
+
+    extension = candidate.rsplit(".", 1)[-1].lower() if "." in os.path.basename(candidate) else ""
+    if extension not in supported_formats:
+        raise PathNotAllowedError(f"Unsupported image format: {path}")
+
+    return candidate
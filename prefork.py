@@ -0,0 +1,229 @@
+#!/usr/bin/env python3
+"""
+Launcher pre-fork com compartilhamento copy-on-write do modelo
+
+O processo mestre importa o TensorFlow, carrega e aquece o modelo uma única
+vez e só então faz fork dos workers uvicorn, que herdam as páginas dos pesos
+sem copiá-las (copy-on-write). Com ``uvicorn --workers`` cada worker carregaria
+a própria cópia do TensorFlow e do ``best_model.keras``.
+
+Estado do TensorFlow após o fork: apenas a thread que chama ``fork()``
+sobrevive no filho, então qualquer pool de threads criado pelo runtime no
+mestre fica sem threads nos workers. Para que nenhum trabalho dependa dessas
+threads, o mestre configura o runtime antes de importar o TensorFlow:
+
+- ``TF_NUM_INTRAOP_THREADS=1`` / ``OMP_NUM_THREADS=1``: kernels rodam inline
+  na thread chamadora (o Eigen não despacha para o pool com 1 thread);
+- ``TF_EAGER_INFERENCE=true``: inferência eager op a op na thread chamadora,
+  sem ``model.predict``/``tf.function`` e o pool inter-op do executor de grafos;
+- ``TF_XLA_JIT=false``: sem threads de compilação do XLA.
+
+O paralelismo vem do número de workers. O mestre também não mantém threads
+próprias durante o fork (o monitoramento roda no loop principal): a thread de
+escrita dos logs (``log_pipeline``) é parada antes de cada fork e reiniciada
+no mestre logo depois, e cada worker cria a própria, com uma fila nova.
+
+Uso:
+    python prefork.py --workers 4
+"""
+
+import argparse
+import gc
+import glob
+import logging
+import os
+import signal
+import socket
+import sys
+import tempfile
+import time
+from typing import Dict
+
+# Runtime do TensorFlow seguro para fork (precisa vir antes de qualquer import do TF)
+FORK_SAFE_TF_ENV = {
+    "OMP_NUM_THREADS": "1",
+    "TF_NUM_INTEROP_THREADS": "1",
+    "TF_NUM_INTRAOP_THREADS": "1",
+    "TF_EAGER_INFERENCE": "true",
+    "TF_XLA_JIT": "false"
+}
+
+logger = logging.getLogger("prefork")
+
+def log_memory_report(master_pid: int, workers: Dict[int, int]):
+    """Loga RSS/USS por worker e a memória economizada pelo compartilhamento"""
+    from monitoring import get_process_memory
+
+    try:
+        master = get_process_memory(master_pid)
+        report = {pid: get_process_memory(pid) for pid in workers}
+    except Exception as e:
+        logger.warning(f"⚠️ Não foi possível coletar memória dos workers: {str(e)}")
+        return
+
+    total_rss = sum(m["rss_mb"] for m in report.values())
+    total_uss = sum(m["uss_mb"] for m in report.values())
+    logger.info(
+        f"📊 Memória mestre pid={master_pid}: rss={master['rss_mb']}MB uss={master['uss_mb']}MB"
+    )
+    for pid, mem in sorted(report.items()):
+        logger.info(
+            f"📊 Worker {workers[pid]} pid={pid}: rss={mem['rss_mb']}MB "
+            f"uss={mem['uss_mb']}MB pss={mem['pss_mb']}MB"
+        )
+    logger.info(
+        f"📊 Total workers: rss={total_rss:.1f}MB uss={total_uss:.1f}MB "
+        f"(compartilhado ~{total_rss - total_uss:.1f}MB)"
+    )
+
+def create_socket(host: str, port: int, backlog: int = 2048) -> socket.socket:
+    """Cria o socket de escuta herdado por todos os workers"""
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(backlog)
+    sock.set_inheritable(True)
+    return sock
+
+def run_worker(application, sock: socket.socket, uvicorn_config: Dict):
+    """Executa um servidor uvicorn no socket compartilhado (processo filho)"""
+    import uvicorn
+
+    config = uvicorn.Config(application, **uvicorn_config)
+    server = uvicorn.Server(config)
+    server.run(sockets=[sock])
+
+def spawn_worker(index: int, application, sock: socket.socket, uvicorn_config: Dict) -> int:
+    """Faz fork de um worker; retorna o pid no mestre"""
+    from log_pipeline import resume_logging, stop_logging
+
+    # Sem a thread de escrita no fork: um write em andamento deixaria o lock
+    # do stderr preso no filho
+    stop_logging()
+    pid = os.fork()
+    if pid == 0:
+        # Filho: restaurar sinais padrão (o uvicorn instala os próprios handlers)
+        signal.signal(signal.SIGTERM, signal.SIG_DFL)
+        signal.signal(signal.SIGINT, signal.SIG_DFL)
+        exit_code = 0
+        try:
+            run_worker(application, sock, uvicorn_config)
+        except Exception as e:
+            logger.error(f"❌ Worker {index} falhou: {str(e)}")
+            exit_code = 1
+        finally:
+            # os._exit não roda o atexit: escrever os logs ainda na fila
+            stop_logging()
+            os._exit(exit_code)
+    resume_logging()
+    logger.info(f"🚀 Worker {index} iniciado (pid={pid})")
+    return pid
+
+def main():
+    """Função principal"""
+    parser = argparse.ArgumentParser(description="Launcher pre-fork da Eye Disease Classifier API")
+    parser.add_argument("--workers", type=int, default=int(os.getenv("WEB_CONCURRENCY", 2)),
+                        help="Número de workers (padrão: WEB_CONCURRENCY ou 2)")
+    parser.add_argument("--memory-report-interval", type=float, default=300,
+                        help="Intervalo em segundos entre relatórios de memória (0 desabilita)")
+    args = parser.parse_args()
+
+    for key, value in FORK_SAFE_TF_ENV.items():
+        os.environ[key] = value
+    # Limites por worker (rate limiting) derivam do número real de workers
+    os.environ["WEB_CONCURRENCY"] = str(args.workers)
+
+    # Contadores de /metrics somados entre os workers (arquivo novo a cada execução)
+    metrics_file = None
+    if not os.getenv("METRICS_FILE"):
+        shm_dir = "/dev/shm" if os.path.isdir("/dev/shm") else tempfile.gettempdir()
+        metrics_file = os.path.join(shm_dir, f"eye-disease-metrics-{os.getpid()}.bin")
+        os.environ["METRICS_FILE"] = metrics_file
+
+    # Importar TF, a aplicação e carregar o modelo uma única vez no mestre
+    from app import app as application, config
+    from ml_service import ml_service
+
+    start_time = time.time()
+    if not ml_service.load_model():
+        logger.error("❌ Falha ao carregar o modelo no processo mestre")
+        sys.exit(1)
+    ml_service.warmup()
+    logger.info(f"✅ Modelo carregado e aquecido no mestre em {time.time() - start_time:.2f}s")
+
+    uvicorn_config = config.get_uvicorn_config()
+    host, port = uvicorn_config.pop("host"), uvicorn_config.pop("port")
+    uvicorn_config.pop("reload", None)
+    sock = create_socket(host, port)
+    logger.info(f"🔌 Escutando em {host}:{port} com {args.workers} workers")
+
+    # Mover objetos existentes para a geração permanente: o GC dos workers não
+    # toca (e portanto não copia) as páginas herdadas do mestre
+    gc.collect()
+    gc.freeze()
+
+    stopping = False
+
+    def handle_stop(signum, frame):
+        nonlocal stopping
+        stopping = True
+
+    signal.signal(signal.SIGTERM, handle_stop)
+    signal.signal(signal.SIGINT, handle_stop)
+
+    workers = {spawn_worker(i, application, sock, uvicorn_config): i for i in range(args.workers)}
+    master_pid = os.getpid()
+    next_report = time.time() + min(30, args.memory_report_interval or 30)
+
+    while not stopping:
+        # Repor workers que morreram (o modelo continua em memória no mestre)
+        try:
+            pid, status = os.waitpid(-1, os.WNOHANG)
+        except ChildProcessError:
+            pid = 0
+        if pid and pid in workers:
+            index = workers.pop(pid)
+            logger.warning(f"⚠️ Worker {index} (pid={pid}) saiu com status {status}, reiniciando")
+            workers[spawn_worker(index, application, sock, uvicorn_config)] = index
+
+        if args.memory_report_interval and time.time() >= next_report:
+            log_memory_report(master_pid, workers)
+            next_report = time.time() + args.memory_report_interval
+
+        time.sleep(0.5)
+
+    # Encerramento: repassar SIGTERM e aguardar o shutdown gracioso dos workers
+    logger.info("🛑 Encerrando workers...")
+    for pid in workers:
+        try:
+            os.kill(pid, signal.SIGTERM)
+        except ProcessLookupError:
+            pass
+
+    # O prazo de shutdown dos workers já cobre conexões e drenagem do pipeline
+    deadline = time.time() + uvicorn_config.get("timeout_graceful_shutdown", 8) + 2
+    while workers and time.time() < deadline:
+        try:
+            pid, _ = os.waitpid(-1, os.WNOHANG)
+        except ChildProcessError:
+            break
+        if pid:
+            workers.pop(pid, None)
+        else:
+            time.sleep(0.1)
+
+    for pid in workers:
+        logger.warning(f"⚠️ Worker pid={pid} não encerrou a tempo, forçando")
+        try:
+            os.kill(pid, signal.SIGKILL)
+        except ProcessLookupError:
+            pass
+
+    sock.close()
+    if metrics_file:
+        for path in glob.glob(f"{metrics_file}*"):
+            os.remove(path)
+    logger.info("✅ Launcher encerrado")
+
+if __name__ == "__main__":
+    main()
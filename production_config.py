@@ -20,6 +20,10 @@ class ProductionConfig:
     # Configurações de logging
     LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO")
     LOG_FORMAT = "%(asctime)s - %(name)s - %(levelname)s - %(message)s"
+    LOG_QUEUED = os.getenv("LOG_QUEUED", "true").lower() == "true"  # Escrita dos logs em thread de fundo
+    LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", 10000))
+    LOG_SAMPLE_RATES = os.getenv("LOG_SAMPLE_RATES", "prediction=0.01")  # evento=fração mantida
+    LOG_RATE_LIMITS = os.getenv("LOG_RATE_LIMITS", "")  # evento=records por segundo
     
     # Configurações do modelo
     MODEL_PATH = "best_model.keras"
@@ -27,8 +31,73 @@ class ProductionConfig:
     
     # Configurações de recursos
     MAX_UPLOAD_SIZE = 10 * 1024 * 1024  # 10MB
+    MULTIPART_OVERHEAD = 64 * 1024  # Boundaries e cabeçalhos do multipart
+    UPLOAD_CHUNK_SIZE = 64 * 1024  # Leitura incremental do upload
+    MAX_IMAGE_PIXELS = int(os.getenv("MAX_IMAGE_PIXELS", 40_000_000))  # Orçamento de pixels por imagem
+    OVERSIZE_IMAGE_POLICY = os.getenv("OVERSIZE_IMAGE_POLICY", "downsample")  # "downsample" ou "reject"
+    MAX_TENSOR_BATCH_SIZE = int(os.getenv("MAX_TENSOR_BATCH_SIZE", 64))  # Imagens por request em /predict/tensor
+    MAX_TENSOR_UPLOAD_SIZE = MAX_TENSOR_BATCH_SIZE * 256 * 256 * 3 + 64 * 1024  # Tensores uint8 + cabeçalhos
     SUPPORTED_FORMATS = {"jpg", "jpeg", "png"}
     
+    # Configurações do pipeline de inferência
+    PREPROCESS_WORKERS = int(os.getenv("PREPROCESS_WORKERS", 2))  # Threads de decode/resize
+    MAX_BATCH_SIZE = int(os.getenv("MAX_BATCH_SIZE", 16))
+    BATCH_TIMEOUT_MS = float(os.getenv("BATCH_TIMEOUT_MS", 5))  # Espera máxima para completar um batch
+    ARENA_SLOTS = int(os.getenv("ARENA_SLOTS", 2 * MAX_BATCH_SIZE))  # Requests em andamento sem alocação
+    
+    # Predição por caminho (desabilitada se PREDICT_PATH_ROOT não for definido)
+    PREDICT_PATH_ROOT = os.getenv("PREDICT_PATH_ROOT", None)
+    MAX_PATH_BATCH_SIZE = int(os.getenv("MAX_PATH_BATCH_SIZE", 256))
+    
+    # Servidor gRPC (desabilitado se GRPC_PORT não for definido)
+    GRPC_PORT = int(os.getenv("GRPC_PORT", 0))
+    GRPC_MAX_MESSAGE_SIZE = MAX_UPLOAD_SIZE + 64 * 1024  # Uma imagem por mensagem + campos
+    GRPC_STREAM_MAX_IN_FLIGHT = int(os.getenv("GRPC_STREAM_MAX_IN_FLIGHT", MAX_BATCH_SIZE))  # Itens por stream
+    
+    # Jobs assíncronos em lote (desabilitados se JOBS_DB_PATH não for definido)
+    JOBS_DB_PATH = os.getenv("JOBS_DB_PATH", None)  # Fila SQLite persistente
+    JOB_MAX_PATHS = int(os.getenv("JOB_MAX_PATHS", 100_000))  # Caminhos por job
+    JOB_MAX_IMAGES = int(os.getenv("JOB_MAX_IMAGES", 1000))  # Uploads por job
+    JOB_MAX_UPLOAD_SIZE = int(os.getenv("JOB_MAX_UPLOAD_SIZE", 256 * 1024 * 1024))  # Corpo de /jobs/images
+    JOB_BATCH_SIZE = int(os.getenv("JOB_BATCH_SIZE", MAX_BATCH_SIZE))  # Itens por rodada do worker de jobs
+    JOB_IDLE_THRESHOLD = int(os.getenv("JOB_IDLE_THRESHOLD", 0))  # Predições ao vivo toleradas para rodar jobs
+    JOB_POLL_INTERVAL = float(os.getenv("JOB_POLL_INTERVAL", 0.05))  # Espera enquanto há tráfego ao vivo
+    JOB_CLAIM_LEASE = float(os.getenv("JOB_CLAIM_LEASE", 300))  # Segundos até um item reservado voltar à fila
+    JOB_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", 3))  # Reservas de um item antes de concluí-lo com erro
+    
+    # Rate limiting por token bucket (buckets por worker, nos caminhos de predição)
+    # Desligado por padrão: atrás de proxy, sem RATE_LIMIT_TRUST_PROXY todos os anônimos
+    # dividem o bucket do IP do proxy
+    RATE_LIMIT_ENABLED = os.getenv("RATE_LIMIT_ENABLED", "false").lower() == "true"
+    # tier=req/s:rajada da instância; dividido entre os WEB_CONCURRENCY workers (buckets por worker)
+    RATE_LIMIT_TIERS = os.getenv("RATE_LIMIT_TIERS", "anonymous=10:20,partner=50:100")
+    RATE_LIMIT_WORKERS = max(int(os.getenv("WEB_CONCURRENCY", 1)), 1)
+    RATE_LIMIT_API_KEYS = os.getenv("RATE_LIMIT_API_KEYS", "")  # api_key=tier; demais requests usam o IP
+    RATE_LIMIT_MAX_CLIENTS = int(os.getenv("RATE_LIMIT_MAX_CLIENTS", 100_000))  # Buckets por worker
+    RATE_LIMIT_TRUST_PROXY = os.getenv("RATE_LIMIT_TRUST_PROXY", "false").lower() == "true"  # IP via X-Forwarded-For
+    API_KEY_HEADER = os.getenv("API_KEY_HEADER", "X-API-Key")
+    
+    # Idempotency-Key nos POSTs de predição (memória limitada + SQLite local opcional)
+    IDEMPOTENCY_ENABLED = os.getenv("IDEMPOTENCY_ENABLED", "true").lower() == "true"
+    IDEMPOTENCY_TTL = float(os.getenv("IDEMPOTENCY_TTL", 24 * 3600))  # Segundos
+    IDEMPOTENCY_MAX_MEMORY_BYTES = int(os.getenv("IDEMPOTENCY_MAX_MEMORY_BYTES", 16 * 1024 * 1024))  # Por worker
+    IDEMPOTENCY_DB_PATH = os.getenv("IDEMPOTENCY_DB_PATH", None)  # Sobrevive a reinícios e é visto por todos os workers
+    
+    # Shutdown: prazo total desde o SIGTERM (conexões abertas e, no que sobrar, drenagem
+    # do pipeline); abaixo dos 10 s que o Cloud Run espera antes do SIGKILL
+    GRACEFUL_SHUTDOWN_TIMEOUT = float(os.getenv("GRACEFUL_SHUTDOWN_TIMEOUT", 8))
+    
+    # Health check (snapshot em background, listener opcional em porta própria)
+    HEALTH_PORT = int(os.getenv("HEALTH_PORT", 0))  # 0 desabilita o listener separado
+    HEALTH_REFRESH_INTERVAL = float(os.getenv("HEALTH_REFRESH_INTERVAL", 1.0))
+    HEALTH_MAX_LOOP_LAG_MS = float(os.getenv("HEALTH_MAX_LOOP_LAG_MS", 1000))
+    
+    # Instrumentação de requests
+    METRICS_FILE = os.getenv("METRICS_FILE", None)  # Contadores mmap compartilhados entre workers
+    # Linhas dos sketches de quantis: uma por worker vivo, com folga para respawns
+    LATENCY_QUANTILE_ROWS = int(os.getenv("LATENCY_QUANTILE_ROWS", 4 * max(int(os.getenv("WEB_CONCURRENCY", 1)), 1) + 16))
+    SERVER_TIMING_HEADER = os.getenv("SERVER_TIMING_HEADER", "true").lower() == "true"  # Estágios no header Server-Timing
+    
     # Configurações de timeout
     REQUEST_TIMEOUT = 300  # 5 minutos
     MODEL_LOAD_TIMEOUT = 600  # 10 minutos
@@ -73,22 +142,27 @@ class ProductionConfig:
     
     @classmethod
     def apply_tf_config(cls):
-        """Aplica configurações do TensorFlow"""
+        """Aplica configurações do TensorFlow (valores já definidos no ambiente prevalecem)"""
         for key, value in cls.TF_CONFIG.items():
-            os.environ[key] = value
+            os.environ.setdefault(key, value)
     
     @classmethod
     def get_uvicorn_config(cls) -> Dict[str, Any]:
         """Retorna configurações do Uvicorn"""
-        return {
+        uvicorn_config = {
             "host": cls.HOST,
             "port": cls.PORT,
             "reload": False,
             "log_level": cls.LOG_LEVEL.lower(),
             "access_log": True,
             "timeout_keep_alive": 30,
-            "timeout_graceful_shutdown": 30
+            "timeout_graceful_shutdown": cls.GRACEFUL_SHUTDOWN_TIMEOUT
         }
+        if cls.LOG_QUEUED:
+            # Sem config própria (o setup_logging também remove a da CLI), os
+            # loggers do uvicorn propagam para a fila do root
+            uvicorn_config["log_config"] = None
+        return uvicorn_config
     
     @classmethod
     def get_fastapi_config(cls) -> Dict[str, Any]:
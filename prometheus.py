@@ -0,0 +1,192 @@
+"""
+Exposição das métricas no formato texto do Prometheus (``/metrics/prometheus``)
+
+Tudo é lido de estruturas já mantidas em memória: contadores e histogramas
+vêm das tabelas compartilhadas de ``monitoring`` (totais da instância com
+``METRICS_FILE``); gauges de fila, sessões e memória descrevem o processo que
+respondeu o scrape. Latências são expostas em segundos, como recomenda a
+convenção do Prometheus.
+"""
+
+from typing import Dict, List, Optional, Sequence
+
+from frame_stream import frame_streams
+from inference_pipeline import inference_pipeline
+from ml_service import ml_service
+from mlflow_config import mlflow_manager
+from monitoring import REQUEST_STAGES, get_process_memory_bytes, latency_histograms, latency_quantiles, metrics
+from production_config import get_config
+from idempotency import idempotency_store
+from rate_limit import rate_limiter
+from tf_config import get_tensorflow_memory
+
+config = get_config()
+
+# O charset é acrescentado pelo PlainTextResponse
+CONTENT_TYPE = "text/plain; version=0.0.4"
+
+PREFIX = "eye_disease"
+
+class _Exposition:
+    """Acumula famílias de métricas no formato texto"""
+
+    def __init__(self):
+        self.lines: List[str] = []
+
+    def family(self, name: str, kind: str, help_text: str):
+        """Cabeçalho HELP/TYPE de uma família"""
+        self.lines.append(f"# HELP {name} {help_text}")
+        self.lines.append(f"# TYPE {name} {kind}")
+
+    def sample(self, name: str, value: float, labels: Optional[Dict[str, str]] = None):
+        """Uma linha de amostra"""
+        self.lines.append(f"{name}{_format_labels(labels)} {_format_value(value)}")
+
+    def histogram(self, name: str, buckets: Sequence[float], counts: List[int], total: float,
+                  labels: Optional[Dict[str, str]] = None, scale: float = 1):
+        """Buckets cumulativos (``le``), ``_sum`` e ``_count``; ``scale`` converte a unidade dos limites"""
+        labels = labels or {}
+        cumulative = 0
+        for bound, count in zip(list(buckets) + [None], counts):
+            cumulative += count
+            le = "+Inf" if bound is None else _format_value(bound * scale)
+            self.sample(f"{name}_bucket", cumulative, {**labels, "le": le})
+        # Somas guardadas em µs: 6 casas bastam e evitam ruído de ponto flutuante
+        self.sample(f"{name}_sum", round(total * scale, 6), labels)
+        self.sample(f"{name}_count", cumulative, labels)
+
+    def render(self) -> str:
+        """Texto final (terminado em nova linha)"""
+        return "\n".join(self.lines) + "\n"
+
+def render_metrics() -> str:
+    """Monta o texto de exposição com o estado atual"""
+    out = _Exposition()
+    totals = metrics.counters.totals()
+    snapshot = latency_histograms.snapshot()
+
+    out.family(f"{PREFIX}_model_info", "gauge", "Modelo servido (valor sempre 1)")
+    out.sample(f"{PREFIX}_model_info", 1, {
+        "model_source": ml_service.model_source,
+        "model_version": str(ml_service.model_version or "local"),
+        "api_version": config.VERSION
+    })
+    out.family(f"{PREFIX}_model_loaded", "gauge", "1 se o modelo está carregado")
+    out.sample(f"{PREFIX}_model_loaded", int(ml_service.is_model_loaded()))
+    out.family(f"{PREFIX}_start_time_seconds", "gauge", "Início da contagem das métricas (epoch)")
+    out.sample(f"{PREFIX}_start_time_seconds", metrics.start_time)
+    out.family(f"{PREFIX}_worker_processes", "gauge", "Processos contribuindo para os contadores")
+    out.sample(f"{PREFIX}_worker_processes", len(metrics.counters.live_pids()))
+
+    # Contadores
+    out.family(f"{PREFIX}_http_requests_total", "counter", "Requests HTTP por rota e status")
+    for (route, code), count in snapshot["statuses"].items():
+        if count:
+            out.sample(f"{PREFIX}_http_requests_total", count, {"route": route, "status": code})
+    out.family(f"{PREFIX}_errors_total", "counter", "Erros (HTTP >= 400, itens gRPC e frames WebSocket)")
+    out.sample(f"{PREFIX}_errors_total", totals["errors"])
+    out.family(f"{PREFIX}_predictions_total", "counter", "Predições por endpoint")
+    for endpoint, count in metrics.get_predictions_by_endpoint(totals).items():
+        out.sample(f"{PREFIX}_predictions_total", count, {"endpoint": endpoint})
+    out.family(f"{PREFIX}_image_rejects_total", "counter", "Imagens recusadas na inspeção do cabeçalho")
+    for field, count in totals.items():
+        if field.startswith("image_rejects_"):
+            out.sample(f"{PREFIX}_image_rejects_total", count, {"reason": field[len("image_rejects_"):]})
+
+    out.family(f"{PREFIX}_rate_limit_requests_total", "counter", "Requests verificados pelo rate limit por tier e resultado")
+    rate_limit = rate_limiter.get_stats()
+    for tier, counts in rate_limit["tiers"].items():
+        for result in ("allowed", "throttled"):
+            out.sample(f"{PREFIX}_rate_limit_requests_total", counts[result], {"tier": tier, "result": result})
+
+    out.family(f"{PREFIX}_idempotency_lookups_total", "counter", "Requests com Idempotency-Key por resultado")
+    idempotency = idempotency_store.counters.totals()
+    for result in ("hits_memory", "hits_disk", "misses", "concurrent_waits", "mismatches"):
+        out.sample(f"{PREFIX}_idempotency_lookups_total", idempotency[result], {"result": result})
+
+    out.family(f"{PREFIX}_mlflow_telemetry_items_total", "counter",
+               "Métricas e parâmetros do MLflow por destino (buffer, descarte, envio, erro)")
+    telemetry = mlflow_manager.telemetry.get_stats()
+    for result in ("buffered", "dropped", "sent", "errors"):
+        out.sample(f"{PREFIX}_mlflow_telemetry_items_total", telemetry[result], {"result": result})
+
+    # Histogramas (limites em ms convertidos para segundos)
+    out.family(f"{PREFIX}_http_request_duration_seconds", "histogram", "Tempo total do request por rota")
+    for route, (counts, total_ms) in snapshot["routes"].items():
+        if sum(counts):
+            out.histogram(f"{PREFIX}_http_request_duration_seconds", latency_histograms.BUCKETS_MS,
+                          counts, total_ms, {"route": route}, scale=0.001)
+    out.family(f"{PREFIX}_request_stage_duration_seconds", "histogram", "Tempo por estágio do request")
+    for stage in REQUEST_STAGES:
+        counts, total_ms = snapshot["stages"][stage]
+        out.histogram(f"{PREFIX}_request_stage_duration_seconds", latency_histograms.BUCKETS_MS,
+                      counts, total_ms, {"stage": stage}, scale=0.001)
+    out.family(f"{PREFIX}_inference_batch_size", "histogram", "Imagens por batch de inferência")
+    counts, total = snapshot["batch_size"]
+    out.histogram(f"{PREFIX}_inference_batch_size", latency_histograms.BATCH_SIZE_BUCKETS, counts, total)
+
+    # Quantis das janelas móveis (sketches combinados entre workers)
+    quantile_families = {
+        "all": (f"{PREFIX}_request_duration_quantile_seconds", None),
+        "route": (f"{PREFIX}_http_request_duration_quantile_seconds", "route"),
+        "stage": (f"{PREFIX}_request_stage_duration_quantile_seconds", "stage")
+    }
+    quantile_samples = {name: [] for name, _ in quantile_families.values()}
+    for window in latency_quantiles.WINDOWS:
+        merged = latency_quantiles.merged(window[0])
+        for series, counts in zip(latency_quantiles.series, merged):
+            kind, _, label_value = series.partition(":")
+            name, label = quantile_families[kind]
+            for q, value in latency_quantiles.quantiles(counts).items():
+                labels = {label: label_value} if label else {}
+                quantile_samples[name].append((value / 1000, {**labels, "window": window[0], "quantile": f"{q:g}"}))
+    for name, samples in quantile_samples.items():
+        out.family(name, "gauge", "Quantil da latência na janela (DDSketch, erro relativo de 2%)")
+        for value, labels in samples:
+            out.sample(name, round(value, 6), labels)
+
+    # Gauges do processo que respondeu
+    pipeline = inference_pipeline.get_stats()
+    out.family(f"{PREFIX}_pipeline_queue_depth", "gauge", "Tensores aguardando um batch")
+    out.sample(f"{PREFIX}_pipeline_queue_depth", pipeline["queue_depth"])
+    out.family(f"{PREFIX}_pipeline_arena_slots_in_use", "gauge", "Slots do buffer de entrada ocupados")
+    out.sample(f"{PREFIX}_pipeline_arena_slots_in_use", pipeline["arena"]["in_use"])
+    out.family(f"{PREFIX}_rate_limit_active_clients", "gauge", "Buckets de rate limit em memória no worker")
+    out.sample(f"{PREFIX}_rate_limit_active_clients", rate_limit["active_clients"])
+    out.family(f"{PREFIX}_mlflow_telemetry_buffer_depth", "gauge", "Itens aguardando envio ao MLflow no worker")
+    out.sample(f"{PREFIX}_mlflow_telemetry_buffer_depth", telemetry["buffer_depth"])
+    out.family(f"{PREFIX}_frame_stream_sessions", "gauge", "Sessões WebSocket de frames ativas")
+    out.sample(f"{PREFIX}_frame_stream_sessions", len(frame_streams.sessions))
+
+    memory = get_process_memory_bytes()
+    for kind, help_text in (("rss", "Memória residente"), ("uss", "Memória exclusiva"),
+                            ("pss", "Memória proporcional (páginas compartilhadas divididas)")):
+        out.family(f"{PREFIX}_process_{kind}_bytes", "gauge", f"{help_text} do worker")
+        out.sample(f"{PREFIX}_process_{kind}_bytes", memory[kind])
+
+    tf_memory = get_tensorflow_memory(ml_service.model)
+    out.family(f"{PREFIX}_tf_model_weights_bytes", "gauge", "Tamanho dos pesos do modelo")
+    out.sample(f"{PREFIX}_tf_model_weights_bytes", tf_memory["model_weights_bytes"])
+    out.family(f"{PREFIX}_tf_device_memory_bytes", "gauge", "Memória do alocador do TensorFlow por dispositivo")
+    for device, usage in tf_memory["devices"].items():
+        for kind, value in usage.items():
+            out.sample(f"{PREFIX}_tf_device_memory_bytes", value, {"device": device, "kind": kind})
+
+    return out.render()
+
+def _format_labels(labels: Optional[Dict[str, str]]) -> str:
+    """``{chave="valor",...}`` ou vazio"""
+    if not labels:
+        return ""
+    pairs = ",".join(f'{key}="{_escape(str(value))}"' for key, value in labels.items())
+    return "{" + pairs + "}"
+
+def _escape(value: str) -> str:
+    """Escape de valores de label (barra invertida, nova linha e aspas)"""
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _format_value(value: float) -> str:
+    """Inteiros sem casa decimal; floats com precisão total"""
+    if isinstance(value, float) and not value.is_integer():
+        return repr(value)
+    return str(int(value))
@@ -0,0 +1,171 @@
+"""
+Quantis de latência em janelas móveis com sketches DDSketch
+
+Cada valor cai em um bucket logarítmico (``gamma = (1 + a) / (1 - a)``), o que
+garante erro relativo ``a`` em qualquer quantil com memória fixa, e sketches
+com o mesmo mapeamento se combinam somando os buckets. As janelas são anéis
+de fatias de tempo; quem escreve zera a própria fatia ao reutilizá-la, e a
+leitura soma as fatias ainda dentro da janela.
+
+As contagens ficam em uma tabela ``SharedCounters`` (uma linha por thread
+escritora): com arquivo, a leitura combina os sketches de todos os workers.
+Um escritor sem linha livre não registra valores (com log de erro), em vez de
+dividir a fatia de outro escritor.
+"""
+
+import logging
+import math
+import time
+from typing import Any, Dict, Optional, Sequence
+
+import numpy as np
+
+from shared_counters import SharedCounters, SharedCountersFullError
+
+logger = logging.getLogger(__name__)
+
+class LogMapping:
+    """Mapeamento valor -> bucket do DDSketch (bucket 0 = até ``min_value``)"""
+
+    def __init__(self, relative_accuracy: float, min_value: float, max_value: float):
+        self.relative_accuracy = relative_accuracy
+        self.gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self.log_gamma = math.log(self.gamma)
+        self.min_value = min_value
+        self.offset = math.ceil(math.log(min_value) / self.log_gamma)
+        self.size = math.ceil(math.log(max_value) / self.log_gamma) - self.offset + 1
+
+    def index(self, value: float) -> int:
+        """Bucket do valor (valores acima do máximo vão para o último)"""
+        if value <= self.min_value:
+            return 0
+        return min(math.ceil(math.log(value) / self.log_gamma) - self.offset, self.size - 1)
+
+    def value(self, index: int) -> float:
+        """Valor representativo do bucket (erro relativo <= ``relative_accuracy``)"""
+        if index == 0:
+            return self.min_value
+        return 2 * self.gamma ** (index + self.offset) / (self.gamma + 1)
+
+class DDSketch:
+    """Sketch avulso em memória (um vetor de buckets), para quantis de uma série sem janela"""
+
+    def __init__(self, relative_accuracy: float = 0.01, min_value: float = 0.01, max_value: float = 120_000):
+        self.mapping = LogMapping(relative_accuracy, min_value, max_value)
+        self.counts = np.zeros(self.mapping.size, dtype=np.int64)
+        self.count = 0
+
+    def add(self, value: float):
+        """Registra um valor"""
+        self.counts[self.mapping.index(value)] += 1
+        self.count += 1
+
+    def merge(self, other: "DDSketch"):
+        """Soma os buckets de outro sketch com o mesmo mapeamento"""
+        self.counts += other.counts
+        self.count += other.count
+
+    def quantiles(self, quantiles: Sequence[float]) -> Dict[float, float]:
+        """Quantis pedidos (vazio sem valores)"""
+        if self.count == 0:
+            return {}
+        cumulative = np.cumsum(self.counts)
+        return {
+            q: self.mapping.value(int(np.searchsorted(cumulative, q * (self.count - 1), side="right")))
+            for q in quantiles
+        }
+
+class WindowedQuantiles:
+    """
+    Sketches por série (rota, estágio) em janelas de 1 min, 5 min e 1 h
+
+    Cada janela tem ``span / slice`` fatias; a janela lida cobre entre
+    ``span - slice`` e ``span`` segundos, conforme o ponto da fatia atual.
+    ``rows`` deve cobrir as threads escritoras de todos os workers vivos.
+    """
+
+    # (nome, duração, fatia) em segundos
+    WINDOWS = (("1m", 60, 10), ("5m", 300, 30), ("1h", 3600, 300))
+    QUANTILES = (0.5, 0.9, 0.99, 0.999)
+
+    def __init__(self, series: Sequence[str], path: Optional[str] = None, relative_accuracy: float = 0.02,
+                 min_value: float = 0.01, max_value: float = 120_000, rows: int = 32):
+        self.series = tuple(series)
+        self.series_index = {name: i for i, name in enumerate(self.series)}
+        self.mapping = LogMapping(relative_accuracy, min_value, max_value)
+        # Fatia: coluna da época + buckets de cada série
+        self.slice_width = 1 + len(self.series) * self.mapping.size
+
+        self._windows = {}
+        offset = 0
+        for name, span, slice_seconds in self.WINDOWS:
+            slices = span // slice_seconds
+            self._windows[name] = (slice_seconds, slices, offset)
+            offset += slices * self.slice_width
+        self.counters = SharedCounters(offset, path, rows=rows, fold_dead_rows=False)
+        self.dropped = 0
+
+    def observe(self, values: Dict[str, float]):
+        """Registra um valor por série em todas as janelas (sem lock)"""
+        try:
+            row = self.counters.row()
+        except SharedCountersFullError as e:
+            # Nova tentativa a cada request: a linha de um worker encerrado é reaproveitada
+            if not self.dropped:
+                logger.error(f"❌ Quantis de latência deste escritor não serão registrados: {str(e)}")
+            self.dropped += 1
+            return
+        now = time.time()
+        buckets = [
+            1 + self.series_index[name] * self.mapping.size + self.mapping.index(value)
+            for name, value in values.items()
+        ]
+        for slice_seconds, slices, offset in self._windows.values():
+            epoch = int(now // slice_seconds)
+            start = offset + (epoch % slices) * self.slice_width
+            if row[start] != epoch:
+                row[start + 1:start + self.slice_width] = 0
+                row[start] = epoch
+            for bucket in buckets:
+                row[start + bucket] += 1
+
+    def merged(self, window: str) -> np.ndarray:
+        """Buckets (séries × buckets) somados entre linhas e fatias da janela"""
+        slice_seconds, slices, offset = self._windows[window]
+        epoch = int(time.time() // slice_seconds)
+        block = self.counters.table[:, 1 + offset:1 + offset + slices * self.slice_width]
+        block = block.reshape(self.counters.rows, slices, self.slice_width)
+        epochs = block[:, :, 0]
+        live = (epochs > epoch - slices) & (epochs <= epoch)
+        counts = block[:, :, 1:][live].sum(axis=0)
+        return counts.reshape(len(self.series), self.mapping.size)
+
+    def quantiles(self, counts: np.ndarray, quantiles: Sequence[float] = QUANTILES) -> Dict[float, float]:
+        """Quantis de um sketch (vetor de buckets)"""
+        cumulative = np.cumsum(counts)
+        total = int(cumulative[-1])
+        if total == 0:
+            return {}
+        return {
+            q: self.mapping.value(int(np.searchsorted(cumulative, q * (total - 1), side="right")))
+            for q in quantiles
+        }
+
+    def get_stats(self) -> Dict[str, Dict[str, Any]]:
+        """Contagem e p50/p90/p99/p99.9 por série e janela (séries sem dados omitidas)"""
+        stats: Dict[str, Dict[str, Any]] = {}
+        for window in self._windows:
+            merged = self.merged(window)
+            for name, counts in zip(self.series, merged):
+                values = self.quantiles(counts)
+                if not values:
+                    continue
+                stats.setdefault(name, {})[window] = {
+                    "count": int(counts.sum()),
+                    **{quantile_label(q): round(value, 2) for q, value in values.items()}
+                }
+        return stats
+
+def quantile_label(q: float) -> str:
+    """0.999 -> "p99.9" """
+    return f"p{q * 100:g}"
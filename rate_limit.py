@@ -0,0 +1,155 @@
+"""
+Rate limiting por token bucket, por API key ou IP do cliente
+
+Cada cliente ativo tem um bucket de dois números (tokens e última
+atualização) dentro de um ``OrderedDict`` em ordem de uso: um acesso move o
+bucket para o fim e os buckets parados há mais que o tempo de recarga
+completa saem pelo início, o que não muda nenhuma decisão (um bucket cheio
+equivale a um bucket inexistente). ``max_clients`` limita a memória mesmo sob
+uma enxurrada de IPs distintos.
+
+Os limites vêm de tiers (``RATE_LIMIT_TIERS="anonymous=10:20,partner=50:100"``,
+requests por segundo : rajada). API keys cadastradas em ``RATE_LIMIT_API_KEYS``
+usam o bucket da própria chave; requests sem chave ou com chave desconhecida
+caem no bucket do IP com o tier ``anonymous``. Os buckets são do worker, então
+taxa e rajada de cada tier são divididas pelo número de workers
+(``WEB_CONCURRENCY``): com as conexões distribuídas entre eles, o limite
+somado volta a ser o configurado. Os contadores de permitidos/recusados por
+tier são somados entre workers.
+"""
+
+import math
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, NamedTuple, Optional
+
+from monitoring import shared_metrics_path
+from production_config import get_config
+from shared_counters import SharedCounters
+
+ANONYMOUS_TIER = "anonymous"
+
+class RateLimitTier(NamedTuple):
+    """Limite de um tier: tokens por segundo e capacidade do bucket"""
+    name: str
+    rate: float
+    burst: float
+
+class RateLimitDecision(NamedTuple):
+    """Resultado da verificação de um request"""
+    allowed: bool
+    tier: RateLimitTier
+    remaining: int
+    retry_after: float  # Segundos até o próximo token (0 se permitido)
+    reset: float  # Segundos até o bucket encher
+
+class TokenBucketLimiter:
+    """Buckets por cliente com despejo dos ociosos (chamado só do event loop)"""
+
+    def __init__(self, tiers: Dict[str, RateLimitTier], max_clients: int = 100_000, path: Optional[str] = None):
+        if ANONYMOUS_TIER not in tiers:
+            raise ValueError(f"Rate limit tiers must define '{ANONYMOUS_TIER}'")
+        self.tiers = tiers
+        self.max_clients = max_clients
+        # Depois disso o bucket de qualquer tier já estaria cheio
+        self.idle_seconds = max(tier.burst / tier.rate for tier in tiers.values())
+        self.evicted = 0
+        self._buckets: "OrderedDict[str, List[float]]" = OrderedDict()  # cliente -> [tokens, atualização]
+        self.counters = SharedCounters(
+            [f"{result}_{name}" for name in tiers for result in ("allowed", "throttled")], path
+        )
+
+    def check(self, client: str, tier: RateLimitTier) -> RateLimitDecision:
+        """Consome um token do bucket do cliente, se houver"""
+        now = time.monotonic()
+        self._evict_idle(now)
+
+        bucket = self._buckets.get(client)
+        if bucket is None:
+            bucket = self._buckets[client] = [tier.burst, now]
+            if len(self._buckets) > self.max_clients:
+                self._buckets.popitem(last=False)
+                self.evicted += 1
+        else:
+            self._buckets.move_to_end(client)
+            bucket[0] = min(tier.burst, bucket[0] + (now - bucket[1]) * tier.rate)
+            bucket[1] = now
+
+        allowed = bucket[0] >= 1
+        if allowed:
+            bucket[0] -= 1
+        self.counters.add(f"{'allowed' if allowed else 'throttled'}_{tier.name}")
+        return RateLimitDecision(
+            allowed=allowed,
+            tier=tier,
+            remaining=int(bucket[0]),
+            retry_after=0.0 if allowed else (1 - bucket[0]) / tier.rate,
+            reset=(tier.burst - bucket[0]) / tier.rate
+        )
+
+    def _evict_idle(self, now: float):
+        """Remove, pelo início, os buckets parados há mais de ``idle_seconds``"""
+        while self._buckets:
+            client, bucket = next(iter(self._buckets.items()))
+            if now - bucket[1] < self.idle_seconds:
+                break
+            del self._buckets[client]
+            self.evicted += 1
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Clientes ativos no worker e permitidos/recusados por tier (todos os workers)"""
+        totals = self.counters.totals()
+        return {
+            "active_clients": len(self._buckets),
+            "evicted_clients": self.evicted,
+            "tiers": {
+                name: {
+                    "rate": tier.rate,
+                    "burst": tier.burst,
+                    "allowed": totals[f"allowed_{name}"],
+                    "throttled": totals[f"throttled_{name}"]
+                }
+                for name, tier in self.tiers.items()
+            }
+        }
+
+def parse_tiers(spec: str, workers: int = 1) -> Dict[str, RateLimitTier]:
+    """
+    ``"anonymous=10:20,partner=50"`` -> tiers (rajada padrão = 1 segundo de taxa)
+
+    Taxa e rajada são divididas por ``workers`` (limites da instância
+    repartidos entre buckets por worker); a rajada fica em no mínimo 1.
+    """
+    tiers = {}
+    for item in filter(None, (part.strip() for part in spec.split(","))):
+        name, _, limits = item.partition("=")
+        rate, _, burst = limits.partition(":")
+        rate = float(rate)
+        if rate <= 0:
+            raise ValueError(f"Rate limit for tier {name.strip()} must be positive")
+        burst = float(burst) if burst else rate
+        tiers[name.strip()] = RateLimitTier(name.strip(), rate / workers, max(burst / workers, 1.0))
+    return tiers
+
+def parse_api_keys(spec: str, tiers: Dict[str, RateLimitTier]) -> Dict[str, RateLimitTier]:
+    """``"chave1=partner,chave2=internal"`` -> tier de cada API key"""
+    keys = {}
+    for item in filter(None, (part.strip() for part in spec.split(","))):
+        key, _, tier = item.partition("=")
+        if tier.strip() not in tiers:
+            raise ValueError(f"Unknown rate limit tier: {tier.strip()}")
+        keys[key.strip()] = tiers[tier.strip()]
+    return keys
+
+def retry_after_seconds(decision: RateLimitDecision) -> int:
+    """Valor do header ``Retry-After`` (segundos inteiros, no mínimo 1)"""
+    return max(1, math.ceil(decision.retry_after))
+
+# Instância global do rate limiter
+config = get_config()
+rate_limiter = TokenBucketLimiter(
+    parse_tiers(config.RATE_LIMIT_TIERS, workers=config.RATE_LIMIT_WORKERS),
+    max_clients=config.RATE_LIMIT_MAX_CLIENTS,
+    path=shared_metrics_path("rate_limit")
+)
+api_key_tiers = parse_api_keys(config.RATE_LIMIT_API_KEYS, rate_limiter.tiers)
@@ -0,0 +1,39 @@
+"""
+Respostas JSON rápidas para os endpoints de alto volume
+
+Quando um endpoint retorna um modelo pydantic, o FastAPI o valida de novo
+contra o ``response_model``, passa pelo ``jsonable_encoder`` e serializa com
+``json.dumps``. Os endpoints de predição e o ``/metrics`` montam a saída com
+``model_construct`` (valores já conhecidos e válidos) e retornam
+``FastJSONResponse``, que serializa direto com orjson.
+"""
+
+from typing import Any
+
+import orjson
+from fastapi.responses import ORJSONResponse
+from pydantic import BaseModel
+
+from monitoring import request_stage
+
+def _encode_model(obj: Any) -> Any:
+    """Serializa modelos montados com ``model_construct`` pelos próprios campos"""
+    if isinstance(obj, BaseModel):
+        return obj.__dict__
+    raise TypeError(f"Type is not JSON serializable: {type(obj).__name__}")
+
+class FastJSONResponse(ORJSONResponse):
+    """
+    Resposta JSON via orjson, sem revalidação do conteúdo
+
+    Aceita dicts, arrays numpy e modelos pydantic (inclusive aninhados). O
+    tempo de serialização entra no estágio ``serialize`` do request.
+    """
+
+    def render(self, content: Any) -> bytes:
+        with request_stage("serialize"):
+            return orjson.dumps(
+                content,
+                default=_encode_model,
+                option=orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY
+            )
@@ -0,0 +1,185 @@
+"""
+Contadores compartilhados entre threads e processos via mmap
+
+A tabela tem uma linha por thread escritora: cada thread reserva sua linha
+na primeira escrita e, a partir daí, só ela escreve nessa linha, então os
+incrementos não precisam de lock. A leitura soma todas as linhas. Com um
+arquivo (``path``), todos os processos que o mapeiam (ex.: workers do
+``prefork.py``) contribuem para os mesmos totais; sem arquivo, o mapeamento
+é anônimo e os totais são do processo.
+
+Layout: cabeçalho de 64 bytes + ``rows`` linhas de int64, onde a coluna 0 é
+o pid dono da linha (0 = livre) e as demais são os contadores. A linha 0
+acumula os contadores de processos encerrados cujas linhas foram reutilizadas.
+O arquivo é criado esparso: só as páginas das linhas em uso ocupam memória.
+Com todas as linhas ocupadas por processos vivos, tabelas que somam contadores
+caem na linha 0 compartilhada; as demais (``fold_dead_rows=False``) levantam
+``SharedCountersFullError``, já que dividir a linha corromperia os dados.
+"""
+
+import fcntl
+import logging
+import mmap
+import os
+import struct
+import threading
+import time
+from typing import Dict, Optional, Sequence, Set, Union
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+_MAGIC = b"EYECNT01"
+_HEADER = struct.Struct("<8sIId")  # magic, linhas, colunas, início (epoch)
+_HEADER_SIZE = 64
+
+class SharedCountersFullError(RuntimeError):
+    """Todas as linhas pertencem a escritores vivos e a tabela não aceita linha compartilhada"""
+    pass
+
+class SharedCounters:
+    """
+    Tabela de contadores int64 somados entre threads e processos
+
+    ``fields`` nomeia as colunas usadas por ``add``/``totals``; com um inteiro,
+    as colunas são anônimas e acessadas pelo chamador via ``row()``/``table``.
+    Com ``fold_dead_rows=False``, linhas de processos encerrados são apenas
+    descartadas ao serem reutilizadas (para dados que não podem ser somados,
+    como marcas de tempo).
+    """
+
+    def __init__(self, fields: Union[Sequence[str], int], path: Optional[str] = None, rows: int = 1024,
+                 fold_dead_rows: bool = True):
+        self.fields = () if isinstance(fields, int) else tuple(fields)
+        self.index = {name: i + 1 for i, name in enumerate(self.fields)}
+        self.path = path
+        self.rows = rows
+        self.width = (fields if isinstance(fields, int) else len(self.fields)) + 1
+        self.fold_dead_rows = fold_dead_rows
+        size = _HEADER_SIZE + rows * self.width * 8
+
+        self._claim_lock = threading.Lock()
+        self._fd = None
+        if path:
+            self._fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o600)
+            with self._file_lock():
+                compatible = os.fstat(self._fd).st_size == size
+                if compatible:
+                    self._mmap = mmap.mmap(self._fd, size)
+                    compatible = self._read_header() is not None
+                if not compatible:
+                    # Truncar para 0 zera o conteúdo sem tocar nas páginas
+                    os.ftruncate(self._fd, 0)
+                    os.ftruncate(self._fd, size)
+                    self._mmap = mmap.mmap(self._fd, size)
+                    self._write_header()
+        else:
+            self._mmap = mmap.mmap(-1, size)
+            self._write_header()
+
+        _, _, self.started_at = self._read_header()
+        self.table = np.frombuffer(self._mmap, dtype=np.int64, count=rows * self.width,
+                                   offset=_HEADER_SIZE).reshape(rows, self.width)
+        self._local = threading.local()
+        os.register_at_fork(after_in_child=self._after_fork)
+
+    def _write_header(self):
+        """Grava o cabeçalho de uma tabela nova (já zerada)"""
+        _HEADER.pack_into(self._mmap, 0, _MAGIC, self.rows, self.width, time.time())
+
+    def _read_header(self):
+        """Retorna (linhas, colunas, início) ou None se o arquivo não for compatível"""
+        magic, rows, width, started_at = _HEADER.unpack_from(self._mmap, 0)
+        if magic != _MAGIC or rows != self.rows or width != self.width:
+            return None
+        return rows, width, started_at
+
+    def _file_lock(self):
+        """Lock entre processos para reservar linhas (apenas com arquivo)"""
+        return _FlockContext(self._fd) if self._fd is not None else self._claim_lock
+
+    def _after_fork(self):
+        """O filho reserva linhas próprias em vez de escrever nas do pai"""
+        self._local = threading.local()
+        self._claim_lock = threading.Lock()
+        if self._fd is not None:
+            # flock é por descrição de arquivo aberta, compartilhada com o pai após o fork
+            os.close(self._fd)
+            self._fd = os.open(self.path, os.O_RDWR)
+
+    def _row(self) -> np.ndarray:
+        """Linha exclusiva da thread atual (reservada na primeira escrita)"""
+        row = getattr(self._local, "row", None)
+        if row is None:
+            row = self._local.row = self._claim()
+        return row
+
+    def _claim(self) -> np.ndarray:
+        pid = os.getpid()
+        with self._file_lock():
+            free = np.flatnonzero(self.table[1:, 0] == 0) + 1
+            if not len(free):
+                free = self._reclaim_dead_rows()
+            if len(free):
+                self.table[free[0], 0] = pid
+                return self.table[free[0]]
+
+        if not self.fold_dead_rows:
+            raise SharedCountersFullError(
+                f"Tabela de contadores cheia ({self.rows} linhas com escritores vivos): aumente o número de linhas"
+            )
+        # Sem linhas livres: linha 0 compartilhada (incrementos concorrentes podem se perder)
+        logger.error(f"❌ Tabela de contadores cheia ({self.rows} linhas), usando linha compartilhada")
+        return self.table[0]
+
+    def _reclaim_dead_rows(self) -> np.ndarray:
+        """Move os contadores de processos encerrados para a linha 0 e libera suas linhas"""
+        reclaimed = []
+        for index in range(1, self.rows):
+            pid = int(self.table[index, 0])
+            if pid and not _pid_alive(pid):
+                if self.fold_dead_rows:
+                    self.table[0, 1:] += self.table[index, 1:]
+                self.table[index] = 0
+                reclaimed.append(index)
+        return np.array(reclaimed, dtype=np.int64)
+
+    def row(self) -> np.ndarray:
+        """Colunas de contadores da linha da thread atual (view gravável)"""
+        return self._row()[1:]
+
+    def add(self, field: str, value: int = 1):
+        """Incrementa um contador (sem lock: a linha pertence à thread)"""
+        self._row()[self.index[field]] += value
+
+    def totals(self) -> Dict[str, int]:
+        """Soma de cada contador em todas as linhas"""
+        sums = self.table[:, 1:].sum(axis=0)
+        return {name: int(value) for name, value in zip(self.fields, sums)}
+
+    def live_pids(self) -> Set[int]:
+        """Processos em execução com linhas na tabela"""
+        return {int(pid) for pid in np.unique(self.table[1:, 0]) if pid and _pid_alive(int(pid))}
+
+def _pid_alive(pid: int) -> bool:
+    """Verifica se o processo existe"""
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+class _FlockContext:
+    """``with`` para fcntl.flock exclusivo"""
+
+    def __init__(self, fd: int):
+        self.fd = fd
+
+    def __enter__(self):
+        fcntl.flock(self.fd, fcntl.LOCK_EX)
+
+    def __exit__(self, *exc):
+        fcntl.flock(self.fd, fcntl.LOCK_UN)
@@ -0,0 +1,134 @@
+"""
+Leitura de tensores brutos (.npy e Arrow IPC) sem cópias
+
+Permite que pipelines que já têm as imagens decodificadas e redimensionadas
+enviem os arrays uint8 direto, sem o ciclo encode/decode de JPEG. Os arrays
+retornados são views sobre o corpo do request.
+"""
+
+import io
+import logging
+from typing import Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Formato esperado de cada imagem: (altura, largura, canais) uint8
+TENSOR_SHAPE: Tuple[int, int, int] = (256, 256, 3)
+TENSOR_DTYPE = np.dtype(np.uint8)
+
+# Content-types aceitos
+NPY_CONTENT_TYPES = {"application/x-npy", "application/octet-stream"}
+ARROW_CONTENT_TYPES = {"application/vnd.apache.arrow.stream"}
+
+class InvalidTensorError(ValueError):
+    """O corpo do request não contém um tensor válido"""
+
+class ArrowUnavailableError(RuntimeError):
+    """pyarrow não está instalado"""
+
+def parse_npy(data: bytes) -> np.ndarray:
+    """
+    Interpreta um arquivo .npy como view sobre os próprios bytes
+
+    Returns:
+        Array uint8 com shape (256, 256, 3) ou (N, 256, 256, 3)
+    """
+    header = io.BytesIO(data)
+    try:
+        version = np.lib.format.read_magic(header)
+        if version == (1, 0):
+            shape, fortran_order, dtype = np.lib.format.read_array_header_1_0(header)
+        elif version == (2, 0):
+            shape, fortran_order, dtype = np.lib.format.read_array_header_2_0(header)
+        else:
+            raise InvalidTensorError(f"Unsupported .npy version: {version}")
+    except InvalidTensorError:
+        raise
+    except Exception as e:
+        raise InvalidTensorError(f"Invalid .npy payload: {str(e)}") from e
+
+    if dtype.hasobject:
+        raise InvalidTensorError("Object arrays are not supported")
+
+    count = int(np.prod(shape))
+    if len(data) - header.tell() < count * dtype.itemsize:
+        raise InvalidTensorError("Truncated .npy payload")
+
+    array = np.frombuffer(data, dtype=dtype, count=count, offset=header.tell())
+    return validate_tensor(array.reshape(shape, order="F" if fortran_order else "C"))
+
+def parse_arrow(data: bytes) -> np.ndarray:
+    """
+    Lê um stream Arrow IPC com a coluna ``image`` como view sobre os bytes
+
+    A coluna deve ser ``fixed_size_list<uint8>[196608]`` ou
+    ``fixed_size_binary[196608]`` (uma imagem 256x256x3 por linha).
+
+    Returns:
+        Array uint8 com shape (N, 256, 256, 3)
+    """
+    try:
+        import pyarrow as pa
+    except ImportError as e:
+        raise ArrowUnavailableError("Arrow IPC input requires pyarrow") from e
+
+    try:
+        reader = pa.ipc.open_stream(pa.py_buffer(data))
+        batches = [batch for batch in reader if batch.num_rows > 0]
+    except Exception as e:
+        raise InvalidTensorError(f"Invalid Arrow IPC stream: {str(e)}") from e
+
+    if not batches:
+        raise InvalidTensorError("Empty Arrow IPC stream")
+    if "image" not in batches[0].schema.names:
+        raise InvalidTensorError("Arrow stream must have an 'image' column")
+
+    arrays = [_arrow_column_to_array(pa, batch.column("image")) for batch in batches]
+
+    # Um único record batch continua sendo view; vários exigem concatenação
+    array = arrays[0] if len(arrays) == 1 else np.concatenate(arrays)
+    return validate_tensor(array)
+
+def _arrow_column_to_array(pa, column) -> np.ndarray:
+    """Converte a coluna de imagens em view numpy (N, 256, 256, 3)"""
+    width = int(np.prod(TENSOR_SHAPE))
+
+    if column.null_count:
+        raise InvalidTensorError("Arrow column 'image' must not contain nulls")
+
+    if pa.types.is_fixed_size_list(column.type):
+        if column.type.value_type != pa.uint8() or column.type.list_size != width:
+            raise InvalidTensorError(f"Arrow column 'image' must be fixed_size_list<uint8>[{width}]")
+        pixels = column.flatten().to_numpy(zero_copy_only=True)
+    elif pa.types.is_fixed_size_binary(column.type):
+        if column.type.byte_width != width:
+            raise InvalidTensorError(f"Arrow column 'image' must be fixed_size_binary[{width}]")
+        pixels = np.frombuffer(
+            column.buffers()[1], dtype=np.uint8,
+            count=len(column) * width, offset=column.offset * width
+        )
+    else:
+        raise InvalidTensorError(f"Unsupported Arrow type for 'image': {column.type}")
+
+    return pixels.reshape(-1, *TENSOR_SHAPE)
+
+def validate_tensor(array: np.ndarray) -> np.ndarray:
+    """
+    Verifica dtype e shape, normalizando para um batch (N, 256, 256, 3)
+    """
+    if array.dtype != TENSOR_DTYPE:
+        raise InvalidTensorError(f"Tensor dtype must be uint8, got {array.dtype}")
+
+    if array.shape == TENSOR_SHAPE:
+        array = array[np.newaxis]
+    elif array.ndim != 4 or array.shape[1:] != TENSOR_SHAPE:
+        raise InvalidTensorError(
+            f"Tensor shape must be {TENSOR_SHAPE} or (N, {', '.join(map(str, TENSOR_SHAPE))}), got {array.shape}"
+        )
+
+    if array.shape[0] == 0:
+        raise InvalidTensorError("Empty tensor batch")
+
+    return array
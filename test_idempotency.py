@@ -0,0 +1,133 @@
+"""
+Testes da impressão digital do corpo nos reenvios com ``Idempotency-Key``
+
+Rodam só com o middleware e um app ASGI mínimo, sem modelo nem servidor:
+
+    python -m pytest test_idempotency.py
+"""
+
+import asyncio
+
+from idempotency import IdempotencyStore, RequestFingerprint
+from middleware import IdempotencyMiddleware
+
+PATH = "/predict"
+IMAGE = bytes(range(256)) * 40
+
+def multipart(boundary: bytes, image: bytes = IMAGE) -> bytes:
+    """Corpo multipart com um arquivo, no formato enviado pelos clientes HTTP"""
+    return (
+        b"--" + boundary + b"\r\n"
+        b'Content-Disposition: form-data; name="file"; filename="eye.png"\r\n'
+        b"Content-Type: image/png\r\n\r\n" + image + b"\r\n"
+        b"--" + boundary + b"--\r\n"
+    )
+
+def content_type(boundary: bytes) -> bytes:
+    return b"multipart/form-data; boundary=" + boundary
+
+def split(body: bytes, size: int):
+    """Divide o corpo em chunks de ``size`` bytes (o último pode ser menor)"""
+    return [body[i:i + size] for i in range(0, len(body), size)] or [b""]
+
+def fingerprint(boundary: bytes, chunks) -> str:
+    result = RequestFingerprint(content_type(boundary))
+    for i, chunk in enumerate(chunks):
+        result.update(chunk, more_body=i < len(chunks) - 1)
+    assert result.complete
+    return result.digest()
+
+class Client:
+    """Envia requests ao middleware e registra quantos bytes do corpo foram lidos"""
+
+    def __init__(self):
+        self.store = IdempotencyStore(ttl=60, max_memory_bytes=1024 * 1024)
+        self.app_calls = 0
+        self.middleware = IdempotencyMiddleware(self.app, self.store, paths=[PATH])
+
+    async def app(self, scope, receive, send):
+        self.app_calls += 1
+        more_body = True
+        while more_body:
+            message = await receive()
+            more_body = message.get("more_body", False)
+        await send({"type": "http.response.start", "status": 200,
+                    "headers": [(b"content-type", b"application/json")]})
+        await send({"type": "http.response.body", "body": b'{"predicted_class":"normal"}'})
+
+    def post(self, key: bytes, ctype: bytes, chunks, content_length: bool = True):
+        return asyncio.run(self._post(key, ctype, chunks, content_length))
+
+    async def _post(self, key: bytes, ctype: bytes, chunks, content_length: bool):
+        headers = [(b"idempotency-key", key), (b"content-type", ctype)]
+        if content_length:
+            headers.append((b"content-length", str(sum(map(len, chunks))).encode("latin-1")))
+        scope = {"type": "http", "method": "POST", "path": PATH, "headers": headers}
+        pending = list(chunks)
+        self.bytes_read = 0
+        sent = []
+
+        async def receive():
+            chunk = pending.pop(0)
+            self.bytes_read += len(chunk)
+            return {"type": "http.request", "body": chunk, "more_body": bool(pending)}
+
+        async def send(message):
+            sent.append(message)
+
+        await self.middleware(scope, receive, send)
+        start = sent[0]
+        return start["status"], dict(start["headers"])
+
+def test_digest_ignores_boundary_and_chunking():
+    first = multipart(b"----boundaryA1")
+    retry = multipart(b"----------------------------retry-boundary-with-another-length")
+
+    digest = fingerprint(b"----boundaryA1", split(first, 4096))
+    assert fingerprint(b"----boundaryA1", [first]) == digest
+    # Chunks pequenos cortam o boundary ao meio
+    assert fingerprint(b"----------------------------retry-boundary-with-another-length", split(retry, 7)) == digest
+    assert fingerprint(b"----boundaryA1", split(multipart(b"----boundaryA1", IMAGE[:-1] + b"\0"), 7)) != digest
+
+def test_replay_with_new_boundary_and_chunks():
+    client = Client()
+    status, _ = client.post(b"k1", content_type(b"aaaa"), split(multipart(b"aaaa"), 1000))
+    assert status == 200
+
+    status, headers = client.post(b"k1", content_type(b"bbbbbbbbbbbb"), split(multipart(b"bbbbbbbbbbbb"), 333))
+    assert status == 200
+    assert headers[b"idempotent-replayed"] == b"true"
+    assert client.app_calls == 1
+
+def test_one_byte_change_is_rejected():
+    client = Client()
+    client.post(b"k2", content_type(b"aaaa"), [multipart(b"aaaa")])
+
+    changed = bytearray(IMAGE)
+    changed[len(changed) // 2] ^= 1
+    status, headers = client.post(b"k2", content_type(b"bbbb"), [multipart(b"bbbb", bytes(changed))])
+    assert status == 422
+    assert b"idempotent-replayed" not in headers
+    assert client.app_calls == 1
+    assert client.store.counters.totals()["mismatches"] == 1
+
+def test_larger_retry_stops_at_stored_size():
+    client = Client()
+    original = multipart(b"aaaa")
+    client.post(b"k3", content_type(b"aaaa"), [original])
+
+    # Multipart sem pré-checagem pelo Content-Length: a leitura para um chunk após o tamanho guardado
+    chunk_size = 512
+    larger = multipart(b"aaaa", IMAGE * 50)
+    status, _ = client.post(b"k3", content_type(b"aaaa"), split(larger, chunk_size), content_length=False)
+    assert status == 422
+    assert client.bytes_read <= len(original) + chunk_size
+    assert client.app_calls == 1
+
+def test_larger_raw_retry_rejected_by_content_length():
+    client = Client()
+    client.post(b"k4", b"application/octet-stream", [IMAGE])
+
+    status, _ = client.post(b"k4", b"application/octet-stream", [IMAGE + b"\0"])
+    assert status == 422
+    assert client.bytes_read == 0
@@ -17,10 +17,10 @@ def configure_tensorflow_for_cloud_run():
         os.environ['TF_ENABLE_ONEDNN_OPTS'] = '0'  # Desabilitar otimizações oneAPI
         os.environ['TF_FORCE_GPU_ALLOW_GROWTH'] = 'true'
         
-        # Configurações para CPU
-        os.environ['OMP_NUM_THREADS'] = '2'  # Limitar threads OpenMP
-        os.environ['TF_NUM_INTEROP_THREADS'] = '2'
-        os.environ['TF_NUM_INTRAOP_THREADS'] = '2'
+        # Configurações para CPU (o launcher pre-fork sobrescreve via ambiente)
+        os.environ.setdefault('OMP_NUM_THREADS', '2')  # Limitar threads OpenMP
+        inter_op_threads = int(os.environ.setdefault('TF_NUM_INTEROP_THREADS', '2'))
+        intra_op_threads = int(os.environ.setdefault('TF_NUM_INTRAOP_THREADS', '2'))
         
         # Configurações de memória
         os.environ['TF_GPU_ALLOCATOR'] = 'cuda_malloc_async'
@@ -29,8 +29,8 @@ def configure_tensorflow_for_cloud_run():
         import tensorflow as tf
         
         # Configurar threading
-        tf.config.threading.set_inter_op_parallelism_threads(2)
-        tf.config.threading.set_intra_op_parallelism_threads(2)
+        tf.config.threading.set_inter_op_parallelism_threads(inter_op_threads)
+        tf.config.threading.set_intra_op_parallelism_threads(intra_op_threads)
         
         # Configurar GPU se disponível (improvável no Cloud Run, mas por segurança)
         gpus = tf.config.experimental.list_physical_devices('GPU')
@@ -48,7 +48,8 @@ def configure_tensorflow_for_cloud_run():
             logger.info(f"Found {len(cpus)} CPU(s)")
         
         # Configurações de otimização
-        tf.config.optimizer.set_jit(True)  # Habilitar XLA JIT
+        if os.environ.get('TF_XLA_JIT', 'true').lower() == 'true':
+            tf.config.optimizer.set_jit(True)  # Habilitar XLA JIT
         
         logger.info("TensorFlow configured for Cloud Run")
         return True
@@ -78,6 +79,32 @@ def get_tensorflow_info():
         logger.error(f"Failed to get TensorFlow info: {e}")
         return {"error": str(e)}
 
+def get_tensorflow_memory(model=None):
+    """
+    Retorna a memória usada pelo TensorFlow em bytes: pesos do modelo e
+    alocador de cada GPU (uso atual e pico; sem GPU, ``devices`` fica vazio)
+    """
+    try:
+        import numpy as np
+        import tensorflow as tf
+        
+        weights_bytes = 0
+        if model is not None:
+            for weight in model.weights:
+                dtype = np.dtype(getattr(weight.dtype, "name", weight.dtype))
+                weights_bytes += int(np.prod(weight.shape)) * dtype.itemsize
+        
+        devices = {}
+        for device in tf.config.list_logical_devices("GPU"):
+            memory = tf.config.experimental.get_memory_info(device.name)
+            devices[device.name] = {"current": memory["current"], "peak": memory["peak"]}
+        
+        return {"model_weights_bytes": weights_bytes, "devices": devices}
+        
+    except Exception as e:
+        logger.debug(f"Failed to get TensorFlow memory: {e}")
+        return {"model_weights_bytes": 0, "devices": {}}
+
 def optimize_model_for_inference(model):
     """
     Otimiza modelo para inferência